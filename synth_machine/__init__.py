@@ -1,3 +1,22 @@
-from synth_machine.machine import Synth, Tool, RAG
+__all__ = ["Synth", "SynthFactory", "SynthRunner", "Tool", "RAG", "warmup"]
 
-__all__ = ["Synth", "Tool", "RAG"]
+
+def __getattr__(name: str):
+    # Deferred so importing the package stays cheap until the engine is used.
+    if name in ("Synth", "Tool", "RAG"):
+        from synth_machine import machine
+
+        return getattr(machine, name)
+    if name == "SynthFactory":
+        from synth_machine.factory import SynthFactory
+
+        return SynthFactory
+    if name == "SynthRunner":
+        from synth_machine.scheduler import SynthRunner
+
+        return SynthRunner
+    if name == "warmup":
+        from synth_machine.warmup import warmup
+
+        return warmup
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
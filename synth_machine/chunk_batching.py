@@ -0,0 +1,53 @@
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class ChunkBatching:
+    """
+    Send streamed tokens as one `CHUNK` event once any limit is reached.
+    Limits are checked as tokens arrive, and a batch never mixes input and
+    output tokens.
+    """
+
+    max_bytes: int = 1024
+    max_tokens: int = 64
+    max_interval_ms: float = 50
+
+
+class ChunkBuffer:
+    def __init__(self, policy: ChunkBatching) -> None:
+        self.policy = policy
+        self.text: List[str] = []
+        self.bytes = 0
+        self.tokens = 0
+        self.stage: Optional[str] = None
+        self.started = 0.0
+
+    def __bool__(self) -> bool:
+        return self.stage is not None
+
+    def add(self, token: str, stage: str, tokens_used: Optional[int]) -> bool:
+        """
+        Buffer a token, returns whether the batch should be sent.
+        """
+        if self.stage is None:
+            self.stage = stage
+            self.started = time.monotonic()
+        self.text.append(token)
+        self.bytes += len(token.encode())
+        self.tokens += tokens_used or 0
+        return (
+            self.bytes >= self.policy.max_bytes
+            or len(self.text) >= self.policy.max_tokens
+            or (time.monotonic() - self.started) * 1000 >= self.policy.max_interval_ms
+        )
+
+    def flush(self) -> Tuple[str, str, int]:
+        batch = ("".join(self.text), self.stage, self.tokens)
+        self.text = []
+        self.bytes = 0
+        self.tokens = 0
+        self.stage = None
+        return batch  # type: ignore
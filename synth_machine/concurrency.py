@@ -0,0 +1,164 @@
+import asyncio
+import weakref
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, Sequence, Tuple
+
+
+_DONE = object()
+STREAM_COMPLETED = object()
+
+
+class _StreamError:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+async def merge_streams(
+    streams: Sequence[Callable[[], AsyncIterator]],
+    max_concurrency: int,
+    dependencies: Optional[Sequence[Iterable[int]]] = None,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Run async event streams concurrently and yield `(index, event)` pairs as
+    events arrive. At most `max_concurrency` streams run at once and they are
+    started in order. Closing the merged stream cancels any running streams,
+    an exception in any stream is re-raised here.
+
+    With `dependencies`, stream `i` only starts once every stream in
+    `dependencies[i]` has completed. `(index, STREAM_COMPLETED)` is yielded
+    when a stream finishes, and its dependents are released when the consumer
+    asks for the next event.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    completed = [asyncio.Event() for _ in streams]
+
+    async def pump(index: int, stream: Callable[[], AsyncIterator]) -> None:
+        try:
+            if dependencies is not None:
+                for dependency in dependencies[index]:
+                    await completed[dependency].wait()
+            async with semaphore:
+                async with aclosing(stream()) as events:  # type: ignore
+                    async for event in events:
+                        queue.put_nowait((index, event))
+        except Exception as e:
+            queue.put_nowait((index, _StreamError(e)))
+        finally:
+            queue.put_nowait((index, _DONE))
+
+    tasks = [
+        asyncio.create_task(pump(index, stream)) for index, stream in enumerate(streams)
+    ]
+    try:
+        running = len(tasks)
+        while running:
+            index, event = await queue.get()
+            if event is _DONE:
+                running -= 1
+                if dependencies is not None:
+                    yield index, STREAM_COMPLETED
+                completed[index].set()
+            elif isinstance(event, _StreamError):
+                raise event.error
+            else:
+                yield index, event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class _Flight:
+    """
+    One upstream stream, buffered so subscribers joining late still see every
+    item from the start.
+    """
+
+    def __init__(self, stream: AsyncIterator, on_done: Callable[[], None]) -> None:
+        self.items: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._updated = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream: AsyncIterator) -> None:
+        try:
+            async with aclosing(stream):  # type: ignore
+                async for item in stream:
+                    self.items.append(item)
+                    self._notify()
+        except asyncio.CancelledError as e:
+            # Anyone still subscribed sees the stream was stopped, rather
+            # than a generation cut short.
+            self.error = e
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_done()
+            self._notify()
+
+    def _notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def subscribe(self) -> AsyncIterator:
+        # Counted from now rather than from the first item read, so the stream
+        # isn't stopped while a subscriber has yet to start reading.
+        self.subscribers += 1
+        return self._read()
+
+    async def _read(self) -> AsyncIterator:
+        index = 0
+        try:
+            while True:
+                while index < len(self.items):
+                    yield self.items[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._updated.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                # Every subscriber went away, stop the upstream stream.
+                self._on_done()
+                self._task.cancel()
+
+
+class StreamCoalescer:
+    """
+    Share one stream between concurrent identical requests.
+
+    `stream(key, start)` joins the in flight stream for `key`, or starts one
+    with `start()`. Items are fanned out to every subscriber as they arrive.
+    Once a stream completes the next request for its key starts a new one.
+    """
+
+    def __init__(self) -> None:
+        # Streams and events belong to the event loop they were started on.
+        self._flights: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.started = 0
+        self.joined = 0
+
+    def stream(self, key: str, start: Callable[[], AsyncIterator]) -> AsyncIterator:
+        flights = self._flights.setdefault(asyncio.get_running_loop(), {})
+        flight = flights.get(key)
+        if flight is None:
+
+            def on_done() -> None:
+                if flights.get(key) is flight:
+                    del flights[key]
+
+            flight = _Flight(start(), on_done=on_done)
+            flights[key] = flight
+            self.started += 1
+        else:
+            self.joined += 1
+        return flight.subscribe()
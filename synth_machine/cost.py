@@ -1,10 +1,57 @@
+from typing import Dict, List, Optional, Tuple
+
 from synth_machine.operator_setup import SynthConfig, ToolConfig
+from synth_machine.usage_ledger import UsageLedger
+
+
+class UsageBatch:
+    """
+    Chunk token counts per stage, reported together once `max_tokens` have
+    been streamed, or at the end of the stream when 0.
+    """
+
+    def __init__(self, max_tokens: int = 0) -> None:
+        self.max_tokens = max_tokens
+        self.tokens: Dict[str, int] = {}
+        self.chunks: Dict[str, int] = {}
+        self.total = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.chunks)
+
+    def add(self, stage: str, num_tokens: Optional[int]) -> bool:
+        """
+        Count a chunk, returns whether the batch should be reported.
+        """
+        self.tokens[stage] = self.tokens.get(stage, 0) + (num_tokens or 0)
+        self.chunks[stage] = self.chunks.get(stage, 0) + 1
+        self.total += num_tokens or 0
+        return 0 < self.max_tokens <= self.total
+
+    def flush(self) -> List[Tuple[str, int, int]]:
+        batch = [
+            (stage, num_tokens, self.chunks[stage])
+            for stage, num_tokens in self.tokens.items()
+        ]
+        self.tokens = {}
+        self.chunks = {}
+        self.total = 0
+        return batch
 
 
 class BaseCost:
+    # Report chunk costs with `record_usage_batch` every N tokens, or once per
+    # stream when 0, rather than `calculate_chunk_cost` for every chunk.
+    usage_batch_tokens: Optional[int] = None
+    usage_ledger: Optional[UsageLedger] = None
+
     async def record_tool_token_usage(
         self, user: str, session_id: str, tool_config: ToolConfig, num_tokens: float
     ) -> float:
+        if self.usage_ledger is not None:
+            self.usage_ledger.record(
+                user, session_id, "tool", tool_config.tool_id, input_tokens=num_tokens
+            )
         return num_tokens
 
     async def record_prompt_token_usage(
@@ -15,8 +62,42 @@ class BaseCost:
         input_tokens: int = 0,
         output_tokens: int = 0,
     ) -> int:
+        if self.usage_ledger is not None:
+            self.usage_ledger.record(
+                user,
+                session_id,
+                "prompt",
+                synth_config.model_config.llm_name
+                or str(synth_config.model_config.executor),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+            )
         return input_tokens + output_tokens
 
+    async def record_cached_token_usage(
+        self,
+        user: str,
+        session_id: str,
+        synth_config: SynthConfig,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+    ) -> int:
+        """
+        Called instead of `record_prompt_token_usage` when a generation is
+        replayed from the response cache, no provider tokens were spent.
+        """
+        if self.usage_ledger is not None:
+            self.usage_ledger.record(
+                user,
+                session_id,
+                "cached",
+                synth_config.model_config.llm_name
+                or str(synth_config.model_config.executor),
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+            )
+        return 0
+
     async def calculate_chunk_cost(
         self,
         stage: str,
@@ -24,3 +105,15 @@ class BaseCost:
         num_tokens: int,
     ) -> int:
         return num_tokens
+
+    async def record_usage_batch(
+        self,
+        stage: str,
+        synth_config: SynthConfig,
+        num_tokens: int,
+        chunks: int,
+    ) -> int:
+        """
+        Cost of `chunks` streamed chunks of a stage, `num_tokens` in total.
+        """
+        return await self.calculate_chunk_cost(stage, synth_config, num_tokens)
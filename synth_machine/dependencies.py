@@ -0,0 +1,118 @@
+from typing import List, Optional, Sequence
+from jinja2 import Environment, TemplateSyntaxError, meta
+
+from synth_machine.post_process import jq_memory_keys
+from synth_machine.synth_definition import Output
+
+
+_environment = Environment()
+
+
+def template_variables(template: Optional[str]) -> Optional[set]:
+    if not template:
+        return set()
+    try:
+        return set(meta.find_undeclared_variables(_environment.parse(template)))
+    except TemplateSyntaxError:
+        return None
+
+
+def output_reads(output_definition: Output) -> Optional[set]:
+    """
+    Memory keys an output may read, or None when it may read any key.
+    """
+    if output_definition.udf:
+        return None
+    reads = set()
+    templates: List[Optional[str]] = [
+        output_definition.prompt,
+        output_definition.system_prompt,
+        output_definition.jinja,
+        output_definition.rag,
+    ]
+    for value in (output_definition.input_name_map or {}).values():
+        reads.add(value)
+        templates.append(value)
+    for template in templates:
+        variables = template_variables(template)
+        if variables is None:
+            return None
+        reads |= variables
+
+    if output_definition.loop:
+        for matrix in output_definition.loop.matrix:
+            for loop_var in matrix.keys():
+                reads.discard(loop_var)
+        for matrix in output_definition.loop.matrix:
+            for memory_key_looped in matrix.values():
+                if isinstance(memory_key_looped, str):
+                    reads.add(memory_key_looped)
+
+    reads.update(output_definition.append or [])
+    reads.update(
+        key for key in output_definition.interleave or [] if isinstance(key, str)
+    )
+    if output_definition.jq:
+        jq_reads = jq_memory_keys(output_definition.jq)
+        if jq_reads is None:
+            return None
+        reads |= jq_reads
+    if output_definition.reset:
+        reads.add(output_definition.key)
+    return reads
+
+
+def output_writes(output_definition: Output) -> Optional[set]:
+    """
+    Memory keys an output may write, or None when it may write any key.
+    """
+    if output_definition.udf:
+        return None
+    return {output_definition.key}
+
+
+def _overlaps(first: Optional[set], second: Optional[set]) -> bool:
+    if first is None:
+        return second is None or bool(second)
+    if second is None:
+        return bool(first)
+    return not first.isdisjoint(second)
+
+
+def output_dependencies(outputs: Sequence[Output]) -> List[frozenset]:
+    """
+    For each output, the indexes of earlier outputs it must wait for so that
+    running independent outputs concurrently leaves memory exactly as running
+    them in declaration order would.
+    """
+    reads = [output_reads(output_definition) for output_definition in outputs]
+    writes = [output_writes(output_definition) for output_definition in outputs]
+
+    # jq outputs are re-evaluated after every output, so an output changing a
+    # key a jq expression reads also changes that jq output.
+    jq_outputs = [
+        (output_definition.key, jq_memory_keys(output_definition.jq))
+        for output_definition in outputs
+        if output_definition.jq
+    ]
+    changed = True
+    while changed:
+        changed = False
+        for written in writes:
+            if written is None:
+                continue
+            for jq_key, jq_reads in jq_outputs:
+                if jq_key not in written and _overlaps(written, jq_reads):
+                    written.add(jq_key)
+                    changed = True
+
+    return [
+        frozenset(
+            earlier
+            for earlier in range(index)
+            if _overlaps(writes[earlier], reads[index])
+            or _overlaps(reads[earlier], writes[index])
+            or _overlaps(writes[earlier], writes[index])
+        )
+        for index in range(len(outputs))
+    ]
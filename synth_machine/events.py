@@ -0,0 +1,231 @@
+import json
+from operator import itemgetter
+import os
+from typing import Any, Iterable, Optional
+
+from pydantic import BaseModel
+
+from synth_machine.operation_definitions import (
+    FailureState,
+    YieldTasks,
+)
+
+# "json", "orjson" or "msgpack", how `encode_event` writes events for clients.
+EVENT_ENCODER = os.environ.get("EVENT_ENCODER", "json")
+
+
+class Event(list):
+    """
+    An event from `streaming_trigger`.
+
+    Events are the lists `[kind, *fields]` they have always been, with the
+    loop index last for items of a concurrent loop, and add named access to
+    their fields.
+    """
+
+    __slots__ = ()
+    # Fields, including the kind, before any loop index.
+    size = 2
+    kind = property(itemgetter(0))
+
+    def fields_size(self) -> int:
+        return self.size
+
+    @property
+    def loop_index(self) -> Optional[int]:
+        return self[-1] if len(self) > self.fields_size() else None
+
+    def tagged(self, loop_index: int) -> "Event":
+        self.append(loop_index)
+        return self
+
+    def as_list(self) -> list:
+        return list(self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list.__repr__(self)})"
+
+
+class KeyEvent(Event):
+    """
+    `SET_ACTIVE_OUTPUT`, `CACHE_HIT`, `CACHE_MISS`,
+    `OUTPUT_VALIDATION_SUCCEEDED` and `OUTPUT_COMPLETED` for an output.
+    """
+
+    __slots__ = ()
+    key = property(itemgetter(1))
+
+    def __init__(self, kind: str, key: str) -> None:
+        list.__init__(self, (kind, key))
+
+
+class ChunkEvent(Event):
+    __slots__ = ()
+    size = 7
+    key = property(itemgetter(1))
+    token = property(itemgetter(2))
+    cost = property(itemgetter(3))
+    tokens = property(itemgetter(4))
+    stage = property(itemgetter(5))
+    llm_name = property(itemgetter(6))
+
+    def __init__(
+        self,
+        key: str,
+        token: str,
+        cost: Optional[float],
+        tokens: Optional[int],
+        stage: str,
+        llm_name: Optional[str],
+    ) -> None:
+        list.__init__(
+            self, (str(YieldTasks.CHUNK), key, token, cost, tokens, stage, llm_name)
+        )
+
+
+class UsageEvent(Event):
+    __slots__ = ()
+    size = 6
+    key = property(itemgetter(1))
+    cost = property(itemgetter(2))
+    tokens = property(itemgetter(3))
+    stage = property(itemgetter(4))
+    llm_name = property(itemgetter(5))
+
+    def __init__(
+        self,
+        key: str,
+        cost: float,
+        tokens: int,
+        stage: str,
+        llm_name: Optional[str],
+    ) -> None:
+        list.__init__(self, (YieldTasks.USAGE, key, cost, tokens, stage, llm_name))
+
+
+class ValueEvent(Event):
+    """
+    `SET_MEMORY`, `SET_MEMORY_PATCH`, `MODEL_CONFIG`, `UDF_TIMING` and `jq`
+    events, a value for an output key.
+    """
+
+    __slots__ = ()
+    size = 3
+    key = property(itemgetter(1))
+    value = property(itemgetter(2))
+
+    def __init__(self, kind: str, key: str, value: Any) -> None:
+        list.__init__(self, (kind, key, value))
+
+
+class ToolOutputEvent(Event):
+    __slots__ = ()
+    size = 4
+    key = property(itemgetter(1))
+    cost = property(itemgetter(2))
+    tool_id = property(itemgetter(3))
+
+    def __init__(self, key: str, cost: float, tool_id: str) -> None:
+        list.__init__(self, ("TOOL_OUTPUT", key, cost, tool_id))
+
+
+class InputsEvent(Event):
+    __slots__ = ()
+    inputs = property(itemgetter(1))
+
+    def __init__(self, inputs: dict) -> None:
+        list.__init__(self, ("INPUTS", inputs))
+
+
+class TransitionCompletedEvent(Event):
+    __slots__ = ()
+    trigger = property(itemgetter(1))
+
+    def __init__(self, trigger: str) -> None:
+        list.__init__(self, ("TRANSITION_COMPLETED", trigger))
+
+
+class MachineUpdateEvent(Event):
+    """
+    `MACHINE_UPDATE` with the whole memory, or `MACHINE_UPDATE_PATCH` with
+    memory patch operations.
+    """
+
+    __slots__ = ()
+    size = 5
+    interfaces = property(itemgetter(1))
+    memory = property(itemgetter(2))
+    state = property(itemgetter(3))
+    trigger = property(itemgetter(4))
+
+    def __init__(
+        self, kind: str, interfaces: list, memory: Any, state: str, trigger: str
+    ) -> None:
+        list.__init__(self, (kind, interfaces, memory, state, trigger))
+
+
+class FailureEvent(Event):
+    """
+    A `FailureState`, execution stops after it. `OUTPUT_VALIDATION_FAILED`
+    has no message.
+    """
+
+    __slots__ = ()
+    key = property(itemgetter(1))
+
+    def __init__(self, kind: str, key: str, message: Optional[str] = None) -> None:
+        if kind == FailureState.OUTPUT_VALIDATION_FAILED:
+            list.__init__(self, (kind, key))
+        else:
+            list.__init__(self, (kind, key, message))
+
+    def fields_size(self) -> int:
+        return 2 if self[0] == FailureState.OUTPUT_VALIDATION_FAILED else 3
+
+    @property
+    def message(self) -> Optional[str]:
+        return self[2] if self.fields_size() == 3 else None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def encode_event(event: list, encoder: str = EVENT_ENCODER) -> bytes:
+    """
+    An event as a compact list, a JSON line or a msgpack message.
+    """
+    match encoder:
+        case "json":
+            return (
+                json.dumps(event, separators=(",", ":"), default=_default).encode()
+                + b"\n"
+            )
+        case "orjson":
+            try:
+                import orjson
+            except ModuleNotFoundError:
+                raise ModuleNotFoundError(
+                    "Please install synth_machine with extra 'orjson'"
+                )
+            return orjson.dumps(
+                event, default=_default, option=orjson.OPT_APPEND_NEWLINE
+            )
+        case "msgpack":
+            try:
+                import msgpack  # type: ignore
+            except ModuleNotFoundError:
+                raise ModuleNotFoundError(
+                    "Please install synth_machine with extra 'msgpack'"
+                )
+            return msgpack.packb(event, default=_default)
+        case _:
+            raise ValueError(f"Unknown event encoder: {encoder}")
+
+
+def encode_events(events: Iterable[list], encoder: str = EVENT_ENCODER) -> bytes:
+    return b"".join(encode_event(event, encoder) for event in events)
@@ -1,34 +1,62 @@
-from synth_machine.executors.base import BaseExecutor
-from synth_machine.executors.lorem import LoremExecutor
-from typing import Dict
+import importlib
 import os
+import threading
+from typing import Dict, List
 
+from synth_machine.executors.base import BaseExecutor
 
-EXECUTORS: Dict[str, BaseExecutor] = {"lorem": LoremExecutor()}
-if "OPENAI_API_KEY" in os.environ.keys():
-    try:
-        from synth_machine.executors.openai import OpenAIExecutor
 
-        EXECUTORS["openai"] = OpenAIExecutor()
-    except ModuleNotFoundError:
-        raise ModuleNotFoundError("Please install synth_machine with extra 'openai'")
-if "ANTHROPIC_API_KEY" in os.environ.keys():
-    try:
-        from synth_machine.executors.anthropic import AnthropicExecutor
+# name: (API key environment variable, module, class, package extra)
+EXECUTOR_CLASSES = {
+    "lorem": (None, "synth_machine.executors.lorem", "LoremExecutor", None),
+    "openai": (
+        "OPENAI_API_KEY",
+        "synth_machine.executors.openai",
+        "OpenAIExecutor",
+        "openai",
+    ),
+    "anthropic": (
+        "ANTHROPIC_API_KEY",
+        "synth_machine.executors.anthropic",
+        "AnthropicExecutor",
+        "anthropic",
+    ),
+    "togetherai": (
+        "TOGETHER_API_KEY",
+        "synth_machine.executors.togetherai",
+        "TogetherAIExecutor",
+        "togetherai",
+    ),
+}
 
-        EXECUTORS["anthropic"] = AnthropicExecutor()
-    except ModuleNotFoundError:
-        raise ModuleNotFoundError("Please install synth_machine with extra 'anthropic'")
-if "TOGETHER_API_KEY" in os.environ.keys():
-    try:
-        from synth_machine.executors.togetherai import TogetherAIExecutor
+# Executors are created on first use, importing a provider SDK and creating
+# its client is slow.
+EXECUTORS: Dict[str, BaseExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def available_executors() -> List[str]:
+    return [
+        name
+        for name, (api_key, _, _, _) in EXECUTOR_CLASSES.items()
+        if api_key is None or api_key in os.environ.keys()
+    ]
 
-        EXECUTORS["togetherai"] = TogetherAIExecutor()
+
+def _create_executor(name: str) -> BaseExecutor:
+    if name not in available_executors():
+        raise KeyError(name)
+    _, module_name, class_name, extra = EXECUTOR_CLASSES[name]
+    try:
+        module = importlib.import_module(module_name)
     except ModuleNotFoundError:
-        raise ModuleNotFoundError(
-            "Please install synth_machine with extra 'togetherai'"
-        )
+        raise ModuleNotFoundError(f"Please install synth_machine with extra '{extra}'")
+    return getattr(module, class_name)()
 
 
 def get_executor(name: str) -> BaseExecutor:
+    if name not in EXECUTORS:
+        with _executors_lock:
+            if name not in EXECUTORS:
+                EXECUTORS[name] = _create_executor(name)
     return EXECUTORS[name]
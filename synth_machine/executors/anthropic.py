@@ -1,11 +1,13 @@
 import logging
+from functools import cached_property
 from typing import AsyncGenerator, Optional
 from synth_machine.executors.base import BaseExecutor, singleton
 from synth_machine.machine_config import (
     ModelConfig,
     calculate_input_tokens,
 )
-from synth_machine.executors import ANTHROPIC_API_KEY, DEBUG
+from synth_machine.executors import ANTHROPIC_API_KEY
+from synth_machine.tracing import stream_trace
 from magika import Magika
 import anthropic
 import json
@@ -18,7 +20,14 @@ import time
 class AnthropicExecutor(BaseExecutor):
     def __init__(self) -> None:
         self.client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)  # type: ignore
-        self.magika = Magika()
+
+    @cached_property
+    def magika(self) -> Magika:
+        # Loads a model, only needed for images without a Content-Type.
+        return Magika()
+
+    def warmup(self) -> None:
+        self.magika
 
     @staticmethod
     def post_process(output: dict) -> dict:
@@ -57,7 +66,7 @@ class AnthropicExecutor(BaseExecutor):
                 image_media_type = response.headers["Content-Type"]
             else:
                 image_media_type = self.magika.identify_bytes(image_bytes).dl.mime_type
-            logging.debug(f"Image Media Type: {image_media_type}")
+            logging.debug("Image Media Type: %s", image_media_type)
             image_data = base64.b64encode(image_bytes).decode("utf-8")
 
             messages = [
@@ -157,14 +166,13 @@ class AnthropicExecutor(BaseExecutor):
                 stop_sequences=model_config.stop,
             )  # type: ignore
 
-            logging.debug(f"Anthropic Response: {response}")
+            logging.debug("Anthropic Response: %s", response)
+            trace = stream_trace("anthropic")
             async for chunk in response:
                 if chunk.type == "content_block_delta":
                     token = chunk.delta.text
-                    if DEBUG:
-                        print(token, end="", flush=True)
-                    else:
-                        logging.debug({"token": token, "end": "", "flush": True})
+                    if trace:
+                        trace.token(token)
                     yield (token, {"tokens": 1, "token_type": "output"})  # type: ignore
-                else:
-                    print()
+                elif trace and chunk.type == "message_stop":
+                    trace.end(chunk.type)
@@ -16,6 +16,10 @@ def singleton(cls):
 
 
 class BaseExecutor:
+    def warmup(self) -> None:
+        # Load anything slow to create that is otherwise loaded on first use.
+        pass
+
     @staticmethod
     def post_process(output: dict) -> dict:
         raise NotImplementedError
@@ -10,7 +10,8 @@ from synth_machine.machine_config import (
     ModelConfig,
     calculate_input_tokens,
 )
-from synth_machine.executors import OPENAI_API_KEY, DEBUG
+from synth_machine.executors import OPENAI_API_KEY
+from synth_machine.tracing import stream_trace
 
 
 @singleton
@@ -85,7 +86,8 @@ class OpenAIExecutor(BaseExecutor):
         input_tokens = calculate_input_tokens(system_prompt, user_prompt)
         yield ("", {"tokens": input_tokens, "token_type": "input"})  # type: ignore
 
-        logging.debug(f"OpenAI Response: {response}")
+        logging.debug("OpenAI Response: %s", response)
+        trace = stream_trace("openai")
         async for chunk in response:
             if not chunk.choices[0].finish_reason:
                 token = (
@@ -93,10 +95,8 @@ class OpenAIExecutor(BaseExecutor):
                     if function_calling
                     else chunk.choices[0].delta.content
                 )
-                if DEBUG:
-                    print(token, end="", flush=True)
-                else:
-                    logging.debug({"token": token, "end": "", "flush": True})
+                if trace:
+                    trace.token(token)
                 yield (token, {"tokens": 1, "token_type": "output"})  # type: ignore
-            else:
-                print()
+            elif trace:
+                trace.end(chunk.choices[0].finish_reason)
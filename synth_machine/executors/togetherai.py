@@ -10,7 +10,8 @@ from synth_machine.machine_config import (
     ModelConfig,
     calculate_input_tokens,
 )
-from synth_machine.executors import TOGETHER_API_KEY, DEBUG
+from synth_machine.executors import TOGETHER_API_KEY
+from synth_machine.tracing import stream_trace
 
 
 @singleton
@@ -102,6 +103,7 @@ class TogetherAIExecutor(BaseExecutor):
         )  # type: ignore
 
         logging.debug("TogetherAI Response:")
+        trace = stream_trace("togetherai")
         async for chunk in response:
             choice = chunk.choices[0]
             if not choice.finish_reason:
@@ -109,10 +111,8 @@ class TogetherAIExecutor(BaseExecutor):
                     token = choice.text
                 else:
                     token = choice.delta.content
-                if DEBUG:
-                    print(token, end="", flush=True)
-                else:
-                    logging.debug({"token": token, "end": "", "flush": True})
+                if trace:
+                    trace.token(token)
                 yield (token, {"tokens": 1, "token_type": "output"})  # type: ignore
-            else:
-                print()
+            elif trace:
+                trace.end(choice.finish_reason)
@@ -0,0 +1,50 @@
+import uuid
+from typing import Optional, Type
+
+from synth_machine.machine import Synth
+from synth_machine.synth_plan import synth_plan_setup
+
+
+class SynthFactory:
+    """
+    Validates and compiles a synth definition once and creates sessions from
+    it. Sessions share the immutable plan and any options given here, and only
+    hold their own memory, user, session id and state.
+
+    Sessions track their state with the plan's shared state table unless
+    `compact_state_machine=False` is given.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        synth_class: Type[Synth] = Synth,
+        prewarm_templates: bool = False,
+        **synth_options,
+    ) -> None:
+        self.plan = synth_plan_setup(config, prewarm=prewarm_templates)
+        self.synth_class = synth_class
+        self.synth_options = {"compact_state_machine": True} | synth_options
+
+    def create(
+        self,
+        memory: dict = {},
+        user: Optional[str] = None,
+        session_id: Optional[str] = None,
+        state: Optional[str] = None,
+        **synth_options,
+    ) -> Synth:
+        synth = self.synth_class(
+            config=self.plan,
+            memory=memory,
+            user=user or str(uuid.uuid4()),
+            session_id=session_id or str(uuid.uuid4()),
+            **(self.synth_options | synth_options),
+        )
+        if state is not None:
+            if state not in self.plan.states:
+                raise ValueError(
+                    f"{state} is not a valid state name. Must be one of {list(self.plan.states)}"
+                )
+            synth._model.state = state  # type: ignore
+        return synth
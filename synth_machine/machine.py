@@ -1,16 +1,21 @@
-import json
+import bisect
+import copy
 import logging
 import itertools
+import time
 import uuid
+from contextlib import aclosing
+from dataclasses import dataclass
+from functools import partial
 from json.decoder import JSONDecodeError
 from typing import List, Optional
-from jsonschema import validate  # type: ignore
 from jsonschema.exceptions import ValidationError  # type: ignore
 from object_store import ObjectStore
 from transitions import Machine
 
 from synth_machine.synth_parser import SynthParser, ParserOptions
 from synth_machine.operator_setup import (
+    SynthConfig,
     prompt_setup,
     prompt_for_transition,
     tool_setup,
@@ -19,11 +24,32 @@ from synth_machine.operator_setup import (
 from synth_machine.runners import (
     jq_runner,
     tool_runner,
-    STORAGE_PREFIX,
-    STORAGE_OPTIONS,
+    default_store,
 )
-from synth_machine.cost import BaseCost
+from synth_machine.chunk_batching import ChunkBatching, ChunkBuffer
+from synth_machine.concurrency import merge_streams, StreamCoalescer, STREAM_COMPLETED
+from synth_machine.cost import BaseCost, UsageBatch
+from synth_machine.events import (
+    ChunkEvent,
+    FailureEvent,
+    InputsEvent,
+    KeyEvent,
+    MachineUpdateEvent,
+    ToolOutputEvent,
+    TransitionCompletedEvent,
+    UsageEvent,
+    ValueEvent,
+)
+from synth_machine.memory import MemoryPatcher, MemoryStore
+from synth_machine.offload import offload
+from synth_machine.post_process import PostProcessor, PostProcessTask
+from synth_machine.machine_config import calculate_input_tokens
+from synth_machine.rate_limit import get_rate_limiter
+from synth_machine.response_cache import ResponseCache, replay, response_cache_key
+from synth_machine.tool_client import ToolClient
 from synth_machine.tools import Tool
+from synth_machine.usage_ledger import UsageLedger
+from synth_machine.user_defined_functions import run_udf
 from synth_machine.operation_definitions import (
     YieldTasks,
     FailureState,
@@ -33,9 +59,12 @@ from synth_machine.operation_definitions import (
 from synth_machine.synth_definition import (
     Output,
     Input,
+    Loop,
     Transition,
-    synth_definition_setup,
 )
+from synth_machine.state_machine import CompactStateMachine
+from synth_machine.synth_plan import SynthPlan, synth_plan_setup
+from synth_machine.validation import JSONSCHEMA_PRELUDE
 from synth_machine.rag import RAG
 
 
@@ -47,22 +76,49 @@ class TransitionError(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class TriggerOptions:
+    """
+    Options for one trigger, passed down rather than set on the synth as
+    triggers on the same synth may overlap.
+    """
+
+    chunk_batching: Optional[ChunkBatching] = None
+    # Off for `trigger`, when only the resulting memory is needed.
+    emit_events: bool = True
+
+
 class Synth(BaseCost, SynthParser):
-    JSONSCHEMA_PRELUDE = {"$schema": "http://json-schema.org/draft-04/schema#"}
+    JSONSCHEMA_PRELUDE = JSONSCHEMA_PRELUDE
 
     def __init__(
         self,
-        config: dict,
+        config: dict | SynthPlan,
         memory: dict = {},
-        store: ObjectStore = ObjectStore(STORAGE_PREFIX, STORAGE_OPTIONS),
+        store: Optional[ObjectStore] = None,
         user: str = str(uuid.uuid4()),
         session_id: str = str(uuid.uuid4()),
         tools: List[Tool] = [],
         rag_runner: Optional[RAG] = None,
         user_defined_functions: dict = {},
+        prewarm_templates: bool = False,
+        memory_patches: bool = False,
+        snapshot_interval: int = 0,
+        tool_client: Optional[ToolClient] = None,
+        compact_state_machine: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        coalescer: Optional[StreamCoalescer] = None,
+        chunk_batching: Optional[ChunkBatching] = None,
+        usage_batch_tokens: Optional[int] = None,
+        usage_ledger: Optional[UsageLedger] = None,
     ) -> None:
         super().__init__()
-        self.config = synth_definition_setup(config)
+        if isinstance(config, SynthPlan):
+            # Already validated and compiled, shared with other sessions.
+            self.plan = config
+        else:
+            self.plan = synth_plan_setup(config, prewarm=prewarm_templates)
+        self.config = self.plan.definition
         self.user = user
         self.session_id = session_id
         if user_defined_functions:
@@ -72,31 +128,58 @@ class Synth(BaseCost, SynthParser):
             self.user_defined_functions = user_defined_functions
         else:
             self.user_defined_functions = {}
-        self.transitions = list(
-            map(
-                lambda t: {
-                    "trigger": t.trigger,
-                    "source": t.source,
-                    "dest": t.dest,
-                },
-                self.config.transitions,
-            )
+        self.transitions = self.plan.machine_transitions
+        self.state_names = self.plan.state_names
+        # Sessions share the definition, copy its memory so changes made in
+        # place, e.g. by user defined functions, stay in this session.
+        initial_memory = {
+            key: value
+            for key, value in self.config.initial_memory.items()
+            if key not in memory
+        }
+        self.memory = (
+            copy.deepcopy(initial_memory) | memory if initial_memory else dict(memory)
         )
-        self.state_names = list(map(lambda s: s.name, self.config.states))
-        self.memory: dict = self.config.initial_memory | memory
-        self._model = Model()
         self.default_model_config = self.config.default_model_config
-        self._machine = Machine(
-            auto_transitions=False,
-            initial=self.config.initial_state,
-            model=self._model,
-            states=self.state_names,
-            transitions=self.transitions,
-        )
+        if compact_state_machine:
+            # Same transitions, without building a transitions.Machine per session.
+            self._model = CompactStateMachine(
+                self.plan.state_table, self.config.initial_state
+            )
+            self._machine = None
+        else:
+            self._model = Model()
+            self._machine = Machine(
+                auto_transitions=False,
+                initial=self.config.initial_state,
+                model=self._model,
+                states=self.state_names,
+                transitions=self.transitions,
+            )
         self.buffer = {}
-        self.store = store
+        self._loop_indexes: dict = {}
+        self.store = default_store() if store is None else store
         self.tools = tools
+        self.tool_client = tool_client
+        self.response_cache = response_cache
+        self.coalescer = coalescer
+        self.chunk_batching = chunk_batching
+        self.usage_batch_tokens = usage_batch_tokens
+        self.usage_ledger = usage_ledger
         self.rag_runner = rag_runner
+        self.memory_patcher = (
+            MemoryPatcher(snapshot_interval) if memory_patches else None
+        )
+
+    @property
+    def memory(self) -> MemoryStore:
+        return self._memory
+
+    @memory.setter
+    def memory(self, memory: dict) -> None:
+        self._memory = (
+            memory if isinstance(memory, MemoryStore) else MemoryStore(memory)
+        )
 
     def current_state(self) -> str:
         return self._model.state  # type: ignore
@@ -104,59 +187,162 @@ class Synth(BaseCost, SynthParser):
     def interfaces_for_available_triggers(
         self, state: Optional[str] = None
     ) -> List[Transition]:
-        return [
-            transition
-            for transition in self.config.transitions
-            if transition.trigger
-            in self._machine.get_triggers(state or self.current_state())
-        ]
+        return list(self.plan.interfaces.get(state or self.current_state(), ()))
 
     def get_raw_state(self, state: str):
-        return [s for s in self.config.states if s.name == state][0]
+        return self.plan.states[state]
 
     def machine_update(self, transition, set_active_trigger=False, state=None):
-        return [
-            "MACHINE_UPDATE",
+        snapshot = self.memory.snapshot()
+        patch = self.memory_patcher.update(snapshot) if self.memory_patcher else None
+        return MachineUpdateEvent(
+            "MACHINE_UPDATE" if patch is None else "MACHINE_UPDATE_PATCH",
             self.interfaces_for_available_triggers(state=state or transition.dest),
-            self.memory,
+            snapshot if patch is None else patch,
             self.current_state(),
             transition.trigger if set_active_trigger else "",
-        ]
+        )
+
+    def set_memory_event(self, output_key: str, value):
+        if self.memory_patcher:
+            return ValueEvent(
+                YieldTasks.SET_MEMORY_PATCH,
+                output_key,
+                self.memory_patcher.update_key(self.memory, output_key),
+            )
+        return ValueEvent(YieldTasks.SET_MEMORY, output_key, value)
+
+    def request_snapshot(self) -> None:
+        # With memory patches, send the whole memory with the next update.
+        if self.memory_patcher:
+            self.memory_patcher.request_snapshot()
+
+    def post_process_input(
+        self, task: PostProcessTask, chunk: str = ""
+    ) -> Optional[dict]:
+        output_key = task.key
+        streaming_parser = self.streaming_parse.get(task.definition.parser)
+        try:
+            if streaming_parser:
+                if output_key not in self.buffer:
+                    self.buffer[output_key] = streaming_parser()
+                if chunk:
+                    self.buffer[output_key].feed(chunk)
+                    task.touch(self.buffer[output_key].drain_changes())
+                parsed = self.buffer[output_key].value()
+            else:
+                if chunk:
+                    self.buffer[output_key] = (
+                        f"{self.buffer.get(output_key, '')}{chunk}"
+                    )
+                    task.touch(None)
+                parsed = self.parse.get(
+                    task.definition.parser,
+                    ParserOptions.JSON,
+                )(str(self.buffer.get(output_key, "")))
+            return self.memory | parsed
+        except Exception:
+            return None
 
     async def post_process(
-        self, output_key: str, output_definition: Output, chunk: str
+        self, post_processor: PostProcessor, chunk: str = "", stream_end: bool = False
     ):
-        new_buffer = f"{self.buffer.get(output_key, '')}{chunk}"
-        if new_buffer != self.buffer.get(output_key, ""):
-            self.buffer[output_key] = new_buffer
-            try:
-                result = self.memory | self.parse.get(
-                    output_definition.parser,
-                    ParserOptions.JSON,
-                )(str(self.buffer[output_key]))
-            except Exception:
-                result = self.memory
-        else:
-            result = self.memory
-        operation_list = [
-            operation
-            for operation in PostProcessTasks  # type: ignore
-            if getattr(output_definition, operation, None)
-        ]
-        operation = operation_list[0] if operation_list else None
-        match operation:
-            case PostProcessTasks.JQ:
-                jq_result = jq_runner(
-                    getattr(output_definition, operation),
-                    result,
-                    output_definition.schema_dict,
-                )
-                if jq_result:
-                    self.memory[output_key] = jq_result
-                    yield [PostProcessTasks.JQ, output_key, jq_result]
-                yield []
-            case _:
-                yield []
+        for task in post_processor:
+            if chunk:
+                # Streamed tokens are always parsed, evaluation may be throttled.
+                result = self.post_process_input(task, chunk)
+                task.pending = True
+                task.tokens += 1
+                if task.throttled():
+                    continue
+            elif stream_end:
+                if not task.pending:
+                    continue
+                result = self.post_process_input(task)
+            else:
+                result = None
+            source = "memory" if result is None else "stream"
+            if not task.needs_run(source):
+                continue
+            task.ran(source)
+
+            match task.operation:
+                case PostProcessTasks.JQ:
+                    # Offloaded steps read a snapshot, concurrent outputs keep
+                    # changing memory on the event loop while they run.
+                    data = self.memory.snapshot() if result is None else result
+                    jq_result = await offload(
+                        "jq",
+                        data,
+                        jq_runner,
+                        task.definition.jq,
+                        data,
+                        task.definition.schema_dict,
+                    )
+                    if jq_result:
+                        self.memory[task.key] = jq_result
+                        post_processor.touch([task.key])
+                        yield ValueEvent(
+                            PostProcessTasks.JQ,
+                            task.key,
+                            self.memory.freeze(task.key),
+                        )
+
+    def append_loop_output(
+        self, output_key: str, value, loop_index: Optional[int] = None
+    ) -> None:
+        if loop_index is None:
+            self.memory.mutable(output_key).append(value)
+            return
+        # Concurrent loop items complete out of order, keep results in input order.
+        indexes = self._loop_indexes.setdefault(output_key, [])
+        position = bisect.bisect(indexes, loop_index)
+        indexes.insert(position, loop_index)
+        self.memory.mutable(output_key).insert(position, value)
+
+    def discard_loop_outputs(self, output_key: str, failed_index: int) -> None:
+        # A sequential loop stops at a failing item, drop results of the items
+        # after it that completed first.
+        indexes = self._loop_indexes.get(output_key, [])
+        position = bisect.bisect(indexes, failed_index)
+        if position < len(indexes):
+            del indexes[position:]
+            del self.memory.mutable(output_key)[position:]
+
+    def loop_inputs(self, loop: Loop, inputs: dict):
+        for matrix in loop.matrix:
+            for loop_var, memory_key_looped in matrix.items():
+                if isinstance(memory_key_looped, list):
+                    items = memory_key_looped
+                else:
+                    items = self.memory.get(memory_key_looped, [])
+                for item in items:
+                    yield {
+                        **inputs,
+                        loop_var: item,
+                    }
+
+    def generate(self, llm_config: SynthConfig, schema: Optional[dict]):
+        model_config = llm_config.model_config
+        start = partial(
+            llm_config.executor.generate,
+            user_prompt=llm_config.user_prompt,
+            system_prompt=llm_config.system_prompt,
+            json_schema=schema,
+            model_config=model_config,
+            user=self.user,
+        )
+        limiter = get_rate_limiter(model_config.executor, model_config.llm_name)
+        if limiter is None:
+            return start()
+        tokens = 0
+        if limiter.tokens is not None:
+            tokens = calculate_input_tokens(
+                llm_config.system_prompt,
+                llm_config.user_prompt,
+                model_config.assistant_partial,
+            ) + (model_config.max_tokens or 0)
+        return limiter.stream(start, tokens=tokens)
 
     async def run_task(
         self,
@@ -166,42 +352,48 @@ class Synth(BaseCost, SynthParser):
         output_definition: Output,
         retries: int = 3,
         loop: bool = False,
+        loop_index: Optional[int] = None,
+        options: TriggerOptions = TriggerOptions(),
     ):
-        yield [YieldTasks.SET_ACTIVE_OUTPUT, output_key]
+        yield KeyEvent(YieldTasks.SET_ACTIVE_OUTPUT, output_key)
         schema = output_definition.schema_dict
 
-        # TODO: find a nicer way to ensure tests don't reference the finished memory object out of order
-        yield [
-            YieldTasks.SET_MEMORY,
-            output_key,
-            json.loads(json.dumps(self.memory.get(output_key, {}))),
-        ]
+        if options.emit_events:
+            yield self.set_memory_event(output_key, self.memory.freeze(output_key, {}))
 
         predicted = ""
+        predicted_chunks: List[str] = []
         predicted_json = ""
 
-        operation_list = [
-            operation
-            for operation in OperationPriority  # type: ignore
-            if getattr(output_definition, operation, None)
-        ]
-        operation = operation_list[0] if operation_list else None
+        output_plan = self.plan.output(output_definition)
+        operation = output_plan.operation
         match operation:
             case OperationPriority.UDF:
-                logging.debug(f"Custom user defined function for output: {output_key}")
+                logging.debug("Custom user defined function for output: %s", output_key)
 
                 if output_definition.udf not in self.user_defined_functions.keys():
-                    yield [
+                    yield FailureEvent(
                         FailureState.FAILED,
                         output_key,
                         f"Method: {output_definition.udf} not in registered user defined functions: {self.user_defined_functions.keys()}",
-                    ]
-                self.memory[output_key] = self.user_defined_functions[
-                    output_definition.udf
-                ](self.memory)
+                    )
+                    return
+                start = time.perf_counter()
+                self.memory[output_key], cached = await run_udf(
+                    self.user_defined_functions[output_definition.udf], self.memory
+                )
+                yield ValueEvent(
+                    YieldTasks.UDF_TIMING,
+                    output_key,
+                    {
+                        "udf": output_definition.udf,
+                        "seconds": time.perf_counter() - start,
+                        "cached": cached,
+                    },
+                )
 
             case OperationPriority.RAG:
-                logging.debug(f"RAG retrieval for output: {output_key}")
+                logging.debug("RAG retrieval for output: %s", output_key)
                 match output_definition.operation:
                     # TODO: Add "chunk" and "embed" cases to create dynamic RAG
                     case "query":
@@ -210,31 +402,34 @@ class Synth(BaseCost, SynthParser):
                         )
                         if err or not rag_config:
                             logging.error(f"RAG query setup failure: {err}")
-                            yield [FailureState.FAILED, output_key, err]
+                            yield FailureEvent(FailureState.FAILED, output_key, err)
                             return
 
                         self.memory[output_key] = await self.rag_runner.query(  # type: ignore
                             rag_config["query"], rag_config["config"]
                         )
                     case _:
-                        yield [
+                        yield FailureEvent(
                             FailureState.NOT_IMPLEMENTED,
                             output_key,
                             f"RAG Operation: {output_definition.get('operation')} not implemented yet",
-                        ]
+                        )
             case OperationPriority.JINJA:
-                template, _ = prompt_for_transition(
-                    inputs=inputs, prompt_template=output_definition.jinja
+                template, _ = await offload(
+                    "template",
+                    (inputs, output_definition.jinja),
+                    prompt_for_transition,
+                    inputs=inputs,
+                    prompt_template=output_definition.jinja,
                 )
                 self.memory[output_key] = template
-                yield [
-                    YieldTasks.SET_MEMORY,
-                    output_key,
-                    json.loads(json.dumps(template)),
-                ]
+                if options.emit_events:
+                    yield self.set_memory_event(
+                        output_key, self.memory.freeze(output_key)
+                    )
             case OperationPriority.INTERLEAVE:
                 keys = [
-                    self.memory.get(x)
+                    self.memory.freeze(x)
                     for x in getattr(
                         output_definition, OperationPriority.INTERLEAVE, ""
                     )
@@ -252,11 +447,8 @@ class Synth(BaseCost, SynthParser):
                             temp[str(OperationPriority.INTERLEAVE)] = key
                     output.append(temp)
                 self.memory[output_key] = output
-                yield [
-                    YieldTasks.SET_MEMORY,
-                    output_key,
-                    json.loads(json.dumps(keys)),
-                ]
+                if options.emit_events:
+                    yield self.set_memory_event(output_key, keys)
             case OperationPriority.TOOL:
                 tool_config, err = await tool_setup(
                     tools=self.tools,
@@ -266,120 +458,236 @@ class Synth(BaseCost, SynthParser):
                 )
                 if err or not tool_config:
                     logging.error(err)
-                    yield [FailureState.FAILED, output_key, err]
+                    yield FailureEvent(FailureState.FAILED, output_key, err)
                     return
-                logging.info(f"Tool config: {tool_config}")
+                logging.info("Tool config: %s", tool_config)
                 predicted_json = await tool_runner(
-                    store=self.store, tool_config=tool_config
+                    store=self.store,
+                    tool_config=tool_config,
+                    tool_client=self.tool_client,
                 )
 
                 if not predicted_json:
-                    yield [
+                    yield FailureEvent(
                         FailureState.FAILED,
                         output_key,
                         f"Failed to call tool {tool_config}",
-                    ]
+                    )
 
-                logging.debug(f"Tool output: {predicted_json}")
+                logging.debug("Tool output: %s", predicted_json)
                 if loop:
-                    self.memory[output_key].append(predicted_json)
+                    self.append_loop_output(output_key, predicted_json, loop_index)
                     logging.debug(
-                        f"➕ Tool Appended {output_key}:{self.memory[output_key]}"
+                        "➕ Tool Appended %s:%s", output_key, self.memory[output_key]
                     )
 
                 else:
                     self.memory[output_key] = predicted_json
                     logging.debug(
-                        f"💾 Tool Saved {output_key}:{self.memory[output_key]}"
+                        "💾 Tool Saved %s:%s", output_key, self.memory[output_key]
                     )
 
                 token_cost = tool_config.tokens.execution
                 token_usage = await self.record_tool_token_usage(
                     self.user, self.session_id, tool_config, token_cost
                 )
-                yield [
-                    "TOOL_OUTPUT",
-                    output_key,
-                    token_usage,
-                    tool_config.tool_id,
-                ]
-                yield [
-                    YieldTasks.SET_MEMORY,
-                    output_key,
-                    json.loads(json.dumps(predicted_json)),
-                ]
+                yield ToolOutputEvent(output_key, token_usage, tool_config.tool_id)
+                if options.emit_events:
+                    yield self.set_memory_event(
+                        output_key,
+                        predicted_json if loop else self.memory.freeze(output_key),
+                    )
             case OperationPriority.PROMPT:
                 llm_config, err = await prompt_setup(
                     output_definition=output_definition,
                     inputs=inputs,
-                    default_model_config=self.default_model_config,
-                    transition_model_config=transition.config,  # type: ignore
+                    model_config=output_plan.model_config,
                 )
                 if err or not llm_config:
                     logging.error(err)
-                    yield [FailureState.FAILED, output_key, err]
+                    yield FailureEvent(FailureState.FAILED, output_key, err)
                     return
 
+                request_key = None
+                if output_definition.cache and (
+                    self.response_cache is not None or self.coalescer is not None
+                ):
+                    request_key = response_cache_key(
+                        user_prompt=llm_config.user_prompt,
+                        system_prompt=llm_config.system_prompt,
+                        model_config=llm_config.model_config,
+                        json_schema=schema,
+                    )
+                cache_key = request_key if self.response_cache is not None else None
+                read_cache = True
                 while True:
+                    cached = None
+                    if cache_key:
+                        if read_cache:
+                            cached = await self.response_cache.get(cache_key)  # type: ignore
+                        yield KeyEvent(
+                            YieldTasks.CACHE_MISS
+                            if cached is None
+                            else YieldTasks.CACHE_HIT,
+                            output_key,
+                        )
+                    generated = []
                     executor = {"executor": llm_config.model_config.executor}
-                    yield [YieldTasks.MODEL_CONFIG, output_key, executor]
+                    yield ValueEvent(YieldTasks.MODEL_CONFIG, output_key, executor)
                     logging.debug(
-                        f"🤖 Execution started ({llm_config.model_config.executor})"
+                        "🤖 Execution started (%s)", llm_config.model_config.executor
                     )
                     llm_name = llm_config.model_config.llm_name
                     tokens = {
                         "input": 0,
                         "output": 0,
                     }
-                    async for token, token_info in llm_config.executor.generate(
-                        user_prompt=llm_config.user_prompt,
-                        system_prompt=llm_config.system_prompt,
-                        json_schema=schema,
-                        model_config=llm_config.model_config,
-                        user=self.user,
-                    ):
-                        predicted = f"{predicted}{str(token)}"
-                        stage = token_info.get("token_type", "output")
-                        tokens_used = token_info.get("tokens")
-                        token_cost_per_chunk = await self.calculate_chunk_cost(
-                            stage, llm_config, tokens_used
+                    # Replayed generations cost nothing, their tokens are only
+                    # recorded as cached usage.
+                    billed = cached is None
+                    if cached is not None:
+                        stream = replay(cached)
+                    elif request_key and self.coalescer is not None:
+                        # Concurrent identical requests share one generation,
+                        # each session still records its own token usage.
+                        stream = self.coalescer.stream(
+                            request_key, partial(self.generate, llm_config, schema)
                         )
+                    else:
+                        stream = self.generate(llm_config, schema)
+
+                    usage = (
+                        UsageBatch(self.usage_batch_tokens)
+                        if self.usage_batch_tokens is not None
+                        else None
+                    )
 
-                        tokens[stage] += token_cost_per_chunk
-                        yield [
-                            str(YieldTasks.CHUNK),
+                    async def usage_events() -> list:
+                        events = []
+                        for stage, num_tokens, chunks in usage.flush():  # type: ignore
+                            cost = (
+                                await self.record_usage_batch(
+                                    stage, llm_config, num_tokens, chunks
+                                )
+                                if billed
+                                else 0
+                            )
+                            tokens[stage] += cost
+                            events.append(
+                                UsageEvent(
+                                    output_key, cost, num_tokens, stage, llm_name
+                                )
+                            )
+                        return events
+
+                    async def chunk_event(token, stage, tokens_used) -> list:
+                        if usage is None:
+                            token_cost_per_chunk = (
+                                await self.calculate_chunk_cost(
+                                    stage, llm_config, tokens_used
+                                )
+                                if billed
+                                else 0
+                            )
+                            tokens[stage] += token_cost_per_chunk
+                        else:
+                            # Reported by the next USAGE event.
+                            token_cost_per_chunk = None
+                        return ChunkEvent(
                             output_key,
                             token,
                             token_cost_per_chunk,
                             tokens_used,
                             stage,
                             llm_name,
-                        ]
-                    await self.record_prompt_token_usage(
-                        self.user,
-                        self.session_id,
-                        llm_config,
-                        input_tokens=tokens.get("input", 0),
-                        output_tokens=tokens.get("output", 0),
-                    )  # type: ignore
+                        )
+
+                    batch = (
+                        ChunkBuffer(options.chunk_batching)
+                        if options.chunk_batching and options.emit_events
+                        else None
+                    )
+                    async for token, token_info in stream:
+                        if cache_key and cached is None:
+                            generated.append((str(token), token_info))
+                        predicted_chunks.append(str(token))
+                        stage = token_info.get("token_type", "output")
+                        tokens_used = token_info.get("tokens")
+                        full_usage = usage is not None and usage.add(stage, tokens_used)
+                        if not options.emit_events:
+                            # Only the cost of each chunk is needed.
+                            if usage is None and billed:
+                                tokens[stage] += await self.calculate_chunk_cost(
+                                    stage, llm_config, tokens_used
+                                )
+                        elif batch is None:
+                            yield await chunk_event(token, stage, tokens_used)
+                        else:
+                            if batch and batch.stage != stage:
+                                yield await chunk_event(*batch.flush())
+                            if batch.add(str(token), stage, tokens_used):
+                                yield await chunk_event(*batch.flush())
+                        if full_usage:
+                            for event in await usage_events():
+                                yield event
+                    if batch:
+                        yield await chunk_event(*batch.flush())  # type: ignore
+                    if usage:
+                        for event in await usage_events():
+                            yield event
+                    if billed:
+                        await self.record_prompt_token_usage(
+                            self.user,
+                            self.session_id,
+                            llm_config,
+                            input_tokens=tokens.get("input", 0),
+                            output_tokens=tokens.get("output", 0),
+                        )  # type: ignore
+                    else:
+                        replayed = {"input": 0, "output": 0}
+                        for _, token_info in cached:  # type: ignore
+                            stage = token_info.get("token_type", "output")
+                            replayed[stage] = replayed.get(stage, 0) + (
+                                token_info.get("tokens") or 0
+                            )
+                        await self.record_cached_token_usage(
+                            self.user,
+                            self.session_id,
+                            llm_config,
+                            input_tokens=replayed["input"],
+                            output_tokens=replayed["output"],
+                        )
+                    predicted = "".join(predicted_chunks)
+                    if not options.emit_events and predicted:
+                        # Post-processing reads the generation as one chunk.
+                        yield ChunkEvent(
+                            output_key, predicted, None, None, "output", llm_name
+                        )
                     logging.debug("🤖 Execution complete")
 
-                    logging.debug(f"{predicted.strip()}")
+                    logging.debug("%s", predicted.strip())
 
                     if schema and schema.get("type") == "string":
                         predicted_json = predicted
                     else:
                         try:
-                            parsed_response = self.parse.get(
-                                output_definition.parser,
-                                ParserOptions.JSON,
-                            )(predicted)
+                            parsed_response = await offload(
+                                "parse",
+                                predicted,
+                                self.parse.get(
+                                    output_definition.parser,
+                                    ParserOptions.JSON,
+                                ),
+                                predicted,
+                            )
                             predicted_json = llm_config.executor.post_process(
                                 parsed_response
                             )  # type: ignore
-                            validate(
-                                instance=predicted_json,
-                                schema=self.JSONSCHEMA_PRELUDE | schema,  # type: ignore
+                            await offload(
+                                "validate",
+                                predicted_json,
+                                output_plan.validator.validate,  # type: ignore
+                                predicted_json,
                             )
 
                         except (
@@ -387,32 +695,34 @@ class Synth(BaseCost, SynthParser):
                             JSONDecodeError,
                         ) as e:
                             logging.error(f"❌ Failed validation with {e}")
+                            if cached is not None:
+                                # Stored before a parser or post process change, regenerate.
+                                read_cache = False
                             if retries > 0:
                                 logging.warn(f"🔁 Retrying, {retries} left")
                                 predicted = ""
+                                predicted_chunks = []
                                 predicted_json = ""
                                 retries -= 1
                                 continue
-                            yield [
-                                FailureState.OUTPUT_VALIDATION_FAILED,
-                                output_key,
-                            ]
+                            yield FailureEvent(
+                                FailureState.OUTPUT_VALIDATION_FAILED, output_key
+                            )
                             self._model.state = transition.source  # type: ignore
                             return
                     logging.debug("✅ Validated")
-                    yield [
-                        "OUTPUT_VALIDATION_SUCCEEDED",
-                        output_key,
-                    ]
+                    if cache_key and cached is None:
+                        await self.response_cache.set(cache_key, generated)  # type: ignore
+                    yield KeyEvent("OUTPUT_VALIDATION_SUCCEEDED", output_key)
                     if loop:
-                        self.memory[output_key].append(predicted_json)
+                        self.append_loop_output(output_key, predicted_json, loop_index)
                         logging.debug(
-                            f"➕ LLM Appended {output_key}:{self.memory[output_key]}"
+                            "➕ LLM Appended %s:%s", output_key, self.memory[output_key]
                         )
                     else:
                         self.memory[output_key] = predicted_json
                         logging.debug(
-                            f"💾 LLM Saved {output_key}:{self.memory[output_key]}"
+                            "💾 LLM Saved %s:%s", output_key, self.memory[output_key]
                         )
                     return
             case OperationPriority.APPEND:
@@ -420,15 +730,16 @@ class Synth(BaseCost, SynthParser):
 
                 if self.memory.get(output_key) is None:
                     self.memory[output_key] = []
+                appended = self.memory.mutable(output_key)
                 for memory_key in memory_keys:
-                    item = self.memory.get(memory_key)
+                    # Shared with `memory_key`, copied if that is changed in place.
+                    item = self.memory.freeze(memory_key)
                     if item is not None:
-                        self.memory[output_key].append(item)
-                yield [
-                    YieldTasks.SET_MEMORY,
-                    output_key,
-                    json.loads(json.dumps(self.memory.get(output_key))),
-                ]
+                        appended.append(item)
+                if options.emit_events:
+                    yield self.set_memory_event(
+                        output_key, self.memory.freeze(output_key)
+                    )
             case OperationPriority.RESET:
                 if isinstance(self.memory[output_key], list):
                     self.memory[output_key] = []
@@ -438,7 +749,7 @@ class Synth(BaseCost, SynthParser):
                     self.memory[output_key] = {}
             case _:
                 return  # output is a NOOP
-        yield ["OUTPUT_COMPLETED", output_key]
+        yield KeyEvent("OUTPUT_COMPLETED", output_key)
 
     async def execute_output(
         self,
@@ -446,141 +757,239 @@ class Synth(BaseCost, SynthParser):
         transition,
         output_key,
         output_definition,
-        post_process_tasks,
+        post_processor,
+        options,
         loop=False,
+        loop_index=None,
     ):
-        logging.info(f"Starting output: {transition.trigger}.{output_key}")
+        logging.info("Starting output: %s.%s", transition.trigger, output_key)
         async for event in self.run_task(
             inputs=inputs,
             transition=transition,
             output_key=output_key,
             output_definition=output_definition,
             loop=loop,
+            loop_index=loop_index,
+            options=options,
         ):
-            if event and len(event) > 3 and event[0] in YieldTasks.CHUNK:
-                for (
-                    post_process_key,
-                    post_process_definition,
-                ) in post_process_tasks:
-                    post_process = self.post_process(
-                        output_key=post_process_key,
-                        output_definition=post_process_definition,
-                        chunk=event[2],
-                    )
-                    if post_process:
-                        async for post_process_event in post_process:
-                            yield post_process_event
+            if post_processor and isinstance(event, ChunkEvent):
+                async for post_process_event in self.post_process(
+                    post_processor, chunk=event.token
+                ):
+                    yield post_process_event
             yield event
-        logging.info(f"Complete output: {transition.trigger}.{output_key}")
+        if post_processor:
+            # A user defined function receives the whole memory and may change any key.
+            post_processor.touch(
+                None if output_definition.udf else [output_definition.key]
+            )
+            async for post_process_event in self.post_process(
+                post_processor, stream_end=True
+            ):
+                yield post_process_event
+        logging.info("Complete output: %s.%s", transition.trigger, output_key)
+
+    async def execute_concurrent_loop(
+        self, inputs, transition, output_definition, max_concurrency, options
+    ):
+        output_key = output_definition.key
+        self._loop_indexes[output_key] = []
+
+        def loop_item(loop_index, loop_inputs):
+            async def events():
+                yield InputsEvent(loop_inputs)
+                # Interleaved streams can't share the post-processing buffers,
+                # post-processing runs once the whole loop has completed.
+                async for event in self.execute_output(
+                    inputs=loop_inputs,
+                    transition=transition,
+                    output_key=output_key,
+                    output_definition=output_definition,
+                    post_processor=PostProcessor([]),
+                    options=options,
+                    loop=True,
+                    loop_index=loop_index,
+                ):
+                    yield event
+
+            return events
+
+        loop_items = [
+            loop_item(loop_index, loop_inputs)
+            for loop_index, loop_inputs in enumerate(
+                self.loop_inputs(output_definition.loop, inputs)
+            )
+        ]
+        async with aclosing(merge_streams(loop_items, max_concurrency)) as events:
+            async for loop_index, event in events:
+                # Tag events with their loop index so interleaved items can be told apart.
+                yield event.tagged(loop_index)
+
+    async def execute_transition_output(
+        self, transition, output_definition, post_processor, options
+    ):
+        output_key = output_definition.key
+        # Shared with memory, values changed in place later are copied first.
+        inputs = {
+            input_item.key: self.memory.freeze(input_item.key)
+            for input_item in transition.inputs
+        }
+        loop = output_definition.loop
+        if loop is not None and (loop.max_concurrency or 1) > 1:
+            self.memory[output_key] = []
+            async with aclosing(
+                self.execute_concurrent_loop(
+                    inputs=inputs,
+                    transition=transition,
+                    output_definition=output_definition,
+                    max_concurrency=loop.max_concurrency,
+                    options=options,
+                )
+            ) as events:
+                async for event in events:
+                    if isinstance(event, FailureEvent):
+                        self.discard_loop_outputs(output_key, event.loop_index)
+                        yield event
+                        return
+                    yield event
+            post_processor.touch([output_key])
+        elif loop is not None:
+            self.memory[output_key] = []
+            post_processor.touch([output_key])
+            for loop_inputs in self.loop_inputs(loop, inputs):
+                yield InputsEvent(loop_inputs)
+                async for event in self.execute_output(
+                    inputs=loop_inputs,
+                    transition=transition,
+                    output_key=output_key,
+                    output_definition=output_definition,
+                    post_processor=post_processor,
+                    options=options,
+                    loop=True,
+                ):
+                    yield event
+                    if isinstance(event, FailureEvent):
+                        return
+        else:
+            yield InputsEvent(inputs)
+            async for event in self.execute_output(
+                inputs=inputs,
+                transition=transition,
+                output_key=output_key,
+                output_definition=output_definition,
+                post_processor=post_processor,
+                options=options,
+            ):
+                yield event
+
+    async def execute_outputs(self, transition, post_processor, options):
+        for output_definition in transition.outputs:
+            async for event in self.execute_transition_output(
+                transition, output_definition, post_processor, options
+            ):
+                yield event
+                if isinstance(event, FailureEvent):
+                    return
+            async for post_process_event in self.post_process(post_processor):
+                yield post_process_event
+
+    async def execute_outputs_concurrently(
+        self, transition, post_processor, dependencies, options
+    ):
+        # Outputs wait only for earlier outputs they share memory keys with,
+        # leaving memory as it would be after running them in order.
+        async for post_process_event in self.post_process(post_processor):
+            yield post_process_event
+
+        def output_events(output_definition):
+            # Interleaved streams can't share the post-processing buffers,
+            # post-processing runs as each output completes.
+            return lambda: self.execute_transition_output(
+                transition, output_definition, PostProcessor([]), options
+            )
+
+        async with aclosing(
+            merge_streams(
+                [
+                    output_events(output_definition)
+                    for output_definition in transition.outputs
+                ],
+                transition.max_concurrency,
+                dependencies=dependencies,
+            )
+        ) as events:
+            async for index, event in events:
+                if event is not STREAM_COMPLETED:
+                    yield event
+                    continue
+                output_definition = transition.outputs[index]
+                post_processor.touch(
+                    None if output_definition.udf else [output_definition.key]
+                )
+                async for post_process_event in self.post_process(post_processor):
+                    yield post_process_event
 
-    async def execute_for_trigger(self, initial_trigger):
-        transition = self._transition_for_trigger(initial_trigger)
+    async def execute_for_trigger(
+        self, initial_trigger, options: Optional[TriggerOptions] = None
+    ):
+        if options is None:
+            options = TriggerOptions(chunk_batching=self.chunk_batching)
+        transition_plan = self.plan.transition(initial_trigger)
         # State-level loop, facilitates 'after' on transition
         while True:
+            transition = transition_plan.transition
             # Show interface for the *next* state
-            yield self.machine_update(transition=transition, set_active_trigger=True)
-
-            post_process_tasks = [
-                (output_definition.key, output_definition)
-                for output_definition in transition.outputs
-                for post_processing_task in PostProcessTasks  # type: ignore
-                if getattr(output_definition, post_processing_task, None)
-            ]
-            for output_definition in transition.outputs:
-                output_key = output_definition.key
-                inputs = {
-                    input_item.key: self.memory.get(input_item.key)
-                    for input_item in transition.inputs
-                }
-                loop = output_definition.loop
-                if loop is not None:
-                    self.memory[output_key] = []
-                    for matrix in loop.matrix:
-                        for loop_var, memory_key_looped in matrix.items():
-                            if isinstance(memory_key_looped, list):
-                                loop = memory_key_looped
-                            else:
-                                loop = self.memory.get(memory_key_looped, [])
-                            for item in loop:
-                                loop_inputs = {
-                                    **inputs,
-                                    loop_var: item,
-                                }
-                                yield ["INPUTS", loop_inputs]
-                                async for event in self.execute_output(
-                                    inputs=loop_inputs,
-                                    transition=transition,
-                                    output_key=output_key,
-                                    output_definition=output_definition,
-                                    post_process_tasks=post_process_tasks,
-                                    loop=True,
-                                ):
-                                    yield event
-                                    if (
-                                        event
-                                        and len(event) > 1
-                                        and event[0] in FailureState._member_names_
-                                    ):
-                                        return
-                else:
-                    yield ["INPUTS", inputs]
-                    async for event in self.execute_output(
-                        inputs=inputs,
-                        transition=transition,
-                        output_key=output_key,
-                        output_definition=output_definition,
-                        post_process_tasks=post_process_tasks,
-                    ):
-                        yield event
-                        if (
-                            event
-                            and len(event) > 1
-                            and event[0] in FailureState._member_names_
-                        ):
-                            return
-                for (
-                    post_process_key,
-                    post_process_definition,
-                ) in post_process_tasks:
-                    post_process = self.post_process(
-                        output_key=post_process_key,
-                        output_definition=post_process_definition,
-                        chunk="",
-                    )
-                    if post_process:
-                        async for post_process_event in post_process:
-                            yield post_process_event
+            if options.emit_events:
+                yield self.machine_update(
+                    transition=transition, set_active_trigger=True
+                )
+
+            post_processor = transition_plan.post_processor.copy()
+            if (transition.max_concurrency or 1) > 1 and len(transition.outputs) > 1:
+                outputs = self.execute_outputs_concurrently(
+                    transition, post_processor, transition_plan.dependencies, options
+                )
+            else:
+                outputs = self.execute_outputs(transition, post_processor, options)
+            async with aclosing(outputs) as events:
+                async for event in events:
+                    yield event
+                    if isinstance(event, FailureEvent):
+                        return
 
             self._model.trigger(transition.trigger)  # type: ignore
-            yield ["TRANSITION_COMPLETED", transition.trigger]
+            yield TransitionCompletedEvent(transition.trigger)
 
             if after := transition.after:
                 if "memory_key:" in after:
                     memory_key = after.split(":")[1]
                     if self.memory.get(memory_key):
-                        transition = self._transition_for_trigger(
-                            self.memory[memory_key]
-                        )
+                        transition_plan = self.plan.transition(self.memory[memory_key])
                     else:
                         logging.error(f"❌ Memory key {memory_key} not found")
                 else:
-                    transition = self._transition_for_trigger(after)
+                    transition_plan = self.plan.transition(after)
             else:
                 break
-        yield self.machine_update(transition=transition)
+        if options.emit_events:
+            yield self.machine_update(transition=transition)
 
     def _transition_for_trigger(self, trigger: str):
-        return [
-            transition
-            for transition in self.config.transitions
-            if transition.trigger == trigger
-        ][0]
+        return self.plan.transition(trigger).transition
 
-    async def streaming_trigger(self, trigger: str, params: Optional[dict] = None):
+    async def streaming_trigger(
+        self,
+        trigger: str,
+        params: Optional[dict] = None,
+        chunk_batching: Optional[ChunkBatching] = None,
+    ):
         if params is not None and len(params) > 0:
-            self.memory = self.memory | params
+            self.memory.update(params)
 
-        async for event in self.execute_for_trigger(initial_trigger=trigger):  # type: ignore
+        options = TriggerOptions(chunk_batching=chunk_batching or self.chunk_batching)
+        async for event in self.execute_for_trigger(  # type: ignore
+            initial_trigger=trigger, options=options
+        ):
             yield event
 
     async def trigger(self, trigger: str, params: dict = {}):
@@ -596,9 +1005,12 @@ class Synth(BaseCost, SynthParser):
             )
         transition_outputs = [val.key for val in filtered_transition[0].outputs]  # type: ignore
 
-        async for value in self.streaming_trigger(trigger, params=params):
-            logging.debug(value)
-            if value and value[0] == FailureState.FAILED:
+        if params:
+            self.memory.update(params)
+        # Only memory is returned, skip building events nobody receives.
+        options = TriggerOptions(chunk_batching=self.chunk_batching, emit_events=False)
+        async for value in self.execute_for_trigger(trigger, options=options):
+            if isinstance(value, FailureEvent):
                 logging.error(f"Failure: {value}")
 
         return {output: self.memory[output] for output in transition_outputs}
@@ -1,6 +1,6 @@
+from functools import lru_cache
 from pydantic import BaseModel
 from typing import List, Optional
-import tiktoken
 
 
 class ModelConfig(BaseModel):
@@ -29,7 +29,23 @@ default_model_config = ModelConfig(
     tool_options=[],
 )
 
-enc = tiktoken.get_encoding("cl100k_base")
+
+def merge_model_configs(
+    default: ModelConfig, *overrides: Optional[ModelConfig]
+) -> ModelConfig:
+    merged = default.model_dump()
+    for override in overrides:
+        if override is not None:
+            merged |= override.model_dump(exclude_none=True)
+    return ModelConfig(**merged)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base"):
+    # Loading an encoding reads (or downloads) its BPE ranks, only do it once needed.
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
 
 
 @staticmethod
@@ -38,6 +54,7 @@ def calculate_input_tokens(
     user_prompt: Optional[str],
     assistant_partial: Optional[str] = "",
 ) -> int:
+    enc = get_encoding()
     system_tokens = len(enc.encode(system_prompt)) if system_prompt else 0
     user_tokens = len(enc.encode(user_prompt)) if user_prompt else 0
     assistant_tokens = len(enc.encode(assistant_partial)) if assistant_partial else 0
@@ -0,0 +1,224 @@
+import copy
+from typing import Any, List, Mapping, Optional
+
+
+class MemorySnapshot(dict):
+    """
+    Read-only memory at a given version. Values are shared with the store
+    rather than copied, so they must not be mutated.
+    """
+
+    def __init__(self, memory: dict, version: int) -> None:
+        super().__init__(memory)
+        self.version = version
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Memory snapshots are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # Copies and pickles of a snapshot are plain, mutable dicts.
+        return (dict, (dict(self),))
+
+
+class MemoryStore(dict):
+    """
+    Synth memory with copy-on-write sharing.
+
+    Snapshots and `SET_MEMORY` payloads reference the stored values instead of
+    copying them. Once a value has been handed out it is marked as shared, and
+    code that changes a value in place must get it through `mutable`, which
+    copies a shared value before it is modified. Values assigned with
+    `memory[key] = value` replace the old value and are never copied.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        # Initial values may be shared with the definition or the caller.
+        self._shared: set = set(self)
+        self._snapshot: Optional[MemorySnapshot] = None
+
+    def __reduce__(self):
+        # Pickles of the store, e.g. for other processes, are plain dicts.
+        return (dict, (dict(self),))
+
+    def _changed(self) -> None:
+        self.version += 1
+        self._snapshot = None
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self._shared.discard(key)
+        self._changed()
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self._shared.discard(key)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs) -> None:  # type: ignore
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        had_key = key in self
+        value = super().pop(key, *default)
+        if had_key:
+            self._shared.discard(key)
+            self._changed()
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._shared.discard(key)
+        self._changed()
+        return key, value
+
+    def clear(self) -> None:
+        super().clear()
+        self._shared.clear()
+        self._changed()
+
+    def mutable(self, key) -> Any:
+        """
+        The value for `key`, safe to change in place.
+        """
+        value = self[key]
+        if key in self._shared:
+            value = copy.copy(value)
+            super().__setitem__(key, value)
+            self._shared.discard(key)
+        self._changed()
+        return value
+
+    def freeze(self, key, default=None) -> Any:
+        """
+        The value for `key` without copying it, to include in an event.
+        """
+        if key not in self:
+            return default
+        self._shared.add(key)
+        return self[key]
+
+    def snapshot(self) -> MemorySnapshot:
+        if self._snapshot is None:
+            self._snapshot = MemorySnapshot(self, self.version)
+            self._shared.update(self)
+        return self._snapshot
+
+
+_MISSING = object()
+
+
+def apply_changes(memory: dict, base: Mapping, changed: Mapping) -> None:
+    """
+    Apply the changes made to `changed`, a copy of `base`, to `memory`. Keys
+    the copy left as they were are not written, so concurrent changes to
+    them are kept.
+    """
+    for key in base:
+        if key not in changed and key in memory:
+            del memory[key]
+    for key, value in changed.items():
+        if base.get(key, _MISSING) != value:
+            memory[key] = value
+
+
+def json_pointer(*tokens) -> str:
+    return "".join(
+        "/" + str(token).replace("~", "~0").replace("/", "~1") for token in tokens
+    )
+
+
+def value_patch(key, previous, current) -> List[dict]:
+    """
+    RFC 6902 operations turning `previous` into `current` for one memory key.
+    Values that only grew at the end, like appended lists, become `add`
+    operations for the new items.
+    """
+    if previous is current:
+        return []
+    path = json_pointer(key)
+    if current is _MISSING:
+        return [] if previous is _MISSING else [{"op": "remove", "path": path}]
+    if previous is _MISSING:
+        return [{"op": "add", "path": path, "value": current}]
+    if (
+        isinstance(previous, list)
+        and isinstance(current, list)
+        and len(current) >= len(previous)
+        and all(
+            old is new or old == new
+            for old, new in zip(previous, current[: len(previous)])
+        )
+    ):
+        return [
+            {"op": "add", "path": f"{path}/-", "value": item}
+            for item in current[len(previous) :]
+        ]
+    if previous == current:
+        return []
+    return [{"op": "replace", "path": path, "value": current}]
+
+
+def memory_patch(previous: Mapping, current: Mapping) -> List[dict]:
+    patch = []
+    for key in previous:
+        if key not in current:
+            patch.extend(value_patch(key, previous[key], _MISSING))
+    for key, value in current.items():
+        patch.extend(value_patch(key, previous.get(key, _MISSING), value))
+    return patch
+
+
+class MemoryPatcher:
+    """
+    Tracks the memory a client has been sent, to send only what changed.
+
+    The first update, every `snapshot_interval` updates and the update after
+    `request_snapshot` are sent in full.
+    """
+
+    def __init__(self, snapshot_interval: int = 0) -> None:
+        self.snapshot_interval = snapshot_interval
+        self.updates = 0
+        self._sent: dict = {}
+        self._snapshot_requested = True
+
+    def request_snapshot(self) -> None:
+        self._snapshot_requested = True
+
+    def update(self, snapshot: MemorySnapshot) -> Optional[List[dict]]:
+        """
+        Operations since the last update, or None when the snapshot should be
+        sent in full.
+        """
+        self.updates += 1
+        full = self._snapshot_requested or (
+            self.snapshot_interval > 0 and self.updates % self.snapshot_interval == 0
+        )
+        patch = None if full else memory_patch(self._sent, snapshot)
+        self._sent = dict(snapshot)
+        self._snapshot_requested = False
+        return patch
+
+    def update_key(self, memory: MemoryStore, key) -> List[dict]:
+        current = memory.freeze(key, _MISSING)
+        patch = value_patch(key, self._sent.get(key, _MISSING), current)
+        if current is _MISSING:
+            self._sent.pop(key, None)
+        else:
+            self._sent[key] = current
+        return patch
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+
+# "thread" or "process" to run large CPU bound steps off the event loop,
+# unset to run everything inline.
+OFFLOAD_EXECUTOR = os.environ.get("OFFLOAD_EXECUTOR") or None
+OFFLOAD_WORKERS = int(os.environ.get("OFFLOAD_WORKERS", "0")) or None
+# Steps with inputs at least this size (approximate characters) are offloaded.
+OFFLOAD_MIN_SIZE = int(os.environ.get("OFFLOAD_MIN_SIZE", "100000"))
+# Inline steps blocking the event loop for longer than this are logged.
+OFFLOAD_SLOW_STEP_MS = float(os.environ.get("OFFLOAD_SLOW_STEP_MS", "50"))
+
+
+def approximate_size(value: Any, limit: int = OFFLOAD_MIN_SIZE) -> int:
+    """
+    Characters in strings plus one per item, counted until `limit` is
+    reached so measuring a large input stays cheap.
+    """
+    size = 0
+    stack = [value]
+    while stack and size < limit:
+        item = stack.pop()
+        if isinstance(item, str):
+            size += len(item)
+        elif isinstance(item, dict):
+            size += len(item)
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            size += len(item)
+            stack.extend(item)
+        else:
+            size += 1
+    return size
+
+
+@dataclass
+class StepTiming:
+    calls: int = 0
+    offloaded: int = 0
+    # Time the event loop was blocked running the step inline.
+    blocking_total: float = 0.0
+    blocking_max: float = 0.0
+    # Time offloaded steps took, during which the loop kept running.
+    offloaded_total: float = 0.0
+
+
+class Offloader:
+    """
+    Runs CPU bound steps inline, or in a thread or process pool when their
+    input is large, and times them.
+
+    Steps sent to a process pool, and their arguments, must be picklable.
+    Steps marked `shared_memory` work on live synth memory and always use a
+    thread pool. Passing `executor` runs a step in that pool whatever its
+    size.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[str] = OFFLOAD_EXECUTOR,
+        max_workers: Optional[int] = OFFLOAD_WORKERS,
+        min_size: int = OFFLOAD_MIN_SIZE,
+    ) -> None:
+        if executor not in (None, "thread", "process"):
+            raise ValueError(f"Unknown offload executor: {executor}")
+        self.executor = executor
+        self.max_workers = max_workers
+        self.min_size = min_size
+        self.timings: Dict[str, StepTiming] = {}
+        self._pool: Optional[Executor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+
+    def pool(self, executor: Optional[str]) -> Executor:
+        if executor == "process":
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.max_workers)
+            return self._pool
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix="synth-offload"
+            )
+        return self._threads
+
+    async def run(
+        self,
+        step: str,
+        measure: Any,
+        fn: Callable,
+        *args,
+        shared_memory: bool = False,
+        executor: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        `fn(*args, **kwargs)`, offloaded when `measure`, usually the step's
+        input, is at least `min_size`.
+        """
+        timing = self.timings.setdefault(step, StepTiming())
+        timing.calls += 1
+        start = time.perf_counter()
+        if executor is None and (
+            self.executor is not None
+            and approximate_size(measure, self.min_size) >= self.min_size
+        ):
+            executor = self.executor
+        if executor is not None:
+            timing.offloaded += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.pool("thread" if shared_memory else executor),
+                    partial(fn, *args, **kwargs),
+                )
+            finally:
+                timing.offloaded_total += time.perf_counter() - start
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            blocked = time.perf_counter() - start
+            timing.blocking_total += blocked
+            timing.blocking_max = max(timing.blocking_max, blocked)
+            if blocked * 1000 > OFFLOAD_SLOW_STEP_MS:
+                logging.debug("🐢 %s blocked the event loop for %.3fs", step, blocked)
+
+    def metrics(self) -> dict:
+        return {step: asdict(timing) for step, timing in self.timings.items()}
+
+    def shutdown(self) -> None:
+        for pool in (self._pool, self._threads):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._threads = None
+
+
+_offloader: Optional[Offloader] = None
+
+
+def configure_offload(
+    executor: Optional[str] = OFFLOAD_EXECUTOR,
+    max_workers: Optional[int] = OFFLOAD_WORKERS,
+    min_size: int = OFFLOAD_MIN_SIZE,
+) -> Offloader:
+    global _offloader
+    if _offloader is not None:
+        _offloader.shutdown()
+    _offloader = Offloader(executor, max_workers, min_size)
+    return _offloader
+
+
+def get_offloader() -> Offloader:
+    global _offloader
+    if _offloader is None:
+        _offloader = Offloader()
+    return _offloader
+
+
+async def offload(step: str, measure: Any, fn: Callable, *args, **kwargs):
+    return await get_offloader().run(step, measure, fn, *args, **kwargs)
+
+
+def offload_metrics() -> dict:
+    return get_offloader().metrics()
@@ -6,10 +6,15 @@ except ImportError:
 
 
 class YieldTasks(StrEnum):  # type: ignore
+    CACHE_HIT = "CACHE_HIT"
+    CACHE_MISS = "CACHE_MISS"
     CHUNK = "CHUNK"
     MODEL_CONFIG = "MODEL_CONFIG"
     SET_MEMORY = "SET_MEMORY"
+    SET_MEMORY_PATCH = "SET_MEMORY_PATCH"
     SET_ACTIVE_OUTPUT = "SET_ACTIVE_OUTPUT"
+    UDF_TIMING = "UDF_TIMING"
+    USAGE = "USAGE"
 
 
 class FailureState(StrEnum):  # type: ignore
@@ -2,15 +2,17 @@ import logging
 from dataclasses import dataclass
 from textwrap import dedent
 from typing import Optional, Tuple
-from jinja2 import Template, StrictUndefined
 from synth_machine.executor_factory import get_executor
 from synth_machine.executors.base import BaseExecutor
-from synth_machine.machine_config import ModelConfig
+from synth_machine.machine_config import (
+    ModelConfig,
+    get_encoding,
+    merge_model_configs,
+)
+from synth_machine.offload import offload
 from synth_machine.rag import RAGConfig
 from synth_machine.synth_definition import Output, Input
-import tiktoken
-
-enc = tiktoken.get_encoding("cl100k_base")
+from synth_machine.templates import get_prompt_template, get_tool_template
 
 
 @dataclass
@@ -59,18 +61,19 @@ async def tool_setup(
         key: (
             inputs[value]
             if value in inputs.keys()
-            else Template(value, undefined=StrictUndefined).render(**inputs)
+            else get_tool_template(value).render(**inputs)
         )
         for key, value in output_definition.input_name_map.items()  # type: ignore
     }
 
     if tool.token_multiplier != 0:
+        enc = get_encoding()
         raw_tokens = sum([len(enc.encode(value)) for value in tool_payload.values()])
         tokens_multiplied = raw_tokens * tool.token_multiplier
     else:
         tokens_multiplied = 0
 
-    logging.debug(f"Tool payload: {tool_payload}")
+    logging.debug("Tool payload: %s", tool_payload)
     return (
         ToolConfig(
             tool_id=tool.id,  # type: ignore
@@ -91,12 +94,7 @@ def prompt_for_transition(
 ) -> Tuple[str, Optional[str]]:
     if prompt_template:
         try:
-            prompt = Template(
-                prompt_template,
-                trim_blocks=True,
-                lstrip_blocks=True,
-                undefined=StrictUndefined,
-            ).render(
+            prompt = get_prompt_template(prompt_template).render(
                 **inputs  # type: ignore
             )
         except Exception as e:
@@ -115,7 +113,7 @@ def rag_query_setup(
     )
     if prompt_err:
         return (None, prompt_err)
-    logging.debug(f"""RAG PROMPT: <<<{rag_prompt}>>>""")
+    logging.debug("""RAG PROMPT: <<<%s>>>""", rag_prompt)
 
     rag_config = RAGConfig(
         **(
@@ -130,21 +128,28 @@ def rag_query_setup(
 async def prompt_setup(
     output_definition: Output,
     inputs: dict,
-    default_model_config: ModelConfig,
-    transition_model_config: ModelConfig,
+    default_model_config: Optional[ModelConfig] = None,
+    transition_model_config: Optional[ModelConfig] = None,
+    model_config: Optional[ModelConfig] = None,
 ) -> Tuple[Optional[SynthConfig], Optional[str]]:
     user_prompt_template = output_definition.prompt
-    user_prompt, prompt_err = prompt_for_transition(
+    user_prompt, prompt_err = await offload(
+        "template",
+        (inputs, user_prompt_template),
+        prompt_for_transition,
         inputs=inputs,
         prompt_template=user_prompt_template,
     )
     if prompt_err:
         return (None, prompt_err)
-    logging.debug(f"""User PROMPT: <<<{user_prompt}>>>""")
+    logging.debug("""User PROMPT: <<<%s>>>""", user_prompt)
 
     system_prompt_template = output_definition.system_prompt
     if system_prompt_template:
-        system_prompt, system_err = prompt_for_transition(
+        system_prompt, system_err = await offload(
+            "template",
+            (inputs, system_prompt_template),
+            prompt_for_transition,
             inputs=inputs,
             prompt_template=system_prompt_template,
         )
@@ -152,17 +157,16 @@ async def prompt_setup(
             return (None, system_err)
     else:
         system_prompt = None
-    logging.debug(f"""System PROMPT: <<<{system_prompt}>>>""")
+    logging.debug("""System PROMPT: <<<%s>>>""", system_prompt)
 
-    model_config = ModelConfig(
-        **(
-            default_model_config.model_dump()
-            | transition_model_config.model_dump(exclude_none=True)
-            | output_definition.config.model_dump(exclude_none=True)  # type: ignore
+    if model_config is None:
+        model_config = merge_model_configs(
+            default_model_config or ModelConfig(),
+            transition_model_config,
+            output_definition.config,
         )
-    )
 
-    logging.debug(f"Model config {model_config}")
+    logging.debug("Model config %s", model_config)
     executor = get_executor(name=model_config.executor)  # type: ignore
 
     return (
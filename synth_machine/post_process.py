@@ -0,0 +1,215 @@
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, List, Optional
+from pydantic import BaseModel
+
+from synth_machine.operation_definitions import PostProcessTasks
+
+
+class PostProcessConfig(BaseModel):
+    # While an output is streaming, evaluate the post-processing task once
+    # either threshold is reached. 0 evaluates on every streamed token.
+    min_interval_tokens: int = 0
+    min_interval_ms: int = 0
+
+
+_JQ_KEYWORDS = {
+    "as",
+    "and",
+    "or",
+    "if",
+    "then",
+    "elif",
+    "else",
+    "end",
+    "true",
+    "false",
+    "null",
+}
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_NUMBER = re.compile(r"[0-9]+(\.[0-9]*)?([eE][+-]?[0-9]+)?")
+_JQ_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+_BRACKET_KEY = re.compile(r'\[\s*("(?:[^"\\]|\\.)*")\s*\]')
+
+
+def jq_memory_keys(jq_command: str) -> Optional[frozenset[str]]:
+    """
+    Top-level memory keys read by a jq expression.
+
+    Returns None when the expression may read the whole input, e.g. a bare
+    `.`, `.[]`, `..` or a builtin such as `keys` applied to the input.
+    """
+    keys = set()
+    i = 0
+    end = len(jq_command)
+    # Whether the previous token ends a value, making a following `.` a path
+    # continuation (`.a.b`, `$x.b`, `.a[0].b`) rather than a read of the input.
+    after_value = False
+    while i < end:
+        char = jq_command[i]
+        if char.isspace():
+            i += 1
+        elif char == "#":
+            newline = jq_command.find("\n", i)
+            i = end if newline == -1 else newline
+        elif char == '"':
+            match = _JQ_STRING.match(jq_command, i)
+            if not match or "\\(" in match.group():
+                return None
+            i = match.end()
+            after_value = True
+        elif char == "$":
+            match = _IDENTIFIER.match(jq_command, i + 1)
+            i = match.end() if match else i + 1
+            after_value = True
+        elif char.isdigit():
+            i = _NUMBER.match(jq_command, i).end()  # type: ignore
+            after_value = True
+        elif char.isalpha() or char == "_":
+            match = _IDENTIFIER.match(jq_command, i)
+            word = match.group()  # type: ignore
+            i = match.end()  # type: ignore
+            is_object_key = jq_command[i:].lstrip().startswith(":")
+            if word not in _JQ_KEYWORDS and not is_object_key:
+                return None
+            after_value = word in ("true", "false", "null")
+        elif char == ".":
+            i += 1
+            if jq_command.startswith(".", i):
+                return None
+            if match := _IDENTIFIER.match(jq_command, i):
+                key = match.group()
+            elif match := _BRACKET_KEY.match(jq_command, i):
+                key = json.loads(match.group(1))
+            elif after_value:
+                continue
+            else:
+                return None
+            if not after_value:
+                keys.add(key)
+            i = match.end()
+            after_value = True
+        else:
+            i += 1
+            after_value = char in ")]?"
+    return frozenset(keys)
+
+
+@dataclass
+class PostProcessTask:
+    key: str
+    definition: Any
+    reads: Optional[frozenset[str]]
+    config: PostProcessConfig
+    operation: Optional[str] = None
+    stale: bool = True
+    changed: set = field(default_factory=set)
+    source: str = ""
+    pending: bool = False
+    tokens: int = 0
+    last_run: float = 0.0
+
+    def touch(self, keys: Optional[Iterable[str]]) -> None:
+        if keys is None:
+            self.stale = True
+        else:
+            self.changed.update(keys)
+
+    def needs_run(self, source: str) -> bool:
+        if self.stale or source != self.source:
+            return True
+        if self.reads is None:
+            return bool(self.changed)
+        return not self.changed.isdisjoint(self.reads)
+
+    def throttled(self) -> bool:
+        interval_tokens = self.config.min_interval_tokens
+        interval_ms = self.config.min_interval_ms
+        if not interval_tokens and not interval_ms:
+            return False
+        if interval_tokens and self.tokens >= interval_tokens:
+            return False
+        if interval_ms and (time.monotonic() - self.last_run) * 1000 >= interval_ms:
+            return False
+        return True
+
+    def ran(self, source: str) -> None:
+        self.stale = False
+        self.changed = set()
+        self.source = source
+        self.pending = False
+        self.tokens = 0
+        self.last_run = time.monotonic()
+
+
+class PostProcessor:
+    """
+    Post-processing tasks (`jq` outputs) for a single transition.
+
+    Tracks which memory keys changed since each task last ran so expressions
+    are only re-evaluated when their inputs changed, and throttles evaluation
+    while outputs are streaming.
+    """
+
+    def __init__(self, tasks: List[PostProcessTask]) -> None:
+        self.tasks = tasks
+
+    @classmethod
+    def for_outputs(
+        cls, outputs: Iterable, default_config: PostProcessConfig
+    ) -> "PostProcessor":
+        tasks = []
+        for output_definition in outputs:
+            config = (
+                PostProcessConfig(
+                    **(
+                        default_config.model_dump()
+                        | output_definition.post_process_config.model_dump(
+                            exclude_unset=True
+                        )
+                    )
+                )
+                if output_definition.post_process_config
+                else default_config
+            )
+            for operation in PostProcessTasks:  # type: ignore
+                expression = getattr(output_definition, operation, None)
+                if expression:
+                    tasks.append(
+                        PostProcessTask(
+                            key=output_definition.key,
+                            definition=output_definition,
+                            reads=jq_memory_keys(expression),
+                            config=config,
+                            operation=operation,
+                        )
+                    )
+        return cls(tasks)
+
+    def copy(self) -> "PostProcessor":
+        # The same tasks with fresh change tracking, for another run.
+        return PostProcessor(
+            [
+                PostProcessTask(
+                    key=task.key,
+                    definition=task.definition,
+                    reads=task.reads,
+                    config=task.config,
+                    operation=task.operation,
+                )
+                for task in self.tasks
+            ]
+        )
+
+    def __iter__(self) -> Iterator[PostProcessTask]:
+        return iter(self.tasks)
+
+    def __bool__(self) -> bool:
+        return bool(self.tasks)
+
+    def touch(self, keys: Optional[Iterable[str]]) -> None:
+        keys = None if keys is None else list(keys)
+        for task in self.tasks:
+            task.touch(keys)
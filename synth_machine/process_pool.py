@@ -0,0 +1,278 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import uuid
+import zlib
+from contextlib import aclosing
+from multiprocessing.connection import Connection
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from synth_machine.factory import SynthFactory
+
+# Requests to workers: (request_id, command, session_id, args), a "cancel"
+# command stops the request with the same id.
+# Replies to the parent: (request_id, kind, value), kind is one of:
+_EVENT = "event"
+_DONE = "done"
+_ERROR = "error"
+
+
+def _picklable_error(error: BaseException) -> BaseException:
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+async def _serve(connection: Connection, factory: SynthFactory) -> None:
+    loop = asyncio.get_running_loop()
+    sessions: dict = {}
+    # Triggers for a session run one at a time, in the order they arrived.
+    session_locks: Dict[str, asyncio.Lock] = {}
+    tasks: Dict[int, asyncio.Task] = {}
+
+    async def handle(request_id: int, command: str, session_id: str, args: dict):
+        try:
+            match command:
+                case "create":
+                    sessions[session_id] = factory.create(session_id=session_id, **args)
+                    result = None
+                case "trigger":
+                    synth = sessions[session_id]
+                    lock = session_locks.setdefault(session_id, asyncio.Lock())
+                    async with (
+                        lock,
+                        aclosing(synth.streaming_trigger(**args)) as events,
+                    ):
+                        async for event in events:
+                            connection.send((request_id, _EVENT, event))
+                    result = None
+                case "state":
+                    synth = sessions[session_id]
+                    result = (synth.current_state(), synth.memory.snapshot())
+                case "close":
+                    sessions.pop(session_id, None)
+                    session_locks.pop(session_id, None)
+                    result = None
+                case _:
+                    raise ValueError(f"Unknown command: {command}")
+            connection.send((request_id, _DONE, result))
+        except Exception as e:
+            connection.send((request_id, _ERROR, _picklable_error(e)))
+
+    while True:
+        request = await loop.run_in_executor(None, connection.recv)
+        if request is None:
+            break
+        request_id, command = request[0], request[1]
+        if command == "cancel":
+            # The parent stopped reading, e.g. a trigger stream closed early.
+            task = tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            continue
+        task = asyncio.create_task(handle(*request))
+        tasks[request_id] = task
+        task.add_done_callback(
+            lambda _, request_id=request_id: tasks.pop(request_id, None)
+        )
+    for task in list(tasks.values()):
+        task.cancel()
+
+
+def _worker(connection: Connection, config: dict, synth_options: dict) -> None:
+    # Each worker validates and compiles the definition once, sessions
+    # created in the worker share it.
+    factory = SynthFactory(config, **synth_options)
+    try:
+        asyncio.run(_serve(connection, factory))
+    finally:
+        connection.close()
+
+
+class _Worker:
+    def __init__(self, context, config: dict, synth_options: dict) -> None:
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker, args=(child, config, synth_options), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self._send_lock = threading.Lock()
+
+    def send(self, request) -> None:
+        with self._send_lock:
+            self.connection.send(request)
+
+
+class SynthProcessPool:
+    """
+    Runs synth sessions in worker processes, so CPU bound work (parsing,
+    templates, jq, validation) for different sessions uses separate cores.
+
+    Sessions are assigned to a worker by their session id and stay there.
+    Events are pickled and streamed back to the parent as they are produced.
+    `synth_options` are passed to `SynthFactory` in each worker and must be
+    picklable, e.g. module level user defined functions.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        workers: Optional[int] = None,
+        mp_context: Optional[str] = "spawn",
+        **synth_options,
+    ) -> None:
+        self.config = config
+        self.synth_options = synth_options
+        self.size = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context(mp_context)
+        self._workers: list = []
+        self._readers: list = []
+        # request id: (worker index, requesting loop, reply queue)
+        self._requests: Dict[
+            int, Tuple[int, asyncio.AbstractEventLoop, asyncio.Queue]
+        ] = {}
+        self._request_ids = itertools.count()
+
+    def start(self) -> "SynthProcessPool":
+        if self._workers:
+            return self
+        # Validate in the parent so errors are raised here and not per worker.
+        SynthFactory(self.config)
+        for index in range(self.size):
+            worker = _Worker(self.context, self.config, self.synth_options)
+            reader = threading.Thread(
+                target=self._read, args=(index, worker.connection), daemon=True
+            )
+            reader.start()
+            self._workers.append(worker)
+            self._readers.append(reader)
+        return self
+
+    def _read(self, index: int, connection: Connection) -> None:
+        while True:
+            try:
+                request_id, kind, value = connection.recv()
+            except (EOFError, OSError):
+                break
+            request = self._requests.get(request_id)
+            if request is None:
+                continue
+            _, loop, queue = request
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+            except RuntimeError:
+                # The requesting loop has closed.
+                pass
+        # The worker exited, fail anything still waiting on it.
+        error = RuntimeError("Synth worker process exited")
+        for worker_index, loop, queue in list(self._requests.values()):
+            if worker_index != index:
+                continue
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (_ERROR, error))
+            except RuntimeError:
+                pass
+
+    def worker_index(self, session_id: str) -> int:
+        # Stable between processes and runs, unlike hash().
+        return zlib.crc32(session_id.encode()) % self.size
+
+    async def _request(
+        self, session_id: str, command: str, args: dict = {}
+    ) -> AsyncIterator[Tuple[str, object]]:
+        if not self._workers:
+            self.start()
+        request_id = next(self._request_ids)
+        index = self.worker_index(session_id)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._requests[request_id] = (index, asyncio.get_running_loop(), queue)
+        finished = False
+        try:
+            self._workers[index].send((request_id, command, session_id, args))
+            while True:
+                kind, value = await queue.get()
+                if kind != _EVENT:
+                    finished = True
+                yield kind, value
+                if finished:
+                    return
+        finally:
+            self._requests.pop(request_id, None)
+            if not finished:
+                # Stop the worker running a request nobody is reading.
+                try:
+                    self._workers[index].send((request_id, "cancel", session_id, {}))
+                except (BrokenPipeError, OSError, IndexError):
+                    pass
+
+    async def _call(self, session_id: str, command: str, args: dict = {}):
+        async with aclosing(self._request(session_id, command, args)) as replies:
+            async for kind, value in replies:
+                if kind == _ERROR:
+                    raise value  # type: ignore
+                if kind == _DONE:
+                    return value
+
+    async def create_session(
+        self,
+        session_id: Optional[str] = None,
+        memory: dict = {},
+        user: Optional[str] = None,
+        state: Optional[str] = None,
+    ) -> str:
+        session_id = session_id or str(uuid.uuid4())
+        await self._call(
+            session_id, "create", {"memory": memory, "user": user, "state": state}
+        )
+        return session_id
+
+    async def streaming_trigger(
+        self, session_id: str, trigger: str, params: Optional[dict] = None
+    ) -> AsyncIterator:
+        async with aclosing(
+            self._request(session_id, "trigger", {"trigger": trigger, "params": params})
+        ) as replies:
+            async for kind, value in replies:
+                if kind == _EVENT:
+                    yield value
+                elif kind == _ERROR:
+                    raise value  # type: ignore
+
+    async def session_state(self, session_id: str) -> Tuple[str, dict]:
+        """
+        The session's current state and memory.
+        """
+        return await self._call(session_id, "state")  # type: ignore
+
+    async def close_session(self, session_id: str) -> None:
+        await self._call(session_id, "close")
+
+    def close(self) -> None:
+        for worker in self._workers:
+            try:
+                worker.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                logging.warning("Synth worker did not stop, terminating it")
+                worker.process.terminate()
+            worker.connection.close()
+        for reader in self._readers:
+            reader.join(timeout=1)
+        self._workers = []
+        self._readers = []
+
+    def __enter__(self) -> "SynthProcessPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
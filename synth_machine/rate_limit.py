@@ -0,0 +1,267 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+
+# {"openai": {"requests_per_minute": 500}, "openai/gpt-4o": {...}}
+RATE_LIMITS = json.loads(os.environ.get("RATE_LIMITS", "{}"))
+
+
+def is_overloaded(error: BaseException) -> bool:
+    """
+    Provider SDK and httpx errors carry the response status, 429 and 5xx mean
+    the provider wants fewer requests.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` and holds up to a minute's worth. Reservations are
+    taken immediately and may overdraw the bucket, the caller waits until the
+    overdraft has refilled, so waiters are served in order.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+        # Requests larger than the bucket would never fit, let them drain it.
+        self.available -= min(amount, self.capacity)
+        return max(0.0, -self.available / self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    Caps requests in flight, increasing the cap by one each round of
+    successful requests and halving it when the provider is overloaded
+    (additive increase, multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self._decreased = 0.0
+        self._waiters: deque = deque()
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_concurrency, int(self.limit))
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _wake(self) -> None:
+        free = self.current_limit - self.in_flight
+        for waiter in list(self._waiters):
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self) -> None:
+        while self.in_flight >= self.current_limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Woken then cancelled, pass the slot on.
+                    self._waiters.remove(waiter)
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self) -> None:
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_overload(self) -> None:
+        now = time.monotonic()
+        # One burst of 429s should only back off once.
+        if now - self._decreased >= self.cooldown:
+            self._decreased = now
+            self.limit = max(self.min_concurrency, self.limit * self.decrease)
+
+
+class RateLimiter:
+    """
+    Shared limits for one provider, or one provider model: requests and
+    tokens per minute, and adaptive concurrency.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        max_retries: int = 2,
+        backoff: float = 1.0,
+    ) -> None:
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.total_requests = 0
+        self.overloaded = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        Wait for a request slot, returns the time spent waiting.
+        """
+        start = time.monotonic()
+        # Wait for the rate limits before taking a slot, so requests waiting
+        # on them don't hold back others.
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay:
+            await asyncio.sleep(delay)
+        await self.concurrency.acquire()
+        waited = time.monotonic() - start
+        self.total_requests += 1
+        self.queue_wait_total += waited
+        self.queue_wait_max = max(self.queue_wait_max, waited)
+        if waited > 0.1:
+            logging.debug("⏳ Waited %.2fs for a rate limited request", waited)
+        return waited
+
+    async def stream(
+        self, start: Callable[[], AsyncIterator], tokens: int = 0
+    ) -> AsyncIterator:
+        """
+        Run `start()` within the limits. Requests rejected as overloaded before
+        anything was streamed are retried with backoff.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            streamed = False
+            try:
+                async with aclosing(start()) as items:  # type: ignore
+                    async for item in items:
+                        streamed = True
+                        yield item
+            except Exception as e:
+                # Back off without the slot, `acquire` takes one again.
+                self.concurrency.release()
+                if not is_overloaded(e):
+                    raise
+                self.overloaded += 1
+                self.concurrency.on_overload()
+                if streamed or attempt >= self.max_retries:
+                    raise
+                delay = retry_after(e) or self.backoff * 2**attempt
+                attempt += 1
+                logging.warning(f"🔁 Provider overloaded, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay * random.uniform(1, 1.5))
+                continue
+            except BaseException:
+                self.concurrency.release()
+                raise
+            self.concurrency.release()
+            self.concurrency.on_success()
+            return
+
+    def metrics(self) -> dict:
+        return {
+            "requests": self.total_requests,
+            "overloaded": self.overloaded,
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.concurrency.waiting,
+            "concurrency_limit": self.concurrency.current_limit,
+            "queue_wait_total": self.queue_wait_total,
+            "queue_wait_max": self.queue_wait_max,
+        }
+
+
+RATE_LIMITERS: Dict[Tuple[str, Optional[str]], RateLimiter] = {}
+
+
+def configure_rate_limit(
+    executor: str, llm_name: Optional[str] = None, **limits
+) -> RateLimiter:
+    """
+    Limit requests to an executor. Without `llm_name` the limits are shared
+    by every model of the executor not configured on its own.
+    """
+    limiter = RateLimiter(**limits)
+    RATE_LIMITERS[(executor, llm_name)] = limiter
+    return limiter
+
+
+def get_rate_limiter(
+    executor: Optional[str], llm_name: Optional[str]
+) -> Optional[RateLimiter]:
+    if not RATE_LIMITERS or executor is None:
+        return None
+    return RATE_LIMITERS.get((executor, llm_name)) or RATE_LIMITERS.get(
+        (executor, None)
+    )
+
+
+def rate_limit_metrics() -> dict:
+    return {
+        f"{executor}/{llm_name}" if llm_name else executor: limiter.metrics()
+        for (executor, llm_name), limiter in RATE_LIMITERS.items()
+    }
+
+
+for name, limits in RATE_LIMITS.items():
+    executor_name, _, model_name = name.partition("/")
+    configure_rate_limit(executor_name, model_name or None, **limits)
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from synth_machine.machine_config import ModelConfig
+
+# A generation as streamed by an executor: `(token, token_info)` pairs.
+Chunks = List[Tuple[str, dict]]
+
+
+def response_cache_key(
+    user_prompt: str,
+    system_prompt: str,
+    model_config: ModelConfig,
+    json_schema: Optional[dict],
+) -> str:
+    """
+    Identifies a generation by everything sent to the executor, except the user.
+    """
+    return hashlib.sha256(
+        json.dumps(
+            [
+                user_prompt,
+                system_prompt,
+                model_config.model_dump(mode="json"),
+                json_schema,
+            ],
+            sort_keys=True,
+            separators=(",", ":"),
+        ).encode()
+    ).hexdigest()
+
+
+async def replay(chunks: Chunks) -> AsyncGenerator:
+    for token, token_info in chunks:
+        yield token, token_info
+
+
+class ResponseCache:
+    """
+    Stores validated LLM generations so repeated prompts skip the executor.
+    """
+
+    async def get(self, key: str) -> Optional[Chunks]:
+        raise NotImplementedError
+
+    async def set(self, key: str, chunks: Chunks) -> None:
+        raise NotImplementedError
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    In process LRU cache, entries expire `ttl` seconds after they are stored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Chunks]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored, chunks = entry
+        if self.ttl is not None and time.monotonic() - stored > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return chunks
+
+    async def set(self, key: str, chunks: Chunks) -> None:
+        self._entries[key] = (time.monotonic(), list(chunks))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class SqliteResponseCache(ResponseCache):
+    """
+    On disk cache shared between processes and restarts.
+    Queries run in a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, chunks TEXT NOT NULL, stored REAL NOT NULL)"
+            )
+
+    def _get(self, key: str) -> Optional[Chunks]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT chunks, stored FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            chunks, stored = row
+            if self.ttl is not None and time.time() - stored > self.ttl:
+                with self._connection:
+                    self._connection.execute(
+                        "DELETE FROM responses WHERE key = ?", (key,)
+                    )
+                return None
+        return [(token, token_info) for token, token_info in json.loads(chunks)]
+
+    def _set(self, key: str, chunks: Chunks) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, chunks, stored) VALUES (?, ?, ?)",
+                (key, json.dumps(chunks), time.time()),
+            )
+
+    async def get(self, key: str) -> Optional[Chunks]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, chunks: Chunks) -> None:
+        await asyncio.to_thread(self._set, key, chunks)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
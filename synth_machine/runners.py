@@ -1,43 +1,60 @@
 import logging
+from functools import lru_cache
 from io import BytesIO
 from typing import Optional
 from uuid import uuid4
 
 import jq
-import requests  # type: ignore
 from object_store import ObjectStore
 import json
 import os
 
 from synth_machine.operator_setup import ToolConfig
+from synth_machine.tool_client import ToolClient, default_tool_client
 
 
 STORAGE_OPTIONS = json.loads(os.environ.get("STORAGE_OPTIONS", "{}"))
 STORAGE_PREFIX = os.environ.get("STORAGE_PREFIX", "memory://")
 
 
+@lru_cache(maxsize=None)
+def default_store() -> ObjectStore:
+    return ObjectStore(STORAGE_PREFIX, STORAGE_OPTIONS)
+
+
 async def tool_runner(
-    store: ObjectStore, tool_config: ToolConfig
+    store: ObjectStore,
+    tool_config: ToolConfig,
+    tool_client: Optional[ToolClient] = None,
 ) -> Optional[dict | str]:
+    tool_client = tool_client or default_tool_client()
     try:
-        response = requests.post(
-            tool_config.tool_path,
-            json=tool_config.payload,
-        )
-        response_headers = {
-            "response_headers": {
-                "status": response.status_code,
-                "success": response.ok,
+        async with tool_client.post(
+            tool_config.tool_path, tool_config.payload
+        ) as response:
+            response_headers = {
+                "response_headers": {
+                    "status": response.status_code,
+                    "success": response.status_code < 400,
+                }
             }
-        }
+            if tool_config.output_mime_types:
+                output_format = response.headers["content-type"].split("/")[1]
+                # ObjectStore has no streaming upload, chunks are buffered as
+                # they arrive and stored with a single put.
+                body = BytesIO()
+                async for chunk in response.aiter_bytes():
+                    body.write(chunk)
+                body.seek(0)
+            else:
+                content = await response.aread()
     except Exception as e:
         logging.error(f"Error in running tool {e}")
         return
 
     if tool_config.output_mime_types:
-        output_format = response.headers["content-type"].split("/")[1]
         file_name = f"{uuid4()}.{output_format}"
-        await store.put_async(file_name, BytesIO(response.content))
+        await store.put_async(file_name, body)
         return {
             "file_name": file_name,
             "mime_type": output_format,
@@ -45,15 +62,20 @@ async def tool_runner(
             "response_headers": response_headers["response_headers"],
         }
     else:
-        output = response.json() | response_headers
+        output = json.loads(content) | response_headers
         return output
 
 
+@lru_cache(maxsize=256)
+def compile_jq(jq_command: str):
+    return jq.compile(jq_command)
+
+
 def jq_runner(jq_command: str, data: dict = {}, schema: Optional[dict] = {}) -> list:
     if not jq_command:
         return []
     try:
-        intermediate_result = jq.compile(jq_command).input_value(data)
+        intermediate_result = compile_jq(jq_command).input_value(data)
         if schema and (
             schema.get("type") == "object" or schema.get("type") == "string"
         ):
@@ -0,0 +1,320 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from synth_machine.machine import Synth
+
+_DONE = object()
+
+
+class SynthJob:
+    """
+    A trigger to run on a synth. Iterate it for the trigger's events once
+    submitted to a SynthRunner.
+
+    At most `max_buffered` events are held for a slow reader, the trigger
+    waits for it to catch up beyond that, without holding one of the runner's
+    slots.
+    """
+
+    def __init__(
+        self,
+        synth: Synth,
+        trigger: str,
+        params: Optional[dict] = None,
+        lane: Optional[str] = None,
+        user: Optional[str] = None,
+        max_buffered: int = 256,
+    ) -> None:
+        self.synth = synth
+        self.trigger = trigger
+        self.params = params
+        self.lane = lane
+        self.user = synth.user if user is None else user
+        self.submitted: Optional[float] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self._events: asyncio.Queue = asyncio.Queue(max_buffered)
+        self._task: Optional[asyncio.Task] = None
+        self._cancelled = False
+        self._slot = False
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        if self.submitted is None or self.started is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        if self._task is not None:
+            self._task.cancel()
+
+    async def wait(self) -> None:
+        """
+        Wait for the job to finish, dropping any events not read yet. Raises
+        the job's error when it failed or was cancelled.
+        """
+        if self.done and self._events.empty():
+            # Already read to the end.
+            if self.error is not None:
+                raise self.error
+            return
+        async for _ in self:
+            pass
+
+    async def __aiter__(self) -> AsyncIterator:
+        while True:
+            event = await self._events.get()
+            if event is _DONE:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield event
+
+
+class _Lane:
+    def __init__(self) -> None:
+        self.queue: list = []
+        self.virtual_time = 0.0
+        self.last_tags: Dict[str, float] = {}
+        self.completed = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.run_time_total = 0.0
+
+
+class SynthRunner:
+    """
+    Runs triggers for many sessions with at most `max_concurrency` at once.
+
+    Lanes are served in priority order, the first lane listed first. Within a
+    lane users get turns in proportion to their weight (start time fair
+    queuing), so one user queueing many jobs doesn't hold up everyone else.
+    Jobs for the same synth run one at a time, in the order submitted.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        lanes: Sequence[str] = ("interactive", "batch"),
+        user_weights: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.lanes = {lane: _Lane() for lane in lanes}
+        self.default_lane = lanes[0]
+        self.user_weights = user_weights or {}
+        self.running = 0
+        self._sequence = itertools.count()
+        # Jobs waiting on an earlier job for the same synth.
+        self._sessions: Dict[int, deque] = {}
+        # Running jobs whose reader caught up, waiting for a slot again.
+        self._resuming: deque = deque()
+
+    def submit(
+        self,
+        synth: Synth,
+        trigger: str,
+        params: Optional[dict] = None,
+        lane: Optional[str] = None,
+        user: Optional[str] = None,
+    ) -> SynthJob:
+        return self.submit_job(SynthJob(synth, trigger, params, lane, user))
+
+    def submit_job(self, job: SynthJob) -> SynthJob:
+        if job.lane is None:
+            job.lane = self.default_lane
+        if job.lane not in self.lanes:
+            raise ValueError(f"Unknown lane: {job.lane}")
+        job.submitted = time.monotonic()
+        session = self._sessions.get(id(job.synth))
+        if session is not None:
+            session.append(job)
+        else:
+            self._sessions[id(job.synth)] = deque()
+            self._enqueue(job)
+        self._dispatch()
+        return job
+
+    async def run(
+        self, jobs: AsyncIterable[SynthJob]
+    ) -> AsyncIterator[Tuple[SynthJob, Any]]:
+        """
+        Submit jobs as they arrive and yield `(job, event)` for every event.
+        A job that fails or is cancelled ends with `(job, job.error)`.
+        Leaving early cancels the jobs still running.
+        """
+        merged: asyncio.Queue = asyncio.Queue()
+        pending = 0
+        submitting = True
+
+        async def forward(job: SynthJob) -> None:
+            try:
+                async for event in job:
+                    merged.put_nowait((job, event))
+            except BaseException as e:
+                if e is not job.error:
+                    raise
+                merged.put_nowait((job, e))
+            finally:
+                merged.put_nowait((job, _DONE))
+
+        async def submit_all() -> None:
+            nonlocal pending, submitting
+            try:
+                async for job in jobs:
+                    pending += 1
+                    self.submit_job(job)
+                    submitted.append(job)
+                    forwarders.add(asyncio.create_task(forward(job)))
+            finally:
+                submitting = False
+                merged.put_nowait((None, _DONE))
+
+        submitted: list = []
+        forwarders: set = set()
+        submitter = asyncio.create_task(submit_all())
+        try:
+            while submitting or pending:
+                job, event = await merged.get()
+                if event is _DONE:
+                    if job is not None:
+                        pending -= 1
+                    continue
+                yield job, event
+            await submitter
+        finally:
+            submitter.cancel()
+            for task in forwarders:
+                task.cancel()
+            for job in submitted:
+                if not job.done:
+                    job.cancel()
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "lanes": {
+                name: {
+                    "queued": len(lane.queue),
+                    "completed": lane.completed,
+                    "queue_wait_total": lane.queue_wait_total,
+                    "queue_wait_max": lane.queue_wait_max,
+                    "run_time_total": lane.run_time_total,
+                }
+                for name, lane in self.lanes.items()
+            },
+            "waiting_on_session": sum(len(jobs) for jobs in self._sessions.values()),
+        }
+
+    def _enqueue(self, job: SynthJob) -> None:
+        lane = self.lanes[job.lane]  # type: ignore
+        weight = self.user_weights.get(job.user, 1.0)
+        start = max(lane.virtual_time, lane.last_tags.get(job.user, 0.0))
+        tag = start + 1 / weight
+        lane.last_tags[job.user] = tag
+        heapq.heappush(lane.queue, (tag, next(self._sequence), job))
+
+    def _next_job(self) -> Optional[SynthJob]:
+        for lane in self.lanes.values():
+            while lane.queue:
+                tag, _, job = heapq.heappop(lane.queue)
+                lane.virtual_time = tag
+                if not lane.queue:
+                    # Idle users don't bank credit while the lane is empty.
+                    lane.last_tags.clear()
+                if job._cancelled:
+                    job.error = asyncio.CancelledError()
+                    self._finish(job)
+                    continue
+                return job
+        return None
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency:
+            if self._resuming:
+                # Jobs already started go before new ones.
+                job, resumed = self._resuming.popleft()
+                if resumed.done():
+                    continue
+                self._take_slot(job)
+                resumed.set_result(None)
+                continue
+            job = self._next_job()
+            if job is None:
+                return
+            self._take_slot(job)
+            job.started = time.monotonic()
+            job._task = asyncio.create_task(self._run(job))
+
+    def _take_slot(self, job: SynthJob) -> None:
+        job._slot = True
+        self.running += 1
+
+    def _release_slot(self, job: SynthJob) -> None:
+        if job._slot:
+            job._slot = False
+            self.running -= 1
+
+    async def _wait_for_reader(self, job: SynthJob, event: Any) -> None:
+        # A slow or absent reader doesn't keep a slot from other jobs.
+        self._release_slot(job)
+        self._dispatch()
+        await job._events.put(event)
+        resumed = asyncio.get_running_loop().create_future()
+        self._resuming.append((job, resumed))
+        self._dispatch()
+        await resumed
+
+    async def _run(self, job: SynthJob) -> None:
+        try:
+            async for event in job.synth.streaming_trigger(job.trigger, job.params):
+                try:
+                    job._events.put_nowait(event)
+                except asyncio.QueueFull:
+                    await self._wait_for_reader(job, event)
+        except asyncio.CancelledError as e:
+            # Cancelled jobs end with an error rather than like completed ones.
+            job.error = e
+            raise
+        except Exception as e:
+            job.error = e
+        finally:
+            self._release_slot(job)
+            self._finish(job)
+            self._dispatch()
+
+    def _finish(self, job: SynthJob) -> None:
+        job.finished = time.monotonic()
+        lane = self.lanes[job.lane]  # type: ignore
+        if job.started is not None:
+            wait = job.started - job.submitted  # type: ignore
+            lane.completed += 1
+            lane.queue_wait_total += wait
+            lane.queue_wait_max = max(lane.queue_wait_max, wait)
+            lane.run_time_total += job.finished - job.started
+        try:
+            job._events.put_nowait(_DONE)
+        except asyncio.QueueFull:
+            asyncio.get_running_loop().create_task(job._events.put(_DONE))
+        waiting = self._sessions.get(id(job.synth))
+        if waiting:
+            self._enqueue(waiting.popleft())
+        else:
+            self._sessions.pop(id(job.synth), None)
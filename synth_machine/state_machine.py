@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Tuple
+from transitions import MachineError
+
+from synth_machine.synth_definition import SynthDefinition
+
+
+@dataclass(frozen=True)
+class StateTable:
+    states: frozenset
+    triggers: frozenset
+    destinations: Mapping[Tuple[str, str], str]
+
+
+def state_table(definition: SynthDefinition) -> StateTable:
+    """
+    `(state, trigger) -> dest` for a definition, resolved the way
+    `transitions.Machine(auto_transitions=False)` does: `*` sources apply to
+    every state, a `=` dest stays in the source state and the first declared
+    transition wins.
+    """
+    state_names = [state.name for state in definition.states]
+    destinations: dict = {}
+    for transition in definition.transitions:
+        sources = state_names if transition.source == "*" else [transition.source]
+        for source in sources:
+            dest = source if transition.dest == "=" else transition.dest
+            destinations.setdefault((source, transition.trigger), dest)
+    return StateTable(
+        states=frozenset(state_names),
+        triggers=frozenset(transition.trigger for transition in definition.transitions),
+        destinations=MappingProxyType(destinations),
+    )
+
+
+class CompactStateMachine:
+    """
+    Session state for a synth, a drop in for the `transitions` model and
+    machine pair driven by a StateTable shared between sessions.
+    """
+
+    __slots__ = ("state", "table")
+
+    def __init__(self, table: StateTable, initial: str) -> None:
+        self.table = table
+        self.state = initial
+
+    def trigger(self, trigger: str) -> bool:
+        if trigger not in self.table.triggers:
+            raise AttributeError(f"Do not know event named '{trigger}'.")
+        dest = self.table.destinations.get((self.state, trigger))
+        if dest is None:
+            raise MachineError(
+                f"Can't trigger event {trigger} from state {self.state}!"
+            )
+        if dest not in self.table.states:
+            raise ValueError(f"State '{dest}' is not a registered state.")
+        self.state = dest
+        return True
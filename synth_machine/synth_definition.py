@@ -1,12 +1,18 @@
 from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
-from synth_machine.machine_config import ModelConfig, default_model_config
+from synth_machine.machine_config import (
+    ModelConfig,
+    default_model_config,
+    merge_model_configs,
+)
+from synth_machine.post_process import PostProcessConfig
 from synth_machine.rag import RAGConfig
 from synth_machine.synth_parser import ParserOptions
 
 
 class Loop(BaseModel):
     matrix: list[dict] = []
+    max_concurrency: Optional[int] = None
 
 
 class Interface(BaseModel):
@@ -46,9 +52,11 @@ class Output(BaseModel):
     interleave: Optional[list] = None
     route: Optional[str] = None
     jq: Optional[str] = None
+    post_process_config: Optional[PostProcessConfig] = None
     rag: Optional[str] = None
     udf: Optional[str] = None
     operation: Optional[str] = None
+    cache: bool = True
 
     @model_validator(mode="before")
     def check_prompts_schema(cls, values):
@@ -78,6 +86,7 @@ class Transition(BaseModel):
     source: str
     trigger: str
     config: Optional[ModelConfig] = Field(alias="model_config", default=ModelConfig())
+    max_concurrency: Optional[int] = None
 
 
 class ShareProfile(BaseModel):
@@ -89,6 +98,7 @@ class ShareProfile(BaseModel):
 class SynthDefinition(BaseModel):
     default_model_config: ModelConfig = ModelConfig()
     default_rag_config: RAGConfig = RAGConfig()
+    default_post_process_config: PostProcessConfig = PostProcessConfig()
     initial_memory: dict = {}
     initial_state: str
     shareProfile: Optional[ShareProfile] = None
@@ -120,12 +130,7 @@ class SynthDefinition(BaseModel):
 
 def synth_definition_setup(synth_config: dict) -> SynthDefinition:
     synth_definition = SynthDefinition(**synth_config)
-    synth_definition.default_model_config = ModelConfig(
-        **(
-            default_model_config.model_dump()
-            | synth_definition.default_model_config.model_dump(
-                exclude_none=True,
-            )
-        )
+    synth_definition.default_model_config = merge_model_configs(
+        default_model_config, synth_definition.default_model_config
     )
     return synth_definition
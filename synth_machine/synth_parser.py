@@ -1,7 +1,9 @@
+import json
 import xmltodict
 from copy import deepcopy
 from partial_json_parser import loads, OBJ
 import re
+from typing import Any
 
 try:
     from enum import StrEnum
@@ -17,6 +19,229 @@ class ParserOptions(StrEnum):  # type: ignore
     XML = "xml"
 
 
+_VALUE = 0
+_VALUE_OR_END = 1
+_KEY = 2
+_KEY_OR_END = 3
+_COLON = 4
+_COMMA_OR_END = 5
+_STRING = 6
+_SCALAR = 7
+_DONE = 8
+
+_MISSING = object()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRING_RUN = re.compile(r'[^"\\]+')
+_SCALAR_RUN = re.compile(r"[0-9A-Za-z+\-.]+")
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+class StreamingJSONParser:
+    """
+    Incremental JSON parser for streamed LLM output.
+
+    Tokens are consumed with `feed` as they arrive and `value` returns the live
+    partial object without re-reading the buffer. Partial values follow the
+    same rules as `partial_json_parser.loads(..., OBJ)`: unfinished objects are
+    visible, unfinished strings, numbers and arrays are not.
+
+    `drain_changes` reports which top-level keys became visible or changed
+    since it was last called, or None when the whole value was replaced.
+    """
+
+    def __init__(self) -> None:
+        self._stack: list = []
+        self._keys: list = []
+        self._state = _VALUE
+        self._token: list[str] = []
+        self._escaped = False
+        self._is_key = False
+        self._root: Any = _MISSING
+        self._error: str | None = None
+        self._changed: set[str] | None = set()
+        self._open_arrays = 0
+
+    def feed(self, chunk: str) -> None:
+        i = 0
+        end = len(chunk)
+        while i < end and self._error is None:
+            state = self._state
+            if state == _STRING:
+                i = self._consume_string(chunk, i)
+                continue
+            if state == _SCALAR:
+                match = _SCALAR_RUN.match(chunk, i)
+                if match:
+                    self._token.append(match.group())
+                    i = match.end()
+                    if i == end and "".join(self._token) not in _LITERALS:
+                        # The scalar may continue in the next chunk.
+                        return
+                self._finish_scalar()
+                continue
+
+            i = _WHITESPACE.match(chunk, i).end()  # type: ignore
+            if i == end:
+                return
+            char = chunk[i]
+            i += 1
+
+            if state == _DONE:
+                self._error = f"Extra data after JSON value: {char!r}"
+            elif state == _VALUE or state == _VALUE_OR_END:
+                if char == "]" and state == _VALUE_OR_END:
+                    self._close_array()
+                else:
+                    self._start_value(char)
+            elif state == _KEY or state == _KEY_OR_END:
+                if char == '"':
+                    self._is_key = True
+                    self._state = _STRING
+                elif char == "}" and state == _KEY_OR_END:
+                    self._close_object()
+                else:
+                    self._error = f"Expected object key, got {char!r}"
+            elif state == _COLON:
+                if char == ":":
+                    self._state = _VALUE
+                else:
+                    self._error = f"Expected ':', got {char!r}"
+            elif state == _COMMA_OR_END:
+                container = self._stack[-1]
+                if char == ",":
+                    self._state = _KEY if isinstance(container, dict) else _VALUE
+                elif char == "}" and isinstance(container, dict):
+                    self._close_object()
+                elif char == "]" and isinstance(container, list):
+                    self._close_array()
+                else:
+                    self._error = f"Expected ',' or end of container, got {char!r}"
+
+    def value(self) -> Any:
+        if self._error is not None:
+            raise ValueError(self._error)
+        if self._root is _MISSING:
+            if self._state == _SCALAR and not self._stack:
+                # A bare number at the end of the stream is complete.
+                return json.loads("".join(self._token))
+            raise ValueError("No JSON value parsed yet")
+        return self._root
+
+    def drain_changes(self) -> set[str] | None:
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def _mark_changed(self) -> None:
+        # Values inside an unfinished array are not visible yet.
+        if (
+            self._changed is not None
+            and self._open_arrays == 0
+            and isinstance(self._root, dict)
+        ):
+            self._changed.add(self._keys[0])
+
+    def _consume_string(self, chunk: str, i: int) -> int:
+        end = len(chunk)
+        while i < end:
+            if self._escaped:
+                self._token.append(chunk[i])
+                self._escaped = False
+                i += 1
+                continue
+            match = _STRING_RUN.match(chunk, i)
+            if match:
+                self._token.append(match.group())
+                i = match.end()
+                continue
+            char = chunk[i]
+            i += 1
+            if char == "\\":
+                self._token.append(char)
+                self._escaped = True
+            else:
+                self._finish_string()
+                return i
+        return i
+
+    def _finish_string(self) -> None:
+        try:
+            text = json.loads(f'"{"".join(self._token)}"')
+        except json.JSONDecodeError as e:
+            self._error = str(e)
+            return
+        self._token = []
+        if self._is_key:
+            self._is_key = False
+            self._keys[-1] = text
+            self._state = _COLON
+        else:
+            self._attach(text)
+
+    def _finish_scalar(self) -> None:
+        token = "".join(self._token)
+        self._token = []
+        if token in _LITERALS:
+            self._attach(_LITERALS[token])
+            return
+        try:
+            self._attach(json.loads(token))
+        except json.JSONDecodeError:
+            self._error = f"Invalid JSON value: {token!r}"
+
+    def _start_value(self, char: str) -> None:
+        if char == "{":
+            container: dict = {}
+            if self._stack:
+                self._place(container)
+            else:
+                self._root = container
+                self._changed = None
+            self._stack.append(container)
+            self._keys.append(None)
+            self._state = _KEY_OR_END
+        elif char == "[":
+            self._open_arrays += 1
+            self._stack.append([])
+            self._keys.append(None)
+            self._state = _VALUE_OR_END
+        elif char == '"':
+            self._state = _STRING
+        elif char in "-0123456789tfn":
+            self._token.append(char)
+            self._state = _SCALAR
+        else:
+            self._error = f"Unexpected character {char!r}"
+
+    def _place(self, value: Any) -> None:
+        self._mark_changed()
+        parent = self._stack[-1]
+        if isinstance(parent, dict):
+            parent[self._keys[-1]] = value
+        else:
+            parent.append(value)
+
+    def _attach(self, value: Any) -> None:
+        if self._stack:
+            self._place(value)
+            self._state = _COMMA_OR_END
+        else:
+            self._root = value
+            self._changed = None
+            self._state = _DONE
+
+    def _close_object(self) -> None:
+        self._stack.pop()
+        self._keys.pop()
+        self._state = _COMMA_OR_END if self._stack else _DONE
+
+    def _close_array(self) -> None:
+        self._open_arrays -= 1
+        self._keys.pop()
+        # Arrays only become visible once complete, matching partial_json_parser.
+        self._attach(self._stack.pop())
+
+
 class SynthParser:
     def __init__(self):
         self.parse = {
@@ -24,11 +249,16 @@ class SynthParser:
             "xml": self.xml_parse,
             "code": self.code_parse,
         }
+        self.streaming_parse = {
+            "json": StreamingJSONParser,
+        }
 
-    def json_parse(self, raw_value: str) -> dict | list:
+    @staticmethod
+    def json_parse(raw_value: str) -> dict | list:
         return loads(str(raw_value), OBJ)
 
-    def xml_parse(self, raw_value: str) -> dict:
+    @staticmethod
+    def xml_parse(raw_value: str) -> dict:
         open_tag_pattern = r"<[^/][^>]*>"
         close_tag_pattern = r"</[^>]+>"
 
@@ -47,7 +277,8 @@ class SynthParser:
             )
         return xmltodict.parse(raw_value)
 
-    def code_parse(self, raw_value: str) -> str:
+    @staticmethod
+    def code_parse(raw_value: str) -> str:
         code_break_points = raw_value.split("```")
 
         match len(code_break_points):
@@ -0,0 +1,158 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from synth_machine.dependencies import output_dependencies
+from synth_machine.machine_config import ModelConfig, merge_model_configs
+from synth_machine.operation_definitions import OperationPriority
+from synth_machine.post_process import PostProcessor
+from synth_machine.synth_definition import (
+    Output,
+    State,
+    SynthDefinition,
+    Transition,
+    synth_definition_setup,
+)
+from synth_machine.state_machine import StateTable, state_table
+from synth_machine.templates import prewarm_templates
+from synth_machine.validation import SchemaValidator, schema_validator
+
+
+@dataclass(frozen=True)
+class OutputPlan:
+    definition: Output
+    operation: Optional[OperationPriority]
+    model_config: ModelConfig
+    validator: Optional[SchemaValidator]
+
+
+@dataclass(frozen=True)
+class TransitionPlan:
+    transition: Transition
+    outputs: Tuple[OutputPlan, ...]
+    dependencies: Tuple[frozenset, ...]
+    # Never run directly, `post_processor.copy()` gives each run fresh state.
+    post_processor: PostProcessor
+
+
+@dataclass(frozen=True)
+class SynthPlan:
+    """
+    Everything the runtime derives from a SynthDefinition, computed once so
+    executing an output or looking up a trigger or state is a dict lookup.
+    """
+
+    definition: SynthDefinition
+    transitions: Mapping[str, TransitionPlan]
+    states: Mapping[str, State]
+    interfaces: Mapping[str, Tuple[Transition, ...]]
+    # Keyed by `id()` of the Output definitions the plan holds on to.
+    outputs: Mapping[int, OutputPlan]
+    state_table: StateTable
+    # States and transitions in the form `transitions.Machine` takes them.
+    state_names: Tuple[str, ...]
+    machine_transitions: Tuple[Mapping[str, str], ...]
+
+    def transition(self, trigger: str) -> TransitionPlan:
+        return self.transitions[trigger]
+
+    def output(self, output_definition: Output) -> OutputPlan:
+        return self.outputs[id(output_definition)]
+
+
+def output_operation(output_definition: Output) -> Optional[OperationPriority]:
+    for operation in OperationPriority:  # type: ignore
+        if getattr(output_definition, operation, None):
+            return operation
+    return None
+
+
+def compile_transition(
+    definition: SynthDefinition, transition: Transition
+) -> TransitionPlan:
+    outputs = tuple(
+        OutputPlan(
+            definition=output_definition,
+            operation=output_operation(output_definition),
+            model_config=merge_model_configs(
+                definition.default_model_config,
+                transition.config,
+                output_definition.config,
+            ),
+            validator=(
+                schema_validator(output_definition.schema_dict)
+                if output_definition.schema_dict
+                else None
+            ),
+        )
+        for output_definition in transition.outputs or []
+    )
+    return TransitionPlan(
+        transition=transition,
+        outputs=outputs,
+        dependencies=tuple(output_dependencies(transition.outputs or [])),
+        post_processor=PostProcessor.for_outputs(
+            transition.outputs or [], definition.default_post_process_config
+        ),
+    )
+
+
+def available_interfaces(
+    definition: SynthDefinition, state: str
+) -> Tuple[Transition, ...]:
+    # Every transition sharing a trigger with one leaving the state, matching
+    # what the machine reported before plans were compiled.
+    triggers = {
+        transition.trigger
+        for transition in definition.transitions
+        if transition.source in (state, "*")
+    }
+    return tuple(
+        transition
+        for transition in definition.transitions
+        if transition.trigger in triggers
+    )
+
+
+def compile_plan(definition: SynthDefinition) -> SynthPlan:
+    transitions: dict = {}
+    outputs: dict = {}
+    for transition in definition.transitions:
+        transition_plan = compile_transition(definition, transition)
+        for output_plan in transition_plan.outputs:
+            outputs[id(output_plan.definition)] = output_plan
+        # The first transition declared for a trigger is the one executed.
+        transitions.setdefault(transition.trigger, transition_plan)
+
+    states: dict = {}
+    for state in definition.states:
+        states.setdefault(state.name, state)
+
+    return SynthPlan(
+        definition=definition,
+        transitions=MappingProxyType(transitions),
+        states=MappingProxyType(states),
+        interfaces=MappingProxyType(
+            {name: available_interfaces(definition, name) for name in states}
+        ),
+        outputs=MappingProxyType(outputs),
+        state_table=state_table(definition),
+        state_names=tuple(state.name for state in definition.states),
+        machine_transitions=tuple(
+            MappingProxyType(
+                {
+                    "trigger": transition.trigger,
+                    "source": transition.source,
+                    "dest": transition.dest,
+                }
+            )
+            for transition in definition.transitions
+        ),
+    )
+
+
+def synth_plan_setup(synth_config: dict, prewarm: bool = False) -> SynthPlan:
+    definition = synth_definition_setup(synth_config)
+    if prewarm:
+        prewarm_templates(definition)
+    return compile_plan(definition)
@@ -0,0 +1,98 @@
+import logging
+import os
+from typing import Optional
+from jinja2 import (
+    BaseLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    StrictUndefined,
+    Template,
+    TemplateError,
+)
+
+from synth_machine.synth_definition import SynthDefinition
+
+
+TEMPLATE_CACHE_SIZE = int(os.environ.get("TEMPLATE_CACHE_SIZE", "1024"))
+TEMPLATE_BYTECODE_CACHE = os.environ.get("TEMPLATE_BYTECODE_CACHE")
+
+
+class SourceLoader(BaseLoader):
+    """
+    Treats the template name as its source, so templates are compiled once and
+    then served from the environment's LRU cache.
+    """
+
+    def get_source(self, environment, template):
+        return template, None, lambda: True
+
+
+def create_environment(
+    cache_size: int,
+    bytecode_cache_dir: Optional[str] = None,
+    **options,
+) -> Environment:
+    return Environment(
+        loader=SourceLoader(),
+        undefined=StrictUndefined,
+        cache_size=cache_size,
+        auto_reload=False,
+        bytecode_cache=(
+            FileSystemBytecodeCache(bytecode_cache_dir) if bytecode_cache_dir else None
+        ),
+        **options,
+    )
+
+
+prompt_environment: Environment
+tool_environment: Environment
+
+
+def configure_templates(
+    cache_size: int = TEMPLATE_CACHE_SIZE,
+    bytecode_cache_dir: Optional[str] = TEMPLATE_BYTECODE_CACHE,
+) -> None:
+    """
+    Replace the shared environments, dropping any cached templates.
+    `bytecode_cache_dir` keeps compiled templates on disk across restarts.
+    """
+    global prompt_environment, tool_environment
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+    prompt_environment = create_environment(
+        cache_size, bytecode_cache_dir, trim_blocks=True, lstrip_blocks=True
+    )
+    tool_environment = create_environment(cache_size, bytecode_cache_dir)
+
+
+configure_templates()
+
+
+def get_prompt_template(source: str) -> Template:
+    return prompt_environment.get_template(source)
+
+
+def get_tool_template(source: str) -> Template:
+    return tool_environment.get_template(source)
+
+
+def prewarm_templates(definition: SynthDefinition) -> None:
+    for transition in definition.transitions:
+        for output_definition in transition.outputs or []:
+            sources = [
+                (get_prompt_template, output_definition.prompt),
+                (get_prompt_template, output_definition.system_prompt),
+                (get_prompt_template, output_definition.jinja),
+                (get_prompt_template, output_definition.rag),
+            ] + [
+                (get_tool_template, value)
+                for value in (output_definition.input_name_map or {}).values()
+            ]
+            for load, source in sources:
+                if not source or not isinstance(source, str):
+                    continue
+                try:
+                    load(source)
+                except TemplateError as e:
+                    # Reported when the output runs, as without prewarming.
+                    logging.debug("Template not prewarmed: %s", e)
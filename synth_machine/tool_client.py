@@ -0,0 +1,86 @@
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import httpx
+
+
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "120"))
+TOOL_CONNECT_TIMEOUT = float(os.environ.get("TOOL_CONNECT_TIMEOUT", "10"))
+TOOL_MAX_CONNECTIONS = int(os.environ.get("TOOL_MAX_CONNECTIONS", "100"))
+TOOL_MAX_CONNECTIONS_PER_HOST = int(
+    os.environ.get("TOOL_MAX_CONNECTIONS_PER_HOST", "10")
+)
+
+
+class ToolClient:
+    """
+    Keep-alive HTTP client for tool calls, shared between synths.
+
+    httpx clients and semaphores belong to the event loop they are used on,
+    so one client and set of per-host limits is kept for each running loop.
+    """
+
+    def __init__(
+        self,
+        timeout: float = TOOL_TIMEOUT,
+        connect_timeout: float = TOOL_CONNECT_TIMEOUT,
+        max_connections: int = TOOL_MAX_CONNECTIONS,
+        max_connections_per_host: int = TOOL_MAX_CONNECTIONS_PER_HOST,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.max_connections_per_host = max_connections_per_host
+        self.transport = transport
+        self._clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._host_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.timeout, limits=self.limits, transport=self.transport
+            )
+            self._clients[loop] = client
+        return client
+
+    def host_limit(self, url: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        limits = self._host_limits.setdefault(loop, {})
+        parsed = httpx.URL(url)
+        host = (parsed.scheme, parsed.host, parsed.port)
+        if host not in limits:
+            limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return limits[host]
+
+    @asynccontextmanager
+    async def post(self, url: str, payload: dict) -> AsyncIterator[httpx.Response]:
+        """
+        POST `payload` as JSON, yielding the response before its body is read.
+        """
+        async with self.host_limit(url):
+            async with self.client().stream("POST", url, json=payload) as response:
+                yield response
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        client = self._clients.pop(loop, None)
+        self._host_limits.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+_default_tool_client: Optional[ToolClient] = None
+
+
+def default_tool_client() -> ToolClient:
+    global _default_tool_client
+    if _default_tool_client is None:
+        _default_tool_client = ToolClient()
+    return _default_tool_client
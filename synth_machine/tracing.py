@@ -0,0 +1,101 @@
+import logging
+import os
+import sys
+from typing import Optional, TextIO
+
+from synth_machine.executors import DEBUG
+
+# Trace every Nth streamed token, 0 to trace none.
+TRACE_TOKEN_SAMPLE = int(os.environ.get("TRACE_TOKEN_SAMPLE", "1"))
+
+logger = logging.getLogger("synth_machine.trace")
+
+
+class TraceSink:
+    """
+    Where traced tokens are sent.
+    """
+
+    def enabled(self) -> bool:
+        return True
+
+    def token(self, source: str, index: int, token: str) -> None:
+        raise NotImplementedError
+
+    def end(self, source: str, tokens: int, reason: Optional[str]) -> None:
+        pass
+
+
+class LoggingSink(TraceSink):
+    """
+    Debug records on the `synth_machine.trace` logger, only built when it is
+    enabled for debug.
+    """
+
+    def enabled(self) -> bool:
+        return logger.isEnabledFor(logging.DEBUG)
+
+    def token(self, source: str, index: int, token: str) -> None:
+        logger.debug("%s token %d: %r", source, index, token)
+
+    def end(self, source: str, tokens: int, reason: Optional[str]) -> None:
+        logger.debug("%s stream ended (%s) after %d tokens", source, reason, tokens)
+
+
+class StreamSink(TraceSink):
+    """
+    Tokens written as they arrive, e.g. to follow generations in a terminal.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream
+
+    def token(self, source: str, index: int, token: str) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(token or "")
+        stream.flush()
+
+    def end(self, source: str, tokens: int, reason: Optional[str]) -> None:
+        (self.stream or sys.stdout).write("\n")
+
+
+class TokenTrace:
+    def __init__(self, source: str, sink: TraceSink, sample: int) -> None:
+        self.source = source
+        self.sink = sink
+        self.sample = sample
+        self.tokens = 0
+
+    def token(self, token: str) -> None:
+        if self.tokens % self.sample == 0:
+            self.sink.token(self.source, self.tokens, token)
+        self.tokens += 1
+
+    def end(self, reason: Optional[str] = None) -> None:
+        self.sink.end(self.source, self.tokens, reason)
+
+
+_sink: TraceSink = StreamSink() if DEBUG else LoggingSink()
+_sample = TRACE_TOKEN_SAMPLE
+
+
+def configure_tracing(
+    sink: Optional[TraceSink] = None, sample: int = TRACE_TOKEN_SAMPLE
+) -> None:
+    """
+    Send traced tokens to `sink`, by default stdout with `DEBUG` set and
+    debug logs otherwise, tracing every `sample`th token.
+    """
+    global _sink, _sample
+    _sink = sink or (StreamSink() if DEBUG else LoggingSink())
+    _sample = sample
+
+
+def stream_trace(source: str) -> Optional[TokenTrace]:
+    """
+    A trace for one token stream, or None when tracing is off. Whether it is
+    on is checked once, rather than for every token.
+    """
+    if _sample <= 0 or not _sink.enabled():
+        return None
+    return TokenTrace(source, _sink, _sample)
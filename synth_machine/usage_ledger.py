@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+Usage = Tuple[float, str, str, str, str, float, float]
+
+
+class UsageLedger:
+    """
+    Write behind record of token usage in sqlite.
+
+    `record` only queues a row, rows are written by a background task every
+    `flush_interval` seconds or once `max_pending` are queued. Rows already
+    written survive restarts, call `close` on shutdown to write the rest.
+    """
+
+    def __init__(
+        self, path: str, flush_interval: float = 1.0, max_pending: int = 1000
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: List[Usage] = []
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage "
+                "(recorded REAL NOT NULL, user TEXT NOT NULL, session_id TEXT NOT NULL, "
+                "kind TEXT NOT NULL, name TEXT NOT NULL, "
+                "input_tokens REAL NOT NULL, output_tokens REAL NOT NULL)"
+            )
+        self._flusher: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._closing = False
+
+    def record(
+        self,
+        user: str,
+        session_id: str,
+        kind: str,
+        name: str,
+        input_tokens: float = 0,
+        output_tokens: float = 0,
+    ) -> None:
+        self.pending.append(
+            (time.time(), user, session_id, kind, name, input_tokens, output_tokens)
+        )
+        if self._flusher is None or self._flusher.done():
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+        if len(self.pending) >= self.max_pending:
+            self._wake.set()  # type: ignore
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)  # type: ignore
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()  # type: ignore
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to write usage ledger: {e}")
+
+    def _write(self, rows: List[Usage]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    async def flush(self) -> None:
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception:
+            # Not written, kept for the next flush. A cancelled flush isn't
+            # retried, its write still completes in the worker thread.
+            self.pending[:0] = rows
+            raise
+
+    def _totals(
+        self, user: Optional[str], session_id: Optional[str], kind: Optional[str]
+    ) -> dict:
+        query = "SELECT COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0) FROM usage WHERE 1"
+        params = []
+        if kind is None:
+            query += " AND kind != 'cached'"
+        else:
+            query += " AND kind = ?"
+            params.append(kind)
+        if user is not None:
+            query += " AND user = ?"
+            params.append(user)
+        if session_id is not None:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        with self._lock:
+            input_tokens, output_tokens = self._connection.execute(
+                query, params
+            ).fetchone()
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    async def totals(
+        self,
+        user: Optional[str] = None,
+        session_id: Optional[str] = None,
+        kind: Optional[str] = None,
+    ) -> dict:
+        """
+        Written token usage, for a user or session when given. Generations
+        replayed from the response cache are only counted with `kind="cached"`.
+        """
+        return await asyncio.to_thread(self._totals, user, session_id, kind)
+
+    async def close(self) -> None:
+        # Let a write in progress finish rather than cancelling it.
+        self._closing = True
+        if self._flusher is not None:
+            self._wake.set()  # type: ignore
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+        with self._lock:
+            self._connection.close()
@@ -1,11 +1,151 @@
+import copy
+import importlib
+import inspect
+import json
 import logging
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Optional, Sequence, Tuple
 
+from synth_machine.memory import MemoryStore, apply_changes
+from synth_machine.offload import offload
 
-def udf(func):
-    def wrapper(*args, **kwargs):
-        logging.debug(f"Starting user defined function: {func.__name__}")
-        result = func(*args, **kwargs)
-        logging.debug(f"User defined function: {func.__name__} complete")
-        return result
+_MISSING = object()
 
-    return wrapper
+
+class UDFCache:
+    """
+    LRU of results for a user defined function, keyed by the memory values
+    it declares it reads.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._results: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        if key not in self._results:
+            return _MISSING
+        self._results.move_to_end(key)
+        # Results are stored in memory, which may be changed in place.
+        return copy.deepcopy(self._results[key])
+
+    def put(self, key: str, result: Any) -> None:
+        self._results[key] = copy.deepcopy(result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+
+def udf(
+    func: Optional[Callable] = None,
+    *,
+    reads: Optional[Sequence[str]] = None,
+    cache_size: int = 128,
+    executor: Optional[str] = None,
+):
+    """
+    Mark a function as a user defined function, `@udf` or with options:
+
+    - `reads`: memory keys the function reads. Results are memoized on their
+      values, up to `cache_size` of them, and a process pool only receives
+      these keys.
+    - `executor`: "thread" or "process" to always run off the event loop. A
+      process pool receives a copy of memory, so changes to it are lost, and
+      the function must be defined at module level.
+
+    `async def` functions are awaited on the event loop.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        if executor not in (None, "thread", "process"):
+            raise ValueError(f"Unknown UDF executor: {executor}")
+        if executor and inspect.iscoroutinefunction(func):
+            raise ValueError(f"Async UDF {func.__name__} can't use an executor")
+        if executor == "process" and "<locals>" in func.__qualname__:
+            raise ValueError(
+                f"UDF {func.__name__} must be defined at module level to run in a process"
+            )
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):  # type: ignore
+                logging.debug("Starting user defined function: %s", func.__name__)
+                result = await func(*args, **kwargs)
+                logging.debug("User defined function: %s complete", func.__name__)
+                return result
+
+        else:
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                logging.debug("Starting user defined function: %s", func.__name__)
+                result = func(*args, **kwargs)
+                logging.debug("User defined function: %s complete", func.__name__)
+                return result
+
+        wrapper.reads = tuple(reads) if reads is not None else None  # type: ignore
+        wrapper.executor = executor  # type: ignore
+        wrapper.cache = (  # type: ignore
+            UDFCache(cache_size) if reads is not None and cache_size else None
+        )
+        return wrapper
+
+    return decorate(func) if func is not None else decorate
+
+
+def _call_in_process(module: str, qualname: str, memory: dict) -> Any:
+    # Decorated functions can't be pickled by reference, find them by name.
+    function: Any = importlib.import_module(module)
+    for name in qualname.split("."):
+        function = getattr(function, name)
+    return function.__wrapped__(memory)
+
+
+def memo_key(memory: dict, reads: Sequence[str]) -> str:
+    return json.dumps([memory.get(key) for key in reads], sort_keys=True, default=str)
+
+
+async def run_udf(function: Callable, memory: dict) -> Tuple[Any, bool]:
+    """
+    Run a user defined function on memory, returns the result and whether it
+    came from the function's cache.
+    """
+    reads = getattr(function, "reads", None)
+    cache: Optional[UDFCache] = getattr(function, "cache", None)
+    if cache is not None:
+        key = memo_key(memory, reads)  # type: ignore
+        result = cache.get(key)
+        if result is not _MISSING:
+            return result, True
+
+    executor = getattr(function, "executor", None)
+    # Values in memory are shared with events already sent, and may change
+    # while an offloaded function runs.
+    base = memory.snapshot() if isinstance(memory, MemoryStore) else dict(memory)
+    if executor == "process":
+        result = await offload(
+            "udf",
+            None,
+            _call_in_process,
+            function.__module__,
+            function.__qualname__,
+            {key: base.get(key) for key in reads} if reads is not None else base,
+            executor=executor,
+        )
+    else:
+        # Functions may change their copy of memory in place, the changes are
+        # applied to memory once they return.
+        working = copy.deepcopy(dict(base))
+        if inspect.iscoroutinefunction(function):
+            result = await function(working)
+        else:
+            result = await offload(
+                "udf", working, function, working, shared_memory=True, executor=executor
+            )
+        apply_changes(memory, base, working)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result, False
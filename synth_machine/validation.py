@@ -0,0 +1,88 @@
+import json
+import os
+from functools import lru_cache
+from typing import Any, Callable, Optional
+from jsonschema.exceptions import ValidationError, best_match  # type: ignore
+from jsonschema.validators import validator_for  # type: ignore
+
+
+JSONSCHEMA_PRELUDE = {"$schema": "http://json-schema.org/draft-04/schema#"}
+# "jsonschema" or "fastjsonschema", the latter generates Python code for each
+# schema which is considerably faster on large outputs.
+SCHEMA_VALIDATOR = os.environ.get("SCHEMA_VALIDATOR", "jsonschema")
+
+
+class SchemaValidator:
+    """
+    Validates outputs against a schema, compiled on first use and then reused.
+    Failures raise `jsonschema.exceptions.ValidationError` whichever backend
+    is used.
+    """
+
+    def __init__(self, schema: dict, backend: str = SCHEMA_VALIDATOR) -> None:
+        self.schema = JSONSCHEMA_PRELUDE | schema
+        self.backend = backend
+        self._validate: Optional[Callable[[Any], None]] = None
+
+    def __reduce__(self):
+        # Compiled validators can't be pickled, recompile (once) when loaded.
+        return (schema_validator, (self.schema, self.backend))
+
+    def validate(self, instance: Any) -> None:
+        if self._validate is None:
+            self._validate = self._compile()
+        self._validate(instance)
+
+    def _compile(self) -> Callable[[Any], None]:
+        match self.backend:
+            case "fastjsonschema":
+                return self._compile_fastjsonschema()
+            case "jsonschema":
+                return self._compile_jsonschema()
+            case _:
+                raise ValueError(f"Unknown schema validator: {self.backend}")
+
+    def _compile_jsonschema(self) -> Callable[[Any], None]:
+        cls = validator_for(self.schema)
+        cls.check_schema(self.schema)
+        validator = cls(self.schema)
+
+        def validate(instance: Any) -> None:
+            # Same error selection as `jsonschema.validate`.
+            error = best_match(validator.iter_errors(instance))
+            if error is not None:
+                raise error
+
+        return validate
+
+    def _compile_fastjsonschema(self) -> Callable[[Any], None]:
+        try:
+            import fastjsonschema
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "Please install synth_machine with extra 'fastjsonschema'"
+            )
+        compiled = fastjsonschema.compile(self.schema, use_default=False)
+
+        def validate(instance: Any) -> None:
+            try:
+                compiled(instance)
+            except fastjsonschema.JsonSchemaValueException as e:
+                raise ValidationError(e.message)
+
+        return validate
+
+
+@lru_cache(maxsize=256)
+def _schema_validator(schema_json: str, backend: str) -> SchemaValidator:
+    return SchemaValidator(json.loads(schema_json), backend)
+
+
+def schema_validator(schema: dict, backend: Optional[str] = None) -> SchemaValidator:
+    """
+    Shared validator for a schema, so identical schemas across outputs and
+    synths are only compiled once.
+    """
+    return _schema_validator(
+        json.dumps(schema, sort_keys=True), backend or SCHEMA_VALIDATOR
+    )
@@ -0,0 +1,38 @@
+import logging
+import threading
+from typing import Iterable, Optional
+
+from synth_machine.executor_factory import available_executors, get_executor
+from synth_machine.machine_config import get_encoding
+from synth_machine.runners import default_store
+
+
+def preload(executors: Optional[Iterable[str]] = None) -> None:
+    get_encoding()
+    default_store()
+    for name in available_executors() if executors is None else executors:
+        get_executor(name).warmup()
+
+
+def warmup(
+    executors: Optional[Iterable[str]] = None, background: bool = True
+) -> Optional[threading.Thread]:
+    """
+    Load the tokenizer, default store and executors (all with an API key set,
+    or only `executors`) that are otherwise created on first use.
+
+    In the background by default, returning the thread to join if needed.
+    """
+    if not background:
+        preload(executors)
+        return None
+
+    def run() -> None:
+        try:
+            preload(executors)
+        except Exception as e:
+            logging.error(f"Warmup failed: {e}")
+
+    thread = threading.Thread(target=run, name="synth_machine-warmup", daemon=True)
+    thread.start()
+    return thread
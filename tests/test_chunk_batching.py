@@ -0,0 +1,120 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from synth_machine.chunk_batching import ChunkBatching, ChunkBuffer
+from synth_machine.machine import Synth
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from tests.test_mocks import MockStreamingJsonExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+class ChunkBufferTest(TestCase):
+    def test_limits(self):
+        batch = ChunkBuffer(ChunkBatching(max_bytes=4, max_interval_ms=1000))
+        self.assertFalse(batch)
+        self.assertFalse(batch.add("ab", "output", 1))
+        self.assertTrue(batch)
+        # Bytes, not characters.
+        self.assertTrue(batch.add("é", "output", 1))
+        self.assertEqual(batch.flush(), ("abé", "output", 2))
+        self.assertFalse(batch)
+
+        batch = ChunkBuffer(ChunkBatching(max_tokens=2, max_interval_ms=1000))
+        self.assertFalse(batch.add("a", "output", None))
+        self.assertTrue(batch.add("b", "output", None))
+        self.assertEqual(batch.flush(), ("ab", "output", 0))
+
+    def test_interval(self):
+        batch = ChunkBuffer(ChunkBatching(max_interval_ms=50))
+        with patch("synth_machine.chunk_batching.time.monotonic", return_value=0):
+            self.assertFalse(batch.add("a", "output", 1))
+        with patch("synth_machine.chunk_batching.time.monotonic", return_value=0.05):
+            self.assertTrue(batch.add("b", "output", 1))
+
+
+class ChunkBatchingSynthTest(SynthMachineTest):
+    def synth(self, **options) -> Synth:
+        return Synth(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": [
+                    {
+                        "trigger": "1",
+                        "source": "theme",
+                        "dest": "select",
+                        "outputs": [
+                            {
+                                "key": "output",
+                                "prompt": "{{a}}",
+                                "schema": {"type": "object"},
+                            }
+                        ],
+                    }
+                ],
+            },
+            memory={"a": "a"},
+            **options,
+        )
+
+    async def chunks(self, synth: Synth, **options) -> list:
+        async def prompt_setup(**kwargs):
+            return (
+                SynthConfig(
+                    executor=MockStreamingJsonExecutor(),
+                    model_config=ModelConfig(executor="mock"),
+                    system_prompt="",
+                    user_prompt="",
+                ),
+                None,
+            )
+
+        with patch("synth_machine.machine.prompt_setup", prompt_setup):
+            return [
+                event
+                async for event in synth.streaming_trigger("1", **options)
+                if event[0] == "CHUNK"
+            ]
+
+    async def test_batched_events(self):
+        synth = self.synth(
+            chunk_batching=ChunkBatching(max_tokens=3, max_interval_ms=1000)
+        )
+        chunks = await self.chunks(synth)
+        self.assertEqual(
+            [(chunk[2], chunk[4], chunk[5]) for chunk in chunks],
+            [
+                ("", 5, "input"),
+                ('{"items": [{"n": 1}, {"n": 2}', 3, "output"),
+                ('], "done": true}', 2, "output"),
+            ],
+        )
+        self.assertEqual(
+            synth.memory["output"], {"items": [{"n": 1}, {"n": 2}], "done": True}
+        )
+
+    async def test_per_trigger(self):
+        self.assertEqual(len(await self.chunks(self.synth())), 6)
+        synth = self.synth()
+        batched = await self.chunks(
+            synth, chunk_batching=ChunkBatching(max_interval_ms=1000)
+        )
+        self.assertEqual(len(batched), 2)
+        self.assertEqual(batched[1][4], 5)
+        # Only applies to that trigger, the synth's default is never changed
+        # so overlapping triggers aren't affected.
+        self.assertIsNone(synth.chunk_batching)
+
+    async def test_overlapping_triggers(self):
+        synth = self.synth()
+        with patch(
+            "synth_machine.machine.prompt_setup",
+            self.mock_streaming_json_prompt_setup,
+        ):
+            batched = synth.streaming_trigger(
+                "1", chunk_batching=ChunkBatching(max_interval_ms=1000)
+            )
+            await anext(batched)
+            self.assertIsNone(synth.chunk_batching)
+            await batched.aclose()
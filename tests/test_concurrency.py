@@ -0,0 +1,277 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, main
+from unittest.mock import patch
+
+from synth_machine.concurrency import StreamCoalescer, merge_streams
+from synth_machine.machine import Synth
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from tests.test_mocks import MockDelayedExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+def delayed_stream(values, delay, active=None):
+    async def stream():
+        if active is not None:
+            active.append(1)
+        for value in values:
+            await asyncio.sleep(delay)
+            yield value
+        if active is not None:
+            active.pop()
+
+    return stream
+
+
+class MergeStreamsTest(IsolatedAsyncioTestCase):
+    async def test_merge_streams(self):
+        events = [
+            event
+            async for event in merge_streams(
+                [
+                    delayed_stream(["a1", "a2"], 0.03),
+                    delayed_stream(["b1", "b2"], 0.01),
+                ],
+                max_concurrency=2,
+            )
+        ]
+        self.assertEqual(events[0], (1, "b1"))
+        self.assertCountEqual(events, [(0, "a1"), (0, "a2"), (1, "b1"), (1, "b2")])
+
+    async def test_merge_streams_bounded(self):
+        active = []
+        peak = 0
+        streams = [delayed_stream([i], 0.01, active) for i in range(6)]
+        async for _ in merge_streams(streams, max_concurrency=2):
+            peak = max(peak, len(active))
+        self.assertLessEqual(peak, 2)
+
+    async def test_merge_streams_error(self):
+        async def failing():
+            yield "ok"
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            async for _ in merge_streams([failing, delayed_stream([1], 1)], 2):
+                pass
+
+
+class StreamCoalescerTest(IsolatedAsyncioTestCase):
+    async def collect(self, stream) -> list:
+        return [item async for item in stream]
+
+    async def test_concurrent_requests_share_stream(self):
+        coalescer = StreamCoalescer()
+        started = []
+
+        def start():
+            started.append(1)
+            return delayed_stream([1, 2, 3], 0.01)()
+
+        first = asyncio.create_task(self.collect(coalescer.stream("a", start)))
+        await asyncio.sleep(0.015)
+        # Joins after the first item, still sees the whole stream.
+        second = asyncio.create_task(self.collect(coalescer.stream("a", start)))
+        other = asyncio.create_task(self.collect(coalescer.stream("b", start)))
+        self.assertEqual(await asyncio.gather(first, second, other), [[1, 2, 3]] * 3)
+        self.assertEqual(len(started), 2)
+        self.assertEqual((coalescer.started, coalescer.joined), (2, 1))
+
+        # Completed streams are not reused.
+        await self.collect(coalescer.stream("a", start))
+        self.assertEqual(len(started), 3)
+
+    async def test_error_reaches_every_subscriber(self):
+        async def failing():
+            yield "ok"
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        coalescer = StreamCoalescer()
+        results = await asyncio.gather(
+            self.collect(coalescer.stream("a", failing)),
+            self.collect(coalescer.stream("a", failing)),
+            return_exceptions=True,
+        )
+        self.assertEqual([type(r) for r in results], [ValueError, ValueError])
+
+    async def test_abandoned_stream_is_cancelled(self):
+        closed = []
+
+        async def stream():
+            try:
+                yield 1
+                await asyncio.sleep(10)
+                yield 2
+            finally:
+                closed.append(1)
+
+        coalescer = StreamCoalescer()
+        subscriber = coalescer.stream("a", stream)
+        self.assertEqual(await anext(subscriber), 1)
+        await subscriber.aclose()
+        await asyncio.sleep(0)
+        self.assertEqual(closed, [1])
+        # A new request starts again rather than joining the cancelled stream.
+        self.assertEqual(
+            await self.collect(coalescer.stream("a", delayed_stream([3], 0))), [3]
+        )
+
+    async def test_unstarted_subscriber_keeps_stream(self):
+        coalescer = StreamCoalescer()
+        first = coalescer.stream("a", delayed_stream([1, 2], 0.01))
+        second = coalescer.stream("a", delayed_stream([1, 2], 0.01))
+        self.assertEqual(await anext(first), 1)
+        await first.aclose()
+        # Not read from yet when the first subscriber left, still complete.
+        self.assertEqual(await self.collect(second), [1, 2])
+
+    async def test_cancelled_stream_raises(self):
+        coalescer = StreamCoalescer()
+        subscriber = coalescer.stream("a", delayed_stream([1, 2], 0.01))
+        self.assertEqual(await anext(subscriber), 1)
+        coalescer._flights[asyncio.get_running_loop()]["a"]._task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await self.collect(subscriber)
+
+
+class CountingSynth(Synth):
+    async def record_prompt_token_usage(self, user, session_id, synth_config, **tokens):
+        self.usage = tokens
+        return await super().record_prompt_token_usage(
+            user, session_id, synth_config, **tokens
+        )
+
+
+class CoalescedSynthTest(SynthMachineTest):
+    async def test_identical_generations_coalesced(self):
+        generations = []
+
+        class CountingExecutor(MockDelayedExecutor):
+            def generate(self, *args, **kwargs):
+                generations.append(1)
+                return super().generate(*args, **kwargs)
+
+        async def prompt_setup(**kwargs):
+            return (
+                SynthConfig(
+                    executor=CountingExecutor(token="hello", delay=0.02),
+                    model_config=ModelConfig(executor="mock"),
+                    system_prompt="",
+                    user_prompt="",
+                ),
+                None,
+            )
+
+        coalescer = StreamCoalescer()
+        synths = [
+            CountingSynth(
+                config={
+                    "initial_state": "theme",
+                    "states": self.states,
+                    "transitions": [
+                        {
+                            "trigger": "1",
+                            "source": "theme",
+                            "dest": "select",
+                            "outputs": [
+                                {
+                                    "key": "output",
+                                    "prompt": "hello",
+                                    "schema": {"type": "string"},
+                                }
+                            ],
+                        }
+                    ],
+                },
+                coalescer=coalescer,
+                session_id=str(session),
+            )
+            for session in range(3)
+        ]
+        with patch("synth_machine.machine.prompt_setup", prompt_setup):
+            await asyncio.gather(*[synth.trigger("1") for synth in synths])
+
+        self.assertEqual(len(generations), 1)
+        for synth in synths:
+            self.assertEqual(synth.memory["output"], "hello")
+            self.assertEqual(synth.usage, {"input_tokens": 5, "output_tokens": 1})  # type: ignore
+
+
+class ConcurrentLoopTest(SynthMachineTest):
+    async def mock_delayed_prompt_setup(self, **kwargs):
+        item = kwargs["inputs"]["f"]["a"]
+        return (
+            SynthConfig(
+                executor=MockDelayedExecutor(
+                    token=item, delay={"a": 0.06, "b": 0.03, "c": 0.0}[item]
+                ),
+                model_config=ModelConfig(executor="mock"),
+                system_prompt="",
+                user_prompt="",
+            ),
+            None,
+        )
+
+    async def test_concurrent_loop_keeps_input_order(self):
+        loop_transitions = self.helper.get_transistions("loop_transistions")
+        loop_transitions[0]["outputs"][0]["loop"]["max_concurrency"] = 3
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=loop_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        chunks = []
+        with patch(
+            "synth_machine.machine.prompt_setup", self.mock_delayed_prompt_setup
+        ):
+            async for event in synth.streaming_trigger(loop_transitions[0]["trigger"]):
+                if event and event[0] == "CHUNK" and event[2]:
+                    chunks.append((event[2], event[-1]))
+        # Items finish in reverse order, but memory keeps the loop order.
+        self.assertEqual(chunks, [("c", 2), ("b", 1), ("a", 0)])
+        self.assertEqual(synth.memory["loop"], ["a", "b", "c"])
+        self.assertEqual(synth.current_state(), self.states[1]["name"])
+
+    async def test_concurrent_loop_failure_drops_later_items(self):
+        loop_transitions = self.helper.get_transistions("loop_transistions")
+        loop_transitions[0]["outputs"][0]["loop"]["max_concurrency"] = 3
+
+        async def failing_prompt_setup(**kwargs):
+            item = kwargs["inputs"]["f"]["a"]
+            if item == "b":
+                await asyncio.sleep(0.03)
+                return None, "b failed"
+            return (
+                SynthConfig(
+                    executor=MockDelayedExecutor(token=item, delay=0),
+                    model_config=ModelConfig(executor="mock"),
+                    system_prompt="",
+                    user_prompt="",
+                ),
+                None,
+            )
+
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=loop_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        with patch("synth_machine.machine.prompt_setup", failing_prompt_setup):
+            events = [
+                event
+                async for event in synth.streaming_trigger(
+                    loop_transitions[0]["trigger"]
+                )
+            ]
+        failure = events[-1]
+        self.assertEqual(failure.kind, "FAILED")
+        self.assertEqual(failure.loop_index, 1)
+        # "c" completed before "b" failed, a sequential loop never reached it.
+        self.assertEqual(synth.memory["loop"], ["a"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from synth_machine.cost import UsageBatch
+from synth_machine.machine import Synth
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from synth_machine.usage_ledger import UsageLedger
+from tests.test_mocks import MockStreamingJsonExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+class UsageBatchTest(TestCase):
+    def test_window(self):
+        usage = UsageBatch(max_tokens=3)
+        self.assertFalse(usage)
+        self.assertFalse(usage.add("input", 2))
+        self.assertFalse(usage.add("output", None))
+        self.assertTrue(usage.add("output", 1))
+        self.assertEqual(usage.flush(), [("input", 2, 1), ("output", 1, 2)])
+        self.assertFalse(usage)
+        # Reported once per stream.
+        usage = UsageBatch()
+        self.assertFalse(usage.add("output", 1000))
+
+
+class UsageLedgerTest(IsolatedAsyncioTestCase):
+    async def test_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "usage.db")
+            ledger = UsageLedger(path, flush_interval=60)
+            ledger.record("user", "a", "prompt", "llm", input_tokens=5, output_tokens=2)
+            ledger.record("user", "b", "tool", "tool", input_tokens=1)
+            # Written behind, nothing is stored yet.
+            self.assertEqual(
+                await ledger.totals(), {"input_tokens": 0, "output_tokens": 0}
+            )
+            await ledger.close()
+
+            ledger = UsageLedger(path)
+            self.assertEqual(
+                await ledger.totals(user="user"),
+                {"input_tokens": 6, "output_tokens": 2},
+            )
+            self.assertEqual(
+                await ledger.totals(session_id="b"),
+                {"input_tokens": 1, "output_tokens": 0},
+            )
+            await ledger.close()
+
+    async def test_flushes_when_full(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ledger = UsageLedger(
+                os.path.join(directory, "usage.db"), flush_interval=60, max_pending=2
+            )
+            ledger.record("user", "a", "prompt", "llm", output_tokens=1)
+            ledger.record("user", "a", "prompt", "llm", output_tokens=1)
+            for _ in range(100):
+                if not ledger.pending:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual((await ledger.totals())["output_tokens"], 2)
+            await ledger.close()
+
+    async def test_close_during_write(self):
+        class SlowLedger(UsageLedger):
+            def _write(self, rows):
+                time.sleep(0.05)
+                super()._write(rows)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "usage.db")
+            ledger = SlowLedger(path, flush_interval=60, max_pending=1)
+            ledger.record("user", "a", "prompt", "llm", output_tokens=1)
+            await asyncio.sleep(0.01)
+            # Waits for the write in progress, which isn't written again.
+            await ledger.close()
+            ledger = UsageLedger(path)
+            self.assertEqual((await ledger.totals())["output_tokens"], 1)
+            await ledger.close()
+
+
+class CountingSynth(Synth):
+    chunk_costs = 0
+    batches: list = []
+
+    async def calculate_chunk_cost(self, stage, synth_config, num_tokens):
+        self.chunk_costs += 1
+        return num_tokens * 2
+
+    async def record_usage_batch(self, stage, synth_config, num_tokens, chunks):
+        self.batches = self.batches + [(stage, num_tokens, chunks)]
+        return await super().record_usage_batch(stage, synth_config, num_tokens, chunks)
+
+    async def record_prompt_token_usage(self, user, session_id, synth_config, **tokens):
+        self.usage = tokens
+        return await super().record_prompt_token_usage(
+            user, session_id, synth_config, **tokens
+        )
+
+
+class BatchedCostSynthTest(SynthMachineTest):
+    def synth(self, **options) -> CountingSynth:
+        return CountingSynth(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": [
+                    {
+                        "trigger": "1",
+                        "source": "theme",
+                        "dest": "select",
+                        "outputs": [
+                            {
+                                "key": "output",
+                                "prompt": "{{a}}",
+                                "schema": {"type": "object"},
+                            }
+                        ],
+                    }
+                ],
+            },
+            memory={"a": "a"},
+            user="user",
+            **options,
+        )
+
+    async def run_synth(self, synth: Synth) -> list:
+        async def prompt_setup(**kwargs):
+            return (
+                SynthConfig(
+                    executor=MockStreamingJsonExecutor(),
+                    model_config=ModelConfig(executor="mock", llm_name="llm"),
+                    system_prompt="",
+                    user_prompt="",
+                ),
+                None,
+            )
+
+        with patch("synth_machine.machine.prompt_setup", prompt_setup):
+            return [event async for event in synth.streaming_trigger("1")]
+
+    async def test_per_chunk(self):
+        synth = self.synth()
+        events = await self.run_synth(synth)
+        self.assertEqual(synth.chunk_costs, 6)
+        self.assertEqual(synth.usage, {"input_tokens": 10, "output_tokens": 10})
+        self.assertFalse([e for e in events if e[0] == "USAGE"])
+
+    async def test_batched(self):
+        synth = self.synth(usage_batch_tokens=6)
+        events = await self.run_synth(synth)
+        self.assertEqual(
+            [e for e in events if e[0] == "USAGE"],
+            [
+                ["USAGE", "output", 10, 5, "input", "llm"],
+                ["USAGE", "output", 2, 1, "output", "llm"],
+                ["USAGE", "output", 8, 4, "output", "llm"],
+            ],
+        )
+        self.assertEqual(
+            synth.batches, [("input", 5, 1), ("output", 1, 1), ("output", 4, 4)]
+        )
+        self.assertTrue(all(e[3] is None for e in events if e[0] == "CHUNK"))
+        self.assertEqual(synth.usage, {"input_tokens": 10, "output_tokens": 10})
+        self.assertEqual(synth.memory["output"]["done"], True)
+
+    async def test_ledger(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ledger = UsageLedger(os.path.join(directory, "usage.db"))
+            synth = self.synth(usage_batch_tokens=0, usage_ledger=ledger)
+            await self.run_synth(synth)
+            self.assertEqual(synth.chunk_costs, 2)
+            await ledger.close()
+            ledger = UsageLedger(os.path.join(directory, "usage.db"))
+            self.assertEqual(
+                await ledger.totals(user="user"),
+                {"input_tokens": 10, "output_tokens": 10},
+            )
+            await ledger.close()
@@ -0,0 +1,98 @@
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from synth_machine.dependencies import output_dependencies, output_reads
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from synth_machine.synth_definition import Output
+from tests.test_mocks import MockDelayedExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+class OutputDependenciesTest(TestCase):
+    def test_output_reads(self):
+        self.assertEqual(
+            output_reads(
+                Output(
+                    key="out",
+                    prompt="{{ a }} {% for x in items %}{{ x }}{% endfor %}",
+                    system_prompt="{{ f }}",
+                    schema={"type": "string"},
+                    loop={"matrix": [{"f": "data"}]},
+                )
+            ),
+            {"a", "items", "data"},
+        )
+        self.assertEqual(
+            output_reads(Output(key="out", append=["a", "b"], jq=".c")),
+            {"a", "b", "c"},
+        )
+        self.assertIsNone(output_reads(Output(key="out", udf="anything")))
+
+    def test_output_dependencies(self):
+        outputs = [
+            Output(key="first", jinja="{{ a }}"),
+            Output(key="second", jinja="{{ b }}"),
+            Output(key="third", jinja="{{ first }}"),
+            Output(key="a", jinja="{{ b }}"),
+            Output(key="flat", jq=".second"),
+            Output(key="fourth", jinja="{{ flat }}"),
+            Output(key="last", udf="anything"),
+        ]
+        self.assertEqual(
+            output_dependencies(outputs),
+            [
+                frozenset(),
+                frozenset(),
+                frozenset({0}),
+                # Must not overwrite `a` before `first` has read it.
+                frozenset({0}),
+                # `second` changes the jq output, so it also writes `flat`.
+                frozenset({1}),
+                frozenset({1, 4}),
+                frozenset({0, 1, 2, 3, 4, 5}),
+            ],
+        )
+
+
+class ConcurrentOutputsTest(SynthMachineTest):
+    async def mock_delayed_prompt_setup(self, **kwargs):
+        key = kwargs["output_definition"].key
+        return (
+            SynthConfig(
+                executor=MockDelayedExecutor(
+                    token=f"{key}:{kwargs['inputs'].get('first')}",
+                    delay={"first": 0.05, "second": 0.01, "third": 0.0}[key],
+                ),
+                model_config=ModelConfig(executor="mock"),
+                system_prompt="",
+                user_prompt="",
+            ),
+            None,
+        )
+
+    async def test_independent_outputs_run_concurrently(self):
+        dag_transitions = self.helper.get_transistions("dag_transitions")
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=dag_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        completed = []
+        with patch(
+            "synth_machine.machine.prompt_setup", self.mock_delayed_prompt_setup
+        ):
+            async for event in synth.streaming_trigger(dag_transitions[0]["trigger"]):
+                if event and event[0] == "OUTPUT_VALIDATION_SUCCEEDED":
+                    completed.append(event[1])
+        self.assertEqual(completed, ["second", "first", "third"])
+        self.assertEqual(synth.memory["first"], "first:None")
+        self.assertEqual(synth.memory["second"], "second:None")
+        # `third` waited for `first` to be saved before reading it.
+        self.assertEqual(synth.memory["third"], "third:first:None")
+        self.assertEqual(synth.current_state(), self.states[1]["name"])
+
+
+if __name__ == "__main__":
+    main()
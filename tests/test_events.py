@@ -0,0 +1,113 @@
+import importlib.util
+import json
+import pickle
+from unittest import TestCase, skipUnless
+
+from synth_machine.events import (
+    ChunkEvent,
+    Event,
+    FailureEvent,
+    KeyEvent,
+    MachineUpdateEvent,
+    encode_event,
+    encode_events,
+)
+from tests.test_synth_machine import SynthMachineTest
+
+
+class EventTest(TestCase):
+    def test_list_view(self):
+        event = ChunkEvent("key", "token", 1, 1, "output", "llm")
+        self.assertEqual(event, ["CHUNK", "key", "token", 1, 1, "output", "llm"])
+        self.assertEqual(["CHUNK", "key", "token", 1, 1, "output", "llm"], event)
+        self.assertEqual(event[0], "CHUNK")
+        self.assertEqual(event[-1], "llm")
+        self.assertEqual(len(event), 7)
+        kind, key, *_ = event
+        self.assertEqual((kind, key), ("CHUNK", "key"))
+        self.assertIn(
+            ["OUTPUT_COMPLETED", "key"], [KeyEvent("OUTPUT_COMPLETED", "key")]
+        )
+        self.assertNotEqual(event, ["CHUNK", "key"])
+
+        self.assertIsNone(event.loop_index)
+        event.tagged(2)
+        self.assertEqual(event[-1], 2)
+        self.assertEqual(event.loop_index, 2)
+        self.assertEqual(len(event), 8)
+        self.assertEqual(
+            json.dumps(KeyEvent("OUTPUT_COMPLETED", "k")), '["OUTPUT_COMPLETED", "k"]'
+        )
+
+    def test_failure(self):
+        self.assertEqual(
+            FailureEvent("OUTPUT_VALIDATION_FAILED", "key"),
+            ["OUTPUT_VALIDATION_FAILED", "key"],
+        )
+        self.assertEqual(
+            FailureEvent("FAILED", "key", "error"), ["FAILED", "key", "error"]
+        )
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            KeyEvent("OUTPUT_COMPLETED", "key").other = 1  # type: ignore
+
+    def test_pickle(self):
+        event = FailureEvent("FAILED", "key", "error").tagged(1)
+        loaded = pickle.loads(pickle.dumps(event))
+        self.assertIsInstance(loaded, FailureEvent)
+        self.assertEqual(loaded, ["FAILED", "key", "error", 1])
+
+    def test_encode_json(self):
+        events = [
+            ChunkEvent("key", "token", 1, 1, "output", "llm"),
+            ["INPUTS", {"a": (1, 2)}],
+        ]
+        lines = encode_events(events, encoder="json").splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [
+                ["CHUNK", "key", "token", 1, 1, "output", "llm"],
+                ["INPUTS", {"a": [1, 2]}],
+            ],
+        )
+        with self.assertRaises(ValueError):
+            encode_event(events[0], encoder="xml")
+
+    @skipUnless(importlib.util.find_spec("orjson"), "orjson is not installed")
+    def test_encode_orjson(self):
+        event = KeyEvent("OUTPUT_COMPLETED", "key")
+        self.assertEqual(
+            encode_event(event, encoder="orjson"), encode_event(event, encoder="json")
+        )
+
+
+class SynthEventsTest(SynthMachineTest):
+    async def test_typed_events(self):
+        udf_transitions = self.helper.get_transistions("udf_transitions")
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=udf_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        synth.user_defined_functions = {
+            "duplicate_string": lambda memory: memory["test_string"] * 2
+        }
+        events = [
+            event
+            async for event in synth.streaming_trigger(
+                "1", params={"test_string": "hello"}
+            )
+        ]
+        self.assertTrue(all(isinstance(event, Event) for event in events))
+        # Still lists, consumers serializing them directly keep working.
+        self.assertTrue(all(isinstance(event, list) for event in events))
+        for event in events:
+            json.loads(json.dumps(event, default=lambda model: model.model_dump()))
+        self.assertEqual(json.loads(json.dumps(events[-2])), list(events[-2]))
+        self.assertIsInstance(events[0], MachineUpdateEvent)
+        # Interfaces are encoded as their definitions.
+        update = json.loads(encode_event(events[-1], encoder="json"))
+        self.assertEqual(update[0], "MACHINE_UPDATE")
+        self.assertEqual(update[2]["duplicate"], "hellohello")
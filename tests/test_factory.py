@@ -0,0 +1,80 @@
+from synth_machine.factory import SynthFactory
+from synth_machine.user_defined_functions import udf
+from tests.test_synth_machine import SynthMachineTest
+
+
+@udf(executor="thread")
+def append_in_place(memory):
+    memory["chat_history"].append("udf")
+    return len(memory["chat_history"])
+
+
+class SynthFactoryTest(SynthMachineTest):
+    def factory(self) -> SynthFactory:
+        return SynthFactory(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": self.helper.get_transistions("append_transistions"),
+                "initial_memory": {"chat_history": ["initial"]},
+            },
+            memory_patches=True,
+        )
+
+    async def test_sessions_share_plan(self):
+        factory = self.factory()
+        first = factory.create(memory={"a": "a", "b": "b"}, user="first")
+        second = factory.create(memory={"a": "x"})
+
+        self.assertIs(first.plan, second.plan)
+        # No per session transitions.Machine by default.
+        self.assertIsNone(first._machine)
+        self.assertIs(first.transitions, second.transitions)
+        self.assertIsNotNone(
+            factory.create(compact_state_machine=False)._machine  # type: ignore
+        )
+        self.assertIs(first.config, factory.plan.definition)
+        self.assertIsNotNone(first.memory_patcher)
+        self.assertEqual(first.user, "first")
+        self.assertNotEqual(first.session_id, second.session_id)
+
+        await first.trigger("1")
+        self.assertEqual(first.current_state(), "select")
+        self.assertEqual(first.memory["chat_history"], ["initial", "a"])
+        self.assertEqual(second.current_state(), "theme")
+        self.assertEqual(second.memory["chat_history"], ["initial"])
+        self.assertEqual(
+            factory.plan.definition.initial_memory, {"chat_history": ["initial"]}
+        )
+
+    async def test_create_in_state(self):
+        factory = self.factory()
+        synth = factory.create(memory={"a": "a", "b": "b"}, state="dnd")
+        self.assertEqual(synth.current_state(), "dnd")
+        await synth.trigger("3")
+        self.assertEqual(synth.current_state(), "select")
+        with self.assertRaises(ValueError):
+            factory.create(state="unknown")
+
+    async def test_sessions_copy_initial_memory(self):
+        transitions = self.helper.get_transistions("append_transistions")
+        transitions[0] = {
+            **transitions[0],
+            "outputs": [{"key": "length", "udf": "append_in_place"}],
+        }
+        factory = SynthFactory(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": transitions,
+                "initial_memory": {"chat_history": ["initial"]},
+            },
+            user_defined_functions={"append_in_place": append_in_place},
+        )
+        for _ in range(2):
+            synth = factory.create()
+            await synth.trigger("1")
+            self.assertEqual(synth.memory["length"], 2)
+        self.assertEqual(
+            factory.plan.definition.initial_memory, {"chat_history": ["initial"]}
+        )
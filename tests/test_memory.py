@@ -0,0 +1,159 @@
+import copy
+import json
+from unittest import TestCase
+
+from synth_machine.memory import (
+    MemoryPatcher,
+    MemorySnapshot,
+    MemoryStore,
+    memory_patch,
+)
+from synth_machine.machine import Synth
+from tests.test_helper import TestHelper
+from tests.test_synth_machine import SynthMachineTest
+
+
+class MemoryStoreTest(TestCase):
+    def test_snapshots_are_shared_until_changed(self):
+        memory = MemoryStore({"a": [1], "b": {"c": 1}})
+        snapshot = memory.snapshot()
+        self.assertIs(snapshot, memory.snapshot())
+        self.assertIs(snapshot["a"], memory["a"])
+
+        memory.mutable("a").append(2)
+        memory["d"] = "new"
+        self.assertEqual(snapshot, {"a": [1], "b": {"c": 1}})
+        self.assertEqual(memory, {"a": [1, 2], "b": {"c": 1}, "d": "new"})
+        # Unchanged keys are still shared with the new snapshot.
+        self.assertIs(memory.snapshot()["b"], snapshot["b"])
+        self.assertGreater(memory.snapshot().version, snapshot.version)
+
+    def test_frozen_values_are_copied_before_mutation(self):
+        memory = MemoryStore()
+        memory["a"] = [1]
+        unshared = memory.mutable("a")
+        self.assertIs(unshared, memory["a"])
+
+        frozen = memory.freeze("a")
+        memory.mutable("a").append(2)
+        self.assertEqual(frozen, [1])
+        self.assertEqual(memory["a"], [1, 2])
+        self.assertEqual(memory.freeze("missing", {}), {})
+
+    def test_initial_values_are_not_mutated(self):
+        initial = {"a": [1]}
+        memory = MemoryStore(initial)
+        memory.mutable("a").append(2)
+        self.assertEqual(initial, {"a": [1]})
+
+    def test_snapshots_are_read_only(self):
+        snapshot = MemoryStore({"a": 1}).snapshot()
+        with self.assertRaises(TypeError):
+            snapshot["a"] = 2
+        with self.assertRaises(TypeError):
+            snapshot.update({"a": 2})
+        self.assertEqual(json.loads(json.dumps(snapshot)), {"a": 1})
+        copied = copy.deepcopy(snapshot)
+        copied["a"] = 2
+        self.assertNotIsInstance(copied, MemorySnapshot)
+
+
+def apply_patch(memory: dict, patch: list) -> dict:
+    memory = copy.deepcopy(memory)
+    for operation in patch:
+        *parents, key = [
+            token.replace("~1", "/").replace("~0", "~")
+            for token in operation["path"].split("/")[1:]
+        ]
+        target = memory
+        for parent in parents:
+            target = target[parent]
+        if operation["op"] == "remove":
+            del target[key]
+        elif key == "-":
+            target.append(operation["value"])
+        else:
+            target[key] = operation["value"]
+    return memory
+
+
+class MemoryPatchTest(TestCase):
+    def test_memory_patch(self):
+        previous = {"list": [1, 2], "gone": 1, "same": {"a": 1}, "a/b": "x"}
+        current = {"list": [1, 2, 3, 4], "same": {"a": 1}, "a/b": "y", "new": []}
+        patch = memory_patch(previous, current)
+        self.assertEqual(
+            patch,
+            [
+                {"op": "remove", "path": "/gone"},
+                {"op": "add", "path": "/list/-", "value": 3},
+                {"op": "add", "path": "/list/-", "value": 4},
+                {"op": "replace", "path": "/a~1b", "value": "y"},
+                {"op": "add", "path": "/new", "value": []},
+            ],
+        )
+        self.assertEqual(apply_patch(previous, patch), current)
+        self.assertEqual(
+            memory_patch({"list": [1, 2]}, {"list": [2]}),
+            [{"op": "replace", "path": "/list", "value": [2]}],
+        )
+
+    def test_snapshot_interval(self):
+        memory = MemoryStore({"a": 1})
+        patcher = MemoryPatcher(snapshot_interval=3)
+        self.assertIsNone(patcher.update(memory.snapshot()))
+        memory["a"] = 2
+        self.assertEqual(
+            patcher.update(memory.snapshot()),
+            [{"op": "replace", "path": "/a", "value": 2}],
+        )
+        self.assertIsNone(patcher.update(memory.snapshot()))
+        self.assertEqual(patcher.update(memory.snapshot()), [])
+        patcher.request_snapshot()
+        self.assertIsNone(patcher.update(memory.snapshot()))
+
+
+class MemoryEventsTest(SynthMachineTest):
+    async def test_events_keep_memory_at_time_of_event(self):
+        synth = TestHelper().create_synth_machine(
+            initial_state="theme",
+            states=self.states,
+            transitions=self.helper.get_transistions("append_transistions"),
+            memory={"a": "a", "b": "b"},
+        )
+        events = []
+        for trigger in ["1", "2"]:
+            async for event in synth.streaming_trigger(trigger):
+                events.append(event)
+
+        set_memory = [event[2] for event in events if event[0] == "SET_MEMORY"]
+        self.assertEqual(set_memory, [{}, ["a"], ["a"], ["a", "a", "b"]])
+        machine_updates = [
+            event[2]["chat_history"]
+            for event in events
+            if event[0] == "MACHINE_UPDATE" and "chat_history" in event[2]
+        ]
+        self.assertEqual(machine_updates, [["a"], ["a"], ["a", "a", "b"]])
+
+    async def test_patch_events_rebuild_memory(self):
+        synth = Synth(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": self.helper.get_transistions("append_transistions"),
+            },
+            memory={"a": "a", "b": "b"},
+            memory_patches=True,
+        )
+        client: dict = {}
+        for trigger in ["1", "2", "3"]:
+            async for event in synth.streaming_trigger(trigger):
+                match event[0]:
+                    case "MACHINE_UPDATE":
+                        client = copy.deepcopy(event[2])
+                    case "MACHINE_UPDATE_PATCH" | "SET_MEMORY_PATCH":
+                        client = apply_patch(client, event[2])
+                    case "SET_MEMORY":
+                        self.fail("Full memory sent in patch mode")
+                self.assertEqual(client, synth.memory)
+        self.assertEqual(len(client["chat_history"]), 5)
@@ -1,3 +1,4 @@
+import asyncio
 from typing import AsyncGenerator, Optional
 
 from synth_machine.machine_config import ModelConfig
@@ -51,3 +52,43 @@ class MockJsonExecutor(BaseExecutor):
         user: str = "",
     ) -> AsyncGenerator:
         yield ('{"abc": "def"}', {"tokens": 1, "token_type": "output"})
+
+
+class MockStreamingJsonExecutor(BaseExecutor):
+    @staticmethod
+    def post_process(output):
+        return output
+
+    async def generate(
+        self,
+        user_prompt: Optional[str],
+        system_prompt: Optional[str],
+        json_schema: Optional[dict],
+        model_config: ModelConfig,
+        user: str = "",
+    ) -> AsyncGenerator:
+        yield ("", {"tokens": 5, "token_type": "input"})
+        for token in ['{"items": [', '{"n": 1}, ', '{"n": 2}', "], ", '"done": true}']:
+            yield (token, {"tokens": 1, "token_type": "output"})
+
+
+class MockDelayedExecutor(BaseExecutor):
+    def __init__(self, token: str, delay: float) -> None:
+        self.token = token
+        self.delay = delay
+
+    @staticmethod
+    def post_process(output):
+        return output
+
+    async def generate(
+        self,
+        user_prompt: Optional[str],
+        system_prompt: Optional[str],
+        json_schema: Optional[dict],
+        model_config: ModelConfig,
+        user: str = "",
+    ) -> AsyncGenerator:
+        yield ("", {"tokens": 5, "token_type": "input"})
+        await asyncio.sleep(self.delay)
+        yield (self.token, {"tokens": 1, "token_type": "output"})
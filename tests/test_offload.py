@@ -0,0 +1,130 @@
+import pickle
+import threading
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+from jsonschema.exceptions import ValidationError  # type: ignore
+
+from synth_machine.memory import MemorySnapshot, MemoryStore
+from synth_machine.offload import (
+    Offloader,
+    approximate_size,
+    configure_offload,
+    offload_metrics,
+)
+from synth_machine.operator_setup import prompt_for_transition
+from synth_machine.runners import jq_runner
+from synth_machine.validation import schema_validator
+from tests.test_synth_machine import SynthMachineTest
+
+
+def thread_name(*args) -> str:
+    return threading.current_thread().name
+
+
+class OffloadTest(TestCase):
+    def test_approximate_size(self):
+        self.assertEqual(approximate_size({"a": "abc", "b": [1, 2]}), 9)
+        # Stops counting once the limit is reached.
+        self.assertLess(approximate_size(["a" * 1000] * 1000, limit=100), 10_000)
+
+    def test_picklable_steps(self):
+        validator = schema_validator({"type": "string"})
+        loaded = pickle.loads(pickle.dumps(validator))
+        self.assertEqual(loaded.schema, validator.schema)
+        # Compiled once when loaded repeatedly.
+        self.assertIs(pickle.loads(pickle.dumps(validator)), loaded)
+        memory = MemoryStore({"a": [1]})
+        memory.snapshot()
+        self.assertEqual(pickle.loads(pickle.dumps(memory)), {"a": [1]})
+
+
+class OffloaderTest(IsolatedAsyncioTestCase):
+    async def test_inline(self):
+        offloader = Offloader(executor=None, min_size=0)
+        self.assertEqual(
+            await offloader.run("step", "input", thread_name),
+            threading.current_thread().name,
+        )
+        metrics = offloader.metrics()["step"]
+        self.assertEqual((metrics["calls"], metrics["offloaded"]), (1, 0))
+        self.assertGreater(metrics["blocking_total"], 0)
+
+    async def test_thread_pool_by_size(self):
+        offloader = Offloader(executor="thread", min_size=10)
+        self.assertEqual(
+            await offloader.run("step", "small", thread_name),
+            threading.current_thread().name,
+        )
+        self.assertTrue(
+            (await offloader.run("step", "large" * 10, thread_name)).startswith(
+                "synth-offload"
+            )
+        )
+        metrics = offloader.metrics()["step"]
+        self.assertEqual((metrics["calls"], metrics["offloaded"]), (2, 1))
+        offloader.shutdown()
+
+    async def test_process_pool(self):
+        offloader = Offloader(executor="process", max_workers=1, min_size=0)
+        self.addCleanup(offloader.shutdown)
+        self.assertEqual(
+            await offloader.run(
+                "template",
+                "",
+                prompt_for_transition,
+                inputs={"a": "b"},
+                prompt_template="{{a}}",
+            ),
+            ("b", None),
+        )
+        validator = schema_validator({"type": "string"})
+        with self.assertRaises(ValidationError):
+            await offloader.run("validate", "", validator.validate, 1)
+        # Steps sharing synth memory stay in the process, on a thread.
+        self.assertTrue(
+            (
+                await offloader.run("udf", "", thread_name, shared_memory=True)
+            ).startswith("synth-offload")
+        )
+
+
+class OffloadedSynthTest(SynthMachineTest):
+    async def test_steps_offloaded(self):
+        configure_offload("thread", min_size=0)
+        self.addCleanup(configure_offload, None)
+        udf_transitions = self.helper.get_transistions("udf_transitions")
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=udf_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        synth.user_defined_functions = {
+            "duplicate_string": lambda memory: memory["test_string"] * 2
+        }
+        self.assertEqual(
+            await synth.trigger("1", params={"test_string": "hello"}),
+            {"duplicate": "hellohello"},
+        )
+        self.assertEqual(offload_metrics()["udf"]["offloaded"], 1)
+
+    async def test_offloaded_jq_reads_snapshot(self):
+        configure_offload("thread", min_size=0)
+        self.addCleanup(configure_offload, None)
+        received = []
+
+        def recording_jq_runner(jq_command, data={}, schema={}):
+            received.append(type(data))
+            return jq_runner(jq_command, data, schema)
+
+        jq_transitions = self.helper.get_transistions("jq_transistions")
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=jq_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        with patch("synth_machine.machine.jq_runner", recording_jq_runner):
+            await synth.trigger("1")
+        self.assertEqual(len(synth.memory["flattened"]), 30)
+        self.assertEqual(received, [MemorySnapshot])
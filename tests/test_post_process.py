@@ -0,0 +1,192 @@
+import asyncio
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from synth_machine import runners
+from synth_machine.machine import Synth
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from synth_machine.post_process import (
+    PostProcessConfig,
+    PostProcessTask,
+    jq_memory_keys,
+)
+from tests.test_mocks import MockDelayedExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+class JqMemoryKeysTest(TestCase):
+    def test_path_reads(self):
+        self.assertEqual(
+            jq_memory_keys(".acts_condensed[][]"), frozenset({"acts_condensed"})
+        )
+        self.assertEqual(
+            jq_memory_keys('{title: .name, other: .["my key"]} | .a.b'),
+            frozenset({"name", "my key", "a"}),
+        )
+        self.assertEqual(jq_memory_keys(".a as $x | $x.b"), frozenset({"a"}))
+
+    def test_whole_input_reads(self):
+        for expression in [".", ".[]", "..", "keys", '"\\\\(.a)"', ".a | map(.b)"]:
+            self.assertIsNone(jq_memory_keys(expression), expression)
+
+    def test_task_dependencies(self):
+        task = PostProcessTask(
+            key="out",
+            definition=None,
+            reads=frozenset({"a"}),
+            config=PostProcessConfig(),
+        )
+        self.assertTrue(task.needs_run("memory"))
+        task.ran("memory")
+        task.touch(["b"])
+        self.assertFalse(task.needs_run("memory"))
+        self.assertTrue(task.needs_run("stream"))
+        task.touch(["a"])
+        self.assertTrue(task.needs_run("memory"))
+
+    def test_task_throttle(self):
+        task = PostProcessTask(
+            key="out",
+            definition=None,
+            reads=None,
+            config=PostProcessConfig(min_interval_tokens=3, min_interval_ms=60_000),
+        )
+        task.ran("stream")
+        task.tokens = 2
+        self.assertTrue(task.throttled())
+        task.tokens = 3
+        self.assertFalse(task.throttled())
+
+
+class PostProcessSynthTest(SynthMachineTest):
+    async def run_jq_stream(self, transitions):
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=transitions,
+            memory={},
+        )
+        with (
+            patch(
+                "synth_machine.machine.prompt_setup",
+                self.mock_streaming_json_prompt_setup,
+            ),
+            patch(
+                "synth_machine.machine.jq_runner", wraps=runners.jq_runner
+            ) as jq_runner,
+        ):
+            async for _ in synth.streaming_trigger(transitions[0]["trigger"]):
+                pass
+        return synth, jq_runner.call_count
+
+    async def test_jq_streaming_output(self):
+        transitions = self.helper.get_transistions("jq_stream_transitions")
+        synth, _ = await self.run_jq_stream(transitions)
+        self.assertEqual(synth.memory["numbers"], [1, 2])
+        self.assertEqual(
+            synth.memory["generated"], {"items": [{"n": 1}, {"n": 2}], "done": True}
+        )
+
+    async def test_jq_skips_unchanged_inputs(self):
+        transitions = self.helper.get_transistions("jq_stream_transitions")
+        _, call_count = await self.run_jq_stream(transitions)
+        # Tokens only re-run jq when `items` changes, plus the final memory pass.
+        self.assertLess(call_count, 6)
+
+    async def test_jq_throttled(self):
+        transitions = self.helper.get_transistions("jq_stream_transitions")
+        transitions[0]["outputs"][1]["post_process_config"] = {
+            "min_interval_tokens": 100,
+            "min_interval_ms": 60_000,
+        }
+        synth, call_count = await self.run_jq_stream(transitions)
+        self.assertEqual(synth.memory["numbers"], [1, 2])
+        self.assertLessEqual(call_count, 3)
+
+    async def test_trigger_skips_events(self):
+        transitions = self.helper.get_transistions("jq_stream_transitions")
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=transitions,
+            memory={},
+        )
+        with (
+            patch(
+                "synth_machine.machine.prompt_setup",
+                self.mock_streaming_json_prompt_setup,
+            ),
+            patch(
+                "synth_machine.machine.jq_runner", wraps=runners.jq_runner
+            ) as jq_runner,
+            patch.object(synth, "machine_update") as machine_update,
+            patch.object(
+                synth,
+                "record_prompt_token_usage",
+                wraps=synth.record_prompt_token_usage,
+            ) as record_usage,
+        ):
+            outputs = await synth.trigger("1")
+        self.assertEqual(outputs["numbers"], [1, 2])
+        self.assertEqual(
+            outputs["generated"], {"items": [{"n": 1}, {"n": 2}], "done": True}
+        )
+        # The generation is post-processed once rather than per token.
+        self.assertLessEqual(jq_runner.call_count, 3)
+        machine_update.assert_not_called()
+        self.assertEqual(
+            record_usage.call_args.kwargs, {"input_tokens": 5, "output_tokens": 5}
+        )
+
+    async def test_trigger_overlapping_stream(self):
+        def output(key):
+            return {"key": key, "prompt": "{{a}}", "schema": {"type": "string"}}
+
+        synth = Synth(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": [
+                    {
+                        "trigger": trigger,
+                        "source": "theme",
+                        "dest": "theme",
+                        "outputs": [output(key)],
+                    }
+                    for trigger, key in [("1", "streamed"), ("2", "triggered")]
+                ],
+            },
+            memory={"a": "a"},
+        )
+
+        async def prompt_setup(**kwargs):
+            return (
+                SynthConfig(
+                    executor=MockDelayedExecutor("token", 0.02),
+                    model_config=ModelConfig(executor="mock"),
+                    system_prompt="",
+                    user_prompt="",
+                ),
+                None,
+            )
+
+        with patch("synth_machine.machine.prompt_setup", prompt_setup):
+            # A trigger running at the same time doesn't turn off the
+            # stream's events.
+            triggered = asyncio.create_task(synth.trigger("2"))
+            await asyncio.sleep(0.01)
+            events = [event async for event in synth.streaming_trigger("1")]
+            self.assertEqual(await triggered, {"triggered": "token"})
+        kinds = {event[0] for event in events}
+        self.assertTrue({"CHUNK", "SET_MEMORY", "MACHINE_UPDATE"} <= kinds)
+
+    def test_jq_compile_cache(self):
+        runners.compile_jq.cache_clear()
+        runners.jq_runner(".a", {"a": 1}, {"type": "object"})
+        runners.jq_runner(".a", {"a": 2}, {"type": "object"})
+        self.assertEqual(runners.compile_jq.cache_info().hits, 1)
+
+
+if __name__ == "__main__":
+    main()
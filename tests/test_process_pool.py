@@ -0,0 +1,75 @@
+import asyncio
+from contextlib import aclosing
+
+from synth_machine.process_pool import SynthProcessPool
+from tests.test_synth_machine import SynthMachineTest
+
+
+async def slow(memory):
+    await asyncio.sleep(0.2)
+    return "done"
+
+
+class SynthProcessPoolTest(SynthMachineTest):
+    async def test_sessions_run_in_workers(self):
+        config = {
+            "initial_state": "theme",
+            "states": self.states,
+            "transitions": self.helper.get_transistions("append_transistions"),
+        }
+        with SynthProcessPool(config, workers=2) as pool:
+            sessions = [
+                await pool.create_session(
+                    session_id=f"session-{i}", memory={"a": str(i)}
+                )
+                for i in range(6)
+            ]
+            self.assertEqual(
+                {pool.worker_index(session) for session in sessions}, {0, 1}
+            )
+
+            async def run(session):
+                return [event async for event in pool.streaming_trigger(session, "1")]
+
+            results = await asyncio.gather(*[run(session) for session in sessions])
+            for i, (session, events) in enumerate(zip(sessions, results)):
+                self.assertEqual(events[-1][0], "MACHINE_UPDATE")
+                self.assertEqual(events[-1][2]["chat_history"], [str(i)])
+                state, memory = await pool.session_state(session)
+                self.assertEqual(state, "select")
+                self.assertEqual(memory["chat_history"], [str(i)])
+
+            with self.assertRaises(ValueError):
+                await pool.create_session(state="unknown")
+            await pool.close_session(sessions[0])
+            with self.assertRaises(KeyError):
+                await pool.session_state(sessions[0])
+
+    async def test_session_triggers_in_order(self):
+        transitions = self.helper.get_transistions("append_transistions")
+        transitions[0] = {**transitions[0], "outputs": [{"key": "slow", "udf": "slow"}]}
+        config = {
+            "initial_state": "theme",
+            "states": self.states,
+            "transitions": transitions,
+        }
+        with SynthProcessPool(
+            config, workers=1, user_defined_functions={"slow": slow}
+        ) as pool:
+            session = await pool.create_session(memory={"a": "a", "b": "b"})
+
+            async def run(trigger):
+                return [
+                    event async for event in pool.streaming_trigger(session, trigger)
+                ]
+
+            # "2" only exists from the state "1" moves to, so it has to wait.
+            first, second = await asyncio.gather(run("1"), run("2"))
+            self.assertEqual(first[-1][3], "select")
+            self.assertEqual(second[-1][3], "dnd")
+
+            # A stream closed early stops its trigger in the worker.
+            async with aclosing(pool.streaming_trigger(session, "3")) as events:
+                async for _ in events:
+                    break
+            await pool.close_session(session)
@@ -0,0 +1,212 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+import httpx
+
+from synth_machine.machine_config import ModelConfig, get_encoding
+from synth_machine.operator_setup import SynthConfig
+from synth_machine.rate_limit import (
+    RATE_LIMITERS,
+    AdaptiveConcurrency,
+    RateLimiter,
+    TokenBucket,
+    configure_rate_limit,
+    get_rate_limiter,
+    is_overloaded,
+    rate_limit_metrics,
+    retry_after,
+)
+from tests.test_mocks import MockExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+
+def status_error(status: int, headers={}) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://provider.test")
+    return httpx.HTTPStatusError(
+        "error",
+        request=request,
+        response=httpx.Response(status, headers=headers, request=request),
+    )
+
+
+class RateLimitTest(TestCase):
+    def test_is_overloaded(self):
+        self.assertTrue(is_overloaded(ProviderError(429)))
+        self.assertTrue(is_overloaded(ProviderError(503)))
+        self.assertTrue(is_overloaded(status_error(429)))
+        self.assertFalse(is_overloaded(ProviderError(400)))
+        self.assertFalse(is_overloaded(ValueError()))
+        self.assertEqual(retry_after(status_error(429, {"retry-after": "2"})), 2)
+        self.assertIsNone(retry_after(ProviderError(429)))
+
+    def test_token_bucket(self):
+        with patch("synth_machine.rate_limit.time.monotonic", return_value=0):
+            bucket = TokenBucket(60)
+            self.assertEqual(bucket.reserve(60), 0)
+            # Overdrawn, refills at one a second.
+            self.assertEqual(bucket.reserve(2), 2)
+        with patch("synth_machine.rate_limit.time.monotonic", return_value=2):
+            self.assertEqual(bucket.reserve(1), 1)
+
+    def test_aimd(self):
+        concurrency = AdaptiveConcurrency(max_concurrency=8, cooldown=10)
+        with patch("synth_machine.rate_limit.time.monotonic", return_value=100):
+            concurrency.on_overload()
+            concurrency.on_overload()
+        self.assertEqual(concurrency.current_limit, 4)
+        # About one more for each round of `limit` successes.
+        for _ in range(4):
+            concurrency.on_success()
+        self.assertEqual(concurrency.current_limit, 4)
+        concurrency.on_success()
+        self.assertEqual(concurrency.current_limit, 5)
+        for _ in range(100):
+            concurrency.on_success()
+        self.assertEqual(concurrency.current_limit, 8)
+
+    def test_registry(self):
+        self.addCleanup(RATE_LIMITERS.clear)
+        shared = configure_rate_limit("openai", requests_per_minute=10)
+        model = configure_rate_limit("openai", "gpt-4o", tokens_per_minute=10)
+        self.assertIs(get_rate_limiter("openai", "gpt-4o"), model)
+        self.assertIs(get_rate_limiter("openai", "other"), shared)
+        self.assertIsNone(get_rate_limiter("anthropic", "other"))
+        self.assertEqual(list(rate_limit_metrics()), ["openai", "openai/gpt-4o"])
+
+
+class RateLimiterTest(IsolatedAsyncioTestCase):
+    async def test_concurrency_limited(self):
+        limiter = RateLimiter(max_concurrency=2)
+        running = 0
+        most_running = 0
+
+        async def stream():
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            yield "token"
+
+        async def consume():
+            return [item async for item in limiter.stream(stream)]
+
+        results = await asyncio.gather(*[consume() for _ in range(6)])
+        self.assertEqual(results, [["token"]] * 6)
+        self.assertEqual(most_running, 2)
+        metrics = limiter.metrics()
+        self.assertEqual(metrics["requests"], 6)
+        self.assertEqual(metrics["in_flight"], 0)
+        self.assertGreater(metrics["queue_wait_max"], 0)
+
+    async def test_retries_overloaded_requests(self):
+        limiter = RateLimiter(max_concurrency=4, backoff=0)
+        attempts = []
+
+        async def stream():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ProviderError(429)
+            yield "token"
+
+        self.assertEqual([item async for item in limiter.stream(stream)], ["token"])
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(limiter.overloaded, 2)
+        self.assertEqual(limiter.concurrency.current_limit, 2)
+
+    async def test_waits_without_a_slot(self):
+        limiter = RateLimiter(max_concurrency=1, tokens_per_minute=6000, backoff=0.05)
+        await limiter.acquire(6000)
+        limiter.concurrency.release()
+        waiting = asyncio.create_task(limiter.acquire(10))
+        await asyncio.sleep(0.01)
+        # Waiting for the token bucket doesn't hold the only slot.
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+        await waiting
+        limiter.concurrency.release()
+
+        order = []
+
+        async def overloaded():
+            if not order:
+                order.append("overloaded")
+                raise ProviderError(429)
+            order.append("retried")
+            yield "token"
+
+        async def other():
+            order.append("other")
+            yield "token"
+
+        async def consume(start):
+            return [item async for item in limiter.stream(start)]
+
+        await asyncio.gather(consume(overloaded), consume(other))
+        # The other request runs while the overloaded one backs off.
+        self.assertEqual(order, ["overloaded", "other", "retried"])
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+
+    async def test_no_retry_once_streaming(self):
+        limiter = RateLimiter(backoff=0)
+        attempts = []
+
+        async def stream():
+            attempts.append(1)
+            yield "token"
+            raise ProviderError(500)
+
+        with self.assertRaises(ProviderError):
+            async for _ in limiter.stream(stream):
+                pass
+        self.assertEqual(len(attempts), 1)
+
+        async def invalid():
+            attempts.append(1)
+            raise ProviderError(400)
+            yield
+
+        with self.assertRaises(ProviderError):
+            async for _ in limiter.stream(invalid):
+                pass
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+
+
+class RateLimitedSynthTest(SynthMachineTest):
+    async def test_synth_uses_limiter(self):
+        self.addCleanup(RATE_LIMITERS.clear)
+        limiter = configure_rate_limit("mock", tokens_per_minute=100_000)
+
+        async def prompt_setup(**kwargs):
+            return (
+                SynthConfig(
+                    executor=MockExecutor(),
+                    model_config=ModelConfig(executor="mock", max_tokens=10),
+                    system_prompt="",
+                    user_prompt="hello",
+                ),
+                None,
+            )
+
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=self.helper.get_transistions("basic_transitions"),
+            memory=self.FAKE_MEMORY,
+        )
+        # Count words rather than download the encoding.
+        get_encoding.cache_clear()
+        self.addCleanup(get_encoding.cache_clear)
+        with (
+            patch("synth_machine.machine.prompt_setup", prompt_setup),
+            patch("tiktoken.get_encoding") as load_encoding,
+        ):
+            load_encoding.return_value.encode.side_effect = str.split
+            await synth.trigger("1")
+        self.assertEqual(limiter.total_requests, 1)
+        self.assertEqual(limiter.tokens.available, 100_000 - 11)  # type: ignore
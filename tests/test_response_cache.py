@@ -0,0 +1,185 @@
+import os
+import tempfile
+from typing import AsyncGenerator, Optional
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from synth_machine.machine import Synth
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from synth_machine.response_cache import (
+    MemoryResponseCache,
+    SqliteResponseCache,
+    response_cache_key,
+)
+from synth_machine.usage_ledger import UsageLedger
+from tests.test_mocks import MockJsonExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+CHUNKS = [("", {"tokens": 5, "token_type": "input"}), ("a", {"tokens": 1})]
+
+
+class CountingExecutor(MockJsonExecutor):
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def generate(
+        self,
+        user_prompt: Optional[str],
+        system_prompt: Optional[str],
+        json_schema: Optional[dict],
+        model_config: ModelConfig,
+        user: str = "",
+    ) -> AsyncGenerator:
+        self.calls += 1
+        yield ("", {"tokens": 5, "token_type": "input"})
+        yield ('{"abc": ', {"tokens": 1, "token_type": "output"})
+        yield ('"def"}', {"tokens": 1, "token_type": "output"})
+
+
+class ResponseCacheTest(IsolatedAsyncioTestCase):
+    def test_key(self):
+        config = ModelConfig(executor="mock")
+        key = response_cache_key("user", "system", config, {"type": "string"})
+        self.assertEqual(
+            key, response_cache_key("user", "system", config, {"type": "string"})
+        )
+        for changed in [
+            ("other", "system", config, {"type": "string"}),
+            ("user", "system", ModelConfig(executor="mock", temperature=0), None),
+            ("user", "system", config, {"type": "object"}),
+        ]:
+            self.assertNotEqual(key, response_cache_key(*changed))  # type: ignore
+
+    async def test_memory_cache(self):
+        cache = MemoryResponseCache(maxsize=2)
+        await cache.set("a", CHUNKS)
+        await cache.set("b", CHUNKS)
+        self.assertEqual(await cache.get("a"), CHUNKS)
+        await cache.set("c", CHUNKS)
+        # "b" was least recently used.
+        self.assertIsNone(await cache.get("b"))
+        self.assertEqual(await cache.get("a"), CHUNKS)
+
+    async def test_memory_cache_ttl(self):
+        cache = MemoryResponseCache(ttl=10)
+        with patch("synth_machine.response_cache.time.monotonic", return_value=0):
+            await cache.set("a", CHUNKS)
+        with patch("synth_machine.response_cache.time.monotonic", return_value=5):
+            self.assertEqual(await cache.get("a"), CHUNKS)
+        with patch("synth_machine.response_cache.time.monotonic", return_value=11):
+            self.assertIsNone(await cache.get("a"))
+
+    async def test_sqlite_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "responses.db")
+            cache = SqliteResponseCache(path, ttl=10)
+            await cache.set("a", CHUNKS)
+            cache.close()
+
+            cache = SqliteResponseCache(path, ttl=10)
+            self.assertEqual(await cache.get("a"), CHUNKS)
+            self.assertIsNone(await cache.get("b"))
+            with patch("synth_machine.response_cache.time.time", return_value=1e12):
+                self.assertIsNone(await cache.get("a"))
+            self.assertIsNone(await cache.get("a"))
+            cache.close()
+
+
+class SynthResponseCacheTest(SynthMachineTest):
+    def synth(self, response_cache: MemoryResponseCache, **output) -> Synth:
+        return Synth(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": [
+                    {
+                        "trigger": "1",
+                        "source": "theme",
+                        "dest": "select",
+                        "outputs": [
+                            {
+                                "key": "output",
+                                "prompt": "{{a}}",
+                                "schema": {"type": "object"},
+                                **output,
+                            }
+                        ],
+                    }
+                ],
+            },
+            memory={"a": "a"},
+            response_cache=response_cache,
+        )
+
+    async def run_synth(self, synth: Synth, executor) -> list:
+        async def prompt_setup(**kwargs):
+            return (
+                SynthConfig(
+                    executor=executor,
+                    model_config=ModelConfig(executor="mock"),
+                    system_prompt="",
+                    user_prompt="",
+                ),
+                None,
+            )
+
+        with patch("synth_machine.machine.prompt_setup", prompt_setup):
+            return [event async for event in synth.streaming_trigger("1")]
+
+    async def test_replays_chunks(self):
+        cache = MemoryResponseCache()
+        executor = CountingExecutor()
+        first = await self.run_synth(self.synth(cache), executor)
+        second_synth = self.synth(cache)
+        second = await self.run_synth(second_synth, executor)
+
+        self.assertEqual(executor.calls, 1)
+        self.assertIn(["CACHE_MISS", "output"], first)
+        self.assertIn(["CACHE_HIT", "output"], second)
+        first_chunks = [e for e in first if e[0] == "CHUNK"]
+        second_chunks = [e for e in second if e[0] == "CHUNK"]
+        self.assertEqual(
+            [(e.token, e.tokens, e.stage) for e in first_chunks],
+            [(e.token, e.tokens, e.stage) for e in second_chunks],
+        )
+        self.assertEqual([e.cost for e in first_chunks], [5, 1, 1])
+        self.assertEqual([e.cost for e in second_chunks], [0, 0, 0])
+        self.assertEqual(second_synth.memory["output"], {"abc": "def"})
+        self.assertEqual(second_synth.current_state(), "select")
+
+    async def test_hits_not_billed(self):
+        cache = MemoryResponseCache()
+        executor = CountingExecutor()
+        with tempfile.TemporaryDirectory() as directory:
+            ledger = UsageLedger(os.path.join(directory, "usage.db"))
+            for _ in range(2):
+                synth = self.synth(cache)
+                synth.usage_ledger = ledger
+                await self.run_synth(synth, executor)
+            await ledger.close()
+            ledger = UsageLedger(os.path.join(directory, "usage.db"))
+            self.assertEqual(
+                await ledger.totals(), {"input_tokens": 5, "output_tokens": 2}
+            )
+            self.assertEqual(
+                await ledger.totals(kind="cached"),
+                {"input_tokens": 5, "output_tokens": 2},
+            )
+            await ledger.close()
+
+    async def test_opt_out(self):
+        cache = MemoryResponseCache()
+        executor = CountingExecutor()
+        for _ in range(2):
+            events = await self.run_synth(self.synth(cache, cache=False), executor)
+        self.assertEqual(executor.calls, 2)
+        self.assertFalse([e for e in events if e[0].startswith("CACHE_")])
+
+    async def test_failed_validation_not_cached(self):
+        cache = MemoryResponseCache()
+        events = await self.run_synth(
+            self.synth(cache, schema={"type": "array"}), MockJsonExecutor()
+        )
+        self.assertIn(["OUTPUT_VALIDATION_FAILED", "output"], events)
+        self.assertEqual(cache._entries, {})
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+from unittest import IsolatedAsyncioTestCase
+import httpx
+
+from synth_machine.operator_setup import ToolConfig, ToolTokenUseage
+from synth_machine.runners import tool_runner
+from synth_machine.tool_client import ToolClient
+
+
+class MockStore:
+    root_url = "memory://"
+
+    def __init__(self) -> None:
+        self.files: dict = {}
+
+    async def put_async(self, location, data) -> None:
+        self.files[location] = data.read()
+
+
+def tool_config(output_mime_types=[]) -> ToolConfig:
+    return ToolConfig(
+        tool_id="tool",
+        payload={"text": "hello"},
+        output_mime_types=output_mime_types,
+        tool_path="http://tool.test/route",
+        tokens=ToolTokenUseage(execution=0, multiplier=0),
+    )
+
+
+class ToolRunnerTest(IsolatedAsyncioTestCase):
+    async def test_json_response(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json=json.loads(request.content))
+
+        output = await tool_runner(
+            store=MockStore(),  # type: ignore
+            tool_config=tool_config(),
+            tool_client=ToolClient(transport=httpx.MockTransport(handler)),
+        )
+        self.assertEqual(
+            output,
+            {"text": "hello", "response_headers": {"status": 200, "success": True}},
+        )
+
+    async def test_file_response(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200, content=b"image", headers={"content-type": "image/png"}
+            )
+
+        store = MockStore()
+        output = await tool_runner(
+            store=store,  # type: ignore
+            tool_config=tool_config(["image/png"]),
+            tool_client=ToolClient(transport=httpx.MockTransport(handler)),
+        )
+        self.assertEqual(output["mime_type"], "png")  # type: ignore
+        self.assertEqual(store.files, {output["file_name"]: b"image"})  # type: ignore
+
+    async def test_failed_request(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("refused")
+
+        output = await tool_runner(
+            store=MockStore(),  # type: ignore
+            tool_config=tool_config(),
+            tool_client=ToolClient(transport=httpx.MockTransport(handler)),
+        )
+        self.assertIsNone(output)
+
+    async def test_concurrent_calls_limited_per_host(self):
+        running = 0
+        most_running = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return httpx.Response(200, json={})
+
+        client = ToolClient(
+            max_connections_per_host=2, transport=httpx.MockTransport(handler)
+        )
+        start = time.monotonic()
+        await asyncio.gather(
+            *[
+                tool_runner(
+                    store=MockStore(),  # type: ignore
+                    tool_config=tool_config(),
+                    tool_client=client,
+                )
+                for _ in range(4)
+            ]
+        )
+        self.assertEqual(most_running, 2)
+        # Calls don't block the event loop, two run at a time.
+        self.assertLess(time.monotonic() - start, 0.19)
+        await client.aclose()
@@ -0,0 +1,191 @@
+import asyncio
+from contextlib import aclosing
+from unittest.mock import patch
+
+from synth_machine.machine_config import ModelConfig
+from synth_machine.operator_setup import SynthConfig
+from synth_machine.scheduler import SynthJob, SynthRunner
+from tests.test_mocks import MockDelayedExecutor
+from tests.test_synth_machine import SynthMachineTest
+
+
+class SynthRunnerTest(SynthMachineTest):
+    def setUp(self):
+        super().setUp()
+        patcher = patch("synth_machine.machine.prompt_setup", self.delayed_prompt_setup)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def delayed_prompt_setup(self, **kwargs):
+        return (
+            SynthConfig(
+                executor=MockDelayedExecutor(token="hello", delay=0.01),
+                model_config=ModelConfig(executor="mock"),
+                system_prompt="",
+                user_prompt="",
+            ),
+            None,
+        )
+
+    def synth(self, user: str = "user"):
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=self.helper.get_transistions("basic_transitions"),
+            memory=self.FAKE_MEMORY,
+        )
+        synth.user = user
+        return synth
+
+    async def finish(self, jobs):
+        for job in jobs:
+            async for _ in job:
+                pass
+
+    def start_order(self, jobs):
+        return [job.user for job in sorted(jobs, key=lambda job: job.started)]
+
+    async def test_bounded_concurrency(self):
+        runner = SynthRunner(max_concurrency=2)
+        jobs = [runner.submit(self.synth(), "1") for _ in range(5)]
+        self.assertEqual(runner.running, 2)
+        self.assertEqual(runner.metrics()["lanes"]["interactive"]["queued"], 3)
+        await self.finish(jobs)
+        for job in jobs:
+            self.assertEqual(job.synth.memory["output"], "hello")
+            self.assertEqual(job.synth.current_state(), "select")
+        metrics = runner.metrics()
+        self.assertEqual(metrics["running"], 0)
+        self.assertEqual(metrics["lanes"]["interactive"]["completed"], 5)
+        self.assertGreater(metrics["lanes"]["interactive"]["queue_wait_max"], 0)
+
+    async def test_fair_between_users(self):
+        runner = SynthRunner(max_concurrency=1)
+        jobs = [runner.submit(self.synth("bulk"), "1") for _ in range(4)]
+        jobs.append(runner.submit(self.synth("other"), "1"))
+        await self.finish(jobs)
+        self.assertEqual(
+            self.start_order(jobs), ["bulk", "bulk", "other", "bulk", "bulk"]
+        )
+
+    async def test_user_weights(self):
+        runner = SynthRunner(max_concurrency=1, user_weights={"paid": 2})
+        jobs = [runner.submit(self.synth("free"), "1") for _ in range(3)]
+        jobs += [runner.submit(self.synth("paid"), "1") for _ in range(4)]
+        await self.finish(jobs)
+        self.assertEqual(
+            self.start_order(jobs),
+            ["free", "paid", "free", "paid", "paid", "free", "paid"],
+        )
+
+    async def test_priority_lanes(self):
+        runner = SynthRunner(max_concurrency=1)
+        jobs = [runner.submit(self.synth("batch"), "1", lane="batch") for _ in range(3)]
+        jobs.append(runner.submit(self.synth("interactive"), "1"))
+        await self.finish(jobs)
+        self.assertEqual(self.start_order(jobs)[:2], ["batch", "interactive"])
+        with self.assertRaises(ValueError):
+            runner.submit(self.synth(), "1", lane="unknown")
+
+    async def test_same_synth_runs_in_order(self):
+        runner = SynthRunner(max_concurrency=4)
+        synth = self.synth()
+        first = runner.submit(synth, "1")
+        second = runner.submit(synth, "2")
+        self.assertEqual(runner.running, 1)
+        self.assertEqual(runner.metrics()["waiting_on_session"], 1)
+        await self.finish([first, second])
+        self.assertIsNone(second.error)
+        self.assertEqual(synth.current_state(), "dnd")
+
+    async def test_errors_and_cancel(self):
+        runner = SynthRunner(max_concurrency=1)
+        running = runner.submit(self.synth(), "1")
+        cancelled = runner.submit(self.synth(), "1")
+        cancelled.cancel()
+        failing = runner.submit(self.synth(), "unknown")
+        await self.finish([running])
+        with self.assertRaises(asyncio.CancelledError):
+            await self.finish([cancelled])
+        with self.assertRaises(KeyError):
+            await self.finish([failing])
+        self.assertIsNone(cancelled.started)
+        self.assertIsInstance(cancelled.error, asyncio.CancelledError)
+        self.assertEqual(runner.metrics()["lanes"]["interactive"]["completed"], 2)
+
+    async def test_cancel_running(self):
+        runner = SynthRunner(max_concurrency=1)
+        job = runner.submit(self.synth(), "1")
+        await asyncio.sleep(0)
+        job.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await self.finish([job])
+        self.assertIsInstance(job.error, asyncio.CancelledError)
+        self.assertEqual(runner.running, 0)
+
+    async def test_bounded_events(self):
+        runner = SynthRunner()
+        job = runner.submit_job(SynthJob(self.synth(), "1", max_buffered=2))
+        await asyncio.sleep(0.05)
+        # Waiting on the reader rather than buffering every event.
+        self.assertFalse(job.done)
+        self.assertEqual(job._events.qsize(), 2)
+        await self.finish([job])
+        self.assertIsNone(job.error)
+
+    async def test_unread_jobs_release_slots(self):
+        runner = SynthRunner(max_concurrency=1)
+        unread = runner.submit_job(SynthJob(self.synth(), "1", max_buffered=1))
+        other = runner.submit(self.synth(), "1")
+        # The unread job stops holding the only slot once its buffer is full.
+        await asyncio.wait_for(self.finish([other]), 1)
+        self.assertFalse(unread.done)
+        await asyncio.wait_for(unread.wait(), 1)
+        self.assertEqual(unread.synth.current_state(), "select")
+        self.assertEqual(runner.running, 0)
+        await unread.wait()
+
+        failing = runner.submit(self.synth(), "unknown")
+        with self.assertRaises(KeyError):
+            await failing.wait()
+
+    async def test_run_errors_and_early_exit(self):
+        runner = SynthRunner(max_concurrency=2)
+
+        async def jobs():
+            yield SynthJob(self.synth(), "unknown")
+            yield SynthJob(self.synth(), "1")
+
+        events = [event async for _, event in runner.run(jobs())]
+        self.assertTrue(any(isinstance(event, KeyError) for event in events))
+
+        submitted = []
+
+        async def more_jobs():
+            for _ in range(2):
+                job = SynthJob(self.synth(), "1")
+                submitted.append(job)
+                yield job
+
+        async with aclosing(runner.run(more_jobs())) as events:
+            async for _ in events:
+                break
+        await asyncio.sleep(0)
+        self.assertTrue(all(job._cancelled for job in submitted))
+
+    async def test_run_stream_of_jobs(self):
+        runner = SynthRunner(max_concurrency=2)
+        synths = [self.synth() for _ in range(3)]
+
+        async def jobs():
+            for synth in synths:
+                yield SynthJob(synth, "1")
+                await asyncio.sleep(0)
+
+        chunks = [
+            event[2]
+            async for _, event in runner.run(jobs())
+            if event[0] == "CHUNK" and event[2]
+        ]
+        self.assertEqual(chunks, ["hello"] * 3)
+        self.assertTrue(all(synth.current_state() == "select" for synth in synths))
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+from unittest.mock import patch
+
+from synth_machine.executor_factory import EXECUTORS, get_executor
+from synth_machine.machine_config import get_encoding
+from synth_machine.warmup import warmup
+
+# Generous, cold imports on CI machines vary a lot.
+STARTUP_BUDGET_SECONDS = 5.0
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import synth_machine
+imported = time.perf_counter()
+from synth_machine import Synth
+synth = Synth(config={
+    "initial_state": "start",
+    "states": [{"name": "start"}],
+    "transitions": [{"trigger": "go", "source": "start", "dest": "start"}],
+})
+created = time.perf_counter()
+from synth_machine.machine_config import get_encoding
+print(json.dumps({
+    "import": imported - start,
+    "synth": created - start,
+    "loaded": [m for m in ("magika", "anthropic", "openai", "together") if m in sys.modules],
+    "encodings": get_encoding.cache_info().currsize,
+}))
+"""
+
+
+class StartupTest(TestCase):
+    def test_startup_is_lazy(self):
+        env = os.environ | {
+            "ANTHROPIC_API_KEY": "test",
+            "OPENAI_API_KEY": "test",
+            "TOGETHER_API_KEY": "test",
+        }
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        startup = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertLess(startup["import"], STARTUP_BUDGET_SECONDS)
+        self.assertLess(startup["synth"], STARTUP_BUDGET_SECONDS)
+        self.assertEqual(startup["loaded"], [])
+        self.assertEqual(startup["encodings"], 0)
+
+    def test_executors_created_on_first_use(self):
+        EXECUTORS.pop("lorem", None)
+        executor = get_executor("lorem")
+        self.assertIs(EXECUTORS["lorem"], executor)
+        self.assertIs(get_executor("lorem"), executor)
+        with self.assertRaises(KeyError):
+            get_executor("unknown")
+
+    def test_warmup(self):
+        # Loading the real encoding may download it, only check it is loaded.
+        get_encoding.cache_clear()
+        self.addCleanup(get_encoding.cache_clear)
+        with patch("tiktoken.get_encoding") as load_encoding:
+            thread = warmup(executors=["lorem"])
+            thread.join(timeout=30)  # type: ignore
+        self.assertFalse(thread.is_alive())  # type: ignore
+        self.assertIn("lorem", EXECUTORS)
+        load_encoding.assert_called_once_with("cl100k_base")
+        self.assertEqual(get_encoding.cache_info().currsize, 1)
@@ -0,0 +1,80 @@
+import random
+from unittest import TestCase
+from transitions import Machine, MachineError
+
+from synth_machine.factory import SynthFactory
+from synth_machine.state_machine import CompactStateMachine, state_table
+from synth_machine.synth_definition import synth_definition_setup
+from tests.test_synth_machine import SynthMachineTest
+
+CONFIG = {
+    "initial_state": "a",
+    "states": [{"name": "a"}, {"name": "b"}, {"name": "c"}],
+    "transitions": [
+        {"trigger": "next", "source": "a", "dest": "b"},
+        {"trigger": "next", "source": "b", "dest": "c"},
+        {"trigger": "next", "source": "a", "dest": "c"},
+        {"trigger": "stay", "source": "b", "dest": "="},
+        {"trigger": "stay", "source": "*", "dest": "a"},
+        {"trigger": "reset", "source": "*", "dest": "a"},
+        {"trigger": "back", "source": "c", "dest": "b"},
+    ],
+}
+
+
+class Model:
+    pass
+
+
+class CompactStateMachineTest(TestCase):
+    def test_matches_transitions_machine(self):
+        definition = synth_definition_setup(CONFIG)
+        model = Model()
+        Machine(
+            auto_transitions=False,
+            initial="a",
+            model=model,
+            states=["a", "b", "c"],
+            transitions=[
+                {"trigger": t.trigger, "source": t.source, "dest": t.dest}
+                for t in definition.transitions
+            ],
+        )
+        compact = CompactStateMachine(state_table(definition), "a")
+        rng = random.Random(0)
+        for _ in range(500):
+            trigger = rng.choice(["next", "stay", "reset", "back", "unknown"])
+            results = []
+            for machine in (model, compact):
+                try:
+                    results.append(machine.trigger(trigger))  # type: ignore
+                except (AttributeError, MachineError) as e:
+                    results.append(type(e))
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(model.state, compact.state)  # type: ignore
+
+    def test_slots(self):
+        compact = CompactStateMachine(state_table(synth_definition_setup(CONFIG)), "a")
+        with self.assertRaises(AttributeError):
+            compact.other = 1  # type: ignore
+
+
+class CompactSynthTest(SynthMachineTest):
+    async def test_synth_with_compact_state_machine(self):
+        factory = SynthFactory(
+            config={
+                "initial_state": "theme",
+                "states": self.states,
+                "transitions": self.helper.get_transistions("append_transistions"),
+            },
+            compact_state_machine=True,
+        )
+        synth = factory.create(memory={"a": "a", "b": "b"})
+        self.assertIsNone(synth._machine)
+        self.assertEqual(
+            [t.trigger for t in synth.interfaces_for_available_triggers()], ["1"]
+        )
+        await synth.trigger("1")
+        await synth.trigger("2")
+        self.assertEqual(synth.current_state(), "dnd")
+        self.assertEqual(synth.memory["chat_history"], ["a", "a", "b"])
@@ -3,6 +3,7 @@ from tests.test_mocks import (
     MockExecutor,
     MockJsonParseFailureExecutor,
     MockJsonExecutor,
+    MockStreamingJsonExecutor,
 )
 from tests.test_helper import TestHelper
 from tests.test_utils import json_file_loader
@@ -88,3 +89,18 @@ class SynthMachineTest(IsolatedAsyncioTestCase):
             ),
             None,
         )
+
+    async def mock_streaming_json_prompt_setup(self, **kwargs):
+        return (
+            SynthConfig(
+                **{
+                    "executor": MockStreamingJsonExecutor(),
+                    "model_config": ModelConfig(
+                        executor="mock",
+                    ),
+                    "system_prompt": "",
+                    "user_prompt": "",
+                }
+            ),
+            None,
+        )
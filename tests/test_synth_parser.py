@@ -1,5 +1,7 @@
+import json
 from unittest import TestCase
-from synth_machine.synth_parser import SynthParser
+from partial_json_parser import loads, OBJ
+from synth_machine.synth_parser import SynthParser, StreamingJSONParser
 
 
 class TestSynthParse(TestCase):
@@ -70,6 +72,51 @@ class TestSynthParse(TestCase):
             "import abc",
         )
 
+    def test_streaming_json_parse(self):
+        parser = SynthParser()
+        expected = {
+            "title": 'An "escaped" \\ title',
+            "tags": ["a", "b"],
+            "score": -12.5e1,
+            "nested": {"flag": True, "none": None, "items": [{"x": 1}, []]},
+        }
+        raw = json.dumps(expected)
+
+        streaming = parser.streaming_parse["json"]()
+        for i in range(0, len(raw), 3):
+            streaming.feed(raw[i : i + 3])
+            self.assertEqual(streaming.value(), loads(raw[: i + 3], OBJ))
+        self.assertEqual(streaming.value(), expected)
+
+    def test_streaming_json_parse_partial(self):
+        streaming = StreamingJSONParser()
+        with self.assertRaises(ValueError):
+            streaming.value()
+
+        streaming.feed('{"done": "yes", "list": [1, 2')
+        self.assertEqual(streaming.value(), {"done": "yes"})
+        streaming.feed('], "inner": {"a": tr')
+        self.assertEqual(
+            streaming.value(), {"done": "yes", "list": [1, 2], "inner": {}}
+        )
+        streaming.feed("ue}}")
+        self.assertEqual(
+            streaming.value(), {"done": "yes", "list": [1, 2], "inner": {"a": True}}
+        )
+
+        streaming.feed(" trailing")
+        with self.assertRaises(ValueError):
+            streaming.value()
+
+    def test_streaming_json_parse_changes(self):
+        streaming = StreamingJSONParser()
+        streaming.feed('{"a": 1')
+        self.assertIsNone(streaming.drain_changes())
+        streaming.feed(', "more": [{"x": 1}')
+        self.assertEqual(streaming.drain_changes(), {"a"})
+        streaming.feed("]")
+        self.assertEqual(streaming.drain_changes(), {"more"})
+
 
 if __name__ == "__main__":
     import logging
@@ -0,0 +1,87 @@
+from dataclasses import FrozenInstanceError
+from unittest import TestCase
+
+from synth_machine.machine import Synth
+from synth_machine.operation_definitions import OperationPriority
+from synth_machine.synth_plan import synth_plan_setup
+
+STATES = [{"name": "theme"}, {"name": "select"}, {"name": "dnd"}]
+TRANSITIONS = [
+    {
+        "trigger": "1",
+        "source": "theme",
+        "dest": "select",
+        "model_config": {"temperature": 0.4, "max_tokens": 100},
+        "outputs": [
+            {
+                "key": "output",
+                "prompt": "{{ a }}",
+                "schema": {"type": "string"},
+                "model_config": {"temperature": 0.3},
+            },
+            {"key": "flat", "jq": ".output"},
+            {"key": "nothing"},
+        ],
+    },
+    {"trigger": "2", "source": "select", "dest": "dnd"},
+    {"trigger": "2", "source": "dnd", "dest": "theme"},
+    {"trigger": "restart", "source": "*", "dest": "theme"},
+]
+CONFIG = {
+    "initial_state": "theme",
+    "states": STATES,
+    "transitions": TRANSITIONS,
+    "default_model_config": {"executor": "lorem", "llm_name": "test_llm"},
+}
+
+
+class SynthPlanTest(TestCase):
+    def test_output_plans(self):
+        plan = synth_plan_setup(CONFIG)
+        transition_plan = plan.transition("1")
+        output, flat, nothing = transition_plan.outputs
+
+        self.assertEqual(output.operation, OperationPriority.PROMPT)
+        self.assertIsNone(flat.operation)
+        self.assertIsNone(nothing.operation)
+        self.assertEqual(output.model_config.executor, "lorem")
+        self.assertEqual(output.model_config.llm_name, "test_llm")
+        self.assertEqual(output.model_config.max_tokens, 100)
+        self.assertEqual(output.model_config.temperature, 0.3)
+        self.assertIs(plan.output(transition_plan.transition.outputs[0]), output)
+        self.assertEqual(
+            [task.key for task in transition_plan.post_processor], ["flat"]
+        )
+        self.assertEqual(
+            transition_plan.dependencies, (frozenset(), frozenset({0}), frozenset())
+        )
+
+    def test_indexes_match_machine(self):
+        synth = Synth(config=CONFIG)
+        self.assertEqual(synth.plan.transition("2").transition.source, "select")
+        self.assertEqual(synth.get_raw_state("dnd").name, "dnd")
+        for state in ["theme", "select", "dnd"]:
+            triggers = synth._machine.get_triggers(state)
+            self.assertEqual(
+                synth.interfaces_for_available_triggers(state),
+                [
+                    transition
+                    for transition in synth.config.transitions
+                    if transition.trigger in triggers
+                ],
+            )
+
+    def test_plan_is_immutable(self):
+        plan = synth_plan_setup(CONFIG)
+        with self.assertRaises(FrozenInstanceError):
+            plan.definition = None  # type: ignore
+        with self.assertRaises(TypeError):
+            plan.transitions["3"] = plan.transition("1")  # type: ignore
+
+    def test_post_processor_copies_are_independent(self):
+        post_processor = synth_plan_setup(CONFIG).transition("1").post_processor
+        first = post_processor.copy()
+        first.touch(["output"])
+        second = post_processor.copy()
+        self.assertEqual(next(iter(second)).changed, set())
+        self.assertEqual(next(iter(first)).changed, {"output"})
@@ -0,0 +1,66 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from synth_machine import templates
+from synth_machine.operator_setup import prompt_for_transition
+from synth_machine.synth_definition import synth_definition_setup
+
+
+class TemplateCacheTest(TestCase):
+    def tearDown(self):
+        templates.configure_templates()
+
+    def test_templates_are_cached_by_source(self):
+        templates.configure_templates(cache_size=2)
+        first = templates.get_prompt_template("{{ a }}")
+        self.assertIs(first, templates.get_prompt_template("{{ a }}"))
+        self.assertIsNot(first, templates.get_tool_template("{{ a }}"))
+
+        templates.get_prompt_template("{{ b }}")
+        templates.get_prompt_template("{{ c }}")
+        # Least recently used templates are evicted.
+        self.assertIsNot(first, templates.get_prompt_template("{{ a }}"))
+
+    def test_prompt_rendering_unchanged(self):
+        prompt, err = prompt_for_transition(
+            inputs={"items": [1, 2]},
+            prompt_template="""
+                {% for item in items %}
+                - {{ item }}
+                {% endfor %}
+            """,
+        )
+        self.assertIsNone(err)
+        self.assertEqual(prompt, "- 1\n- 2")
+        _, err = prompt_for_transition(inputs={}, prompt_template="{{ missing }}")
+        self.assertEqual(err, "'missing' is undefined")
+
+    def test_prewarm_and_bytecode_cache(self):
+        definition = synth_definition_setup(
+            {
+                "initial_state": "start",
+                "states": [{"name": "start"}],
+                "transitions": [
+                    {
+                        "trigger": "go",
+                        "source": "start",
+                        "dest": "start",
+                        "outputs": [
+                            {"key": "out", "jinja": "{{ a }}!"},
+                            {"key": "broken", "jinja": "{{ a "},
+                        ],
+                    }
+                ],
+            }
+        )
+        with TemporaryDirectory() as directory:
+            templates.configure_templates(bytecode_cache_dir=directory)
+            templates.prewarm_templates(definition)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+            # A fresh environment, as after a restart, loads the stored bytecode.
+            templates.configure_templates(bytecode_cache_dir=directory)
+            self.assertEqual(
+                templates.get_prompt_template("{{ a }}!").render(a=1), "1!"
+            )
@@ -0,0 +1,66 @@
+import io
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from synth_machine import tracing
+from synth_machine.tracing import (
+    LoggingSink,
+    StreamSink,
+    configure_tracing,
+    stream_trace,
+)
+
+
+class TracingTest(TestCase):
+    def setUp(self):
+        # Restore whatever tracing was configured before the test.
+        patcher = patch.multiple(tracing, _sink=tracing._sink, _sample=tracing._sample)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sampled_tokens(self):
+        output = io.StringIO()
+        configure_tracing(StreamSink(output), sample=2)
+        trace = stream_trace("mock")
+        for token in ["a", "b", "c", "d", "e"]:
+            trace.token(token)  # type: ignore
+        trace.end("stop")  # type: ignore
+        self.assertEqual(output.getvalue(), "ace\n")
+
+    def test_empty_tokens(self):
+        output = io.StringIO()
+        configure_tracing(StreamSink(output))
+        trace = stream_trace("mock")
+        for token in ["a", None, "b"]:
+            trace.token(token)  # type: ignore
+        self.assertEqual(output.getvalue(), "ab")
+
+    def test_default_sink(self):
+        with patch("synth_machine.tracing.DEBUG", True):
+            configure_tracing()
+        self.assertIsInstance(stream_trace("mock").sink, StreamSink)  # type: ignore
+        with patch("synth_machine.tracing.DEBUG", False):
+            configure_tracing()
+        self.assertIsNone(stream_trace("mock"))
+
+    def test_off(self):
+        configure_tracing(StreamSink(io.StringIO()), sample=0)
+        self.assertIsNone(stream_trace("mock"))
+        # Debug logs are off by default.
+        configure_tracing(LoggingSink())
+        self.assertIsNone(stream_trace("mock"))
+
+    def test_logging_sink(self):
+        configure_tracing(LoggingSink())
+        with self.assertLogs("synth_machine.trace", level=logging.DEBUG) as logs:
+            trace = stream_trace("mock")
+            trace.token("a")  # type: ignore
+            trace.end("stop")  # type: ignore
+        self.assertEqual(
+            logs.output,
+            [
+                "DEBUG:synth_machine.trace:mock token 0: 'a'",
+                "DEBUG:synth_machine.trace:mock stream ended (stop) after 1 tokens",
+            ],
+        )
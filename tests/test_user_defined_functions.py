@@ -0,0 +1,136 @@
+import asyncio
+import os
+import threading
+from unittest import IsolatedAsyncioTestCase
+
+from synth_machine.memory import MemoryStore
+from synth_machine.offload import configure_offload
+from synth_machine.user_defined_functions import run_udf, udf
+from tests.test_synth_machine import SynthMachineTest
+
+
+@udf(reads=["test_string"], executor="process")
+def process_id(memory):
+    return [memory["test_string"], sorted(memory), os.getpid()]
+
+
+class UDFTest(IsolatedAsyncioTestCase):
+    async def test_memoized_on_declared_keys(self):
+        calls = []
+
+        @udf(reads=["a"], cache_size=1)
+        def count(memory):
+            calls.append(1)
+            return [memory["a"]]
+
+        memory = MemoryStore({"a": 1, "b": 1})
+        self.assertEqual(await run_udf(count, memory), ([1], False))
+        memory["b"] = 2
+        result, cached = await run_udf(count, memory)
+        self.assertEqual((result, cached), ([1], True))
+        # Cached results are copies, changing one in memory leaves the cache.
+        result.append(2)
+        self.assertEqual(await run_udf(count, memory), ([1], True))
+
+        memory["a"] = 2
+        self.assertEqual(await run_udf(count, memory), ([2], False))
+        memory["a"] = 1
+        # Evicted, only one result is kept.
+        self.assertEqual(await run_udf(count, memory), ([1], False))
+        self.assertEqual(len(calls), 3)
+
+    async def test_async_udf(self):
+        @udf
+        async def wait(memory):
+            await asyncio.sleep(0)
+            return memory["a"]
+
+        self.assertEqual(await run_udf(wait, {"a": 1}), (1, False))
+
+    async def test_thread_udf(self):
+        @udf(executor="thread")
+        def thread_name(memory):
+            memory["changed"] = True
+            return threading.current_thread().name
+
+        memory = MemoryStore({})
+        result, _ = await run_udf(thread_name, memory)
+        self.assertTrue(result.startswith("synth-offload"))
+        self.assertTrue(memory["changed"])
+
+    async def test_process_udf(self):
+        offloader = configure_offload(None)
+        self.addCleanup(configure_offload, None)
+        result, _ = await run_udf(process_id, {"test_string": "a", "other": 1})
+        self.assertEqual(result[:2], ["a", ["test_string"]])
+        self.assertNotEqual(result[2], os.getpid())
+        self.assertEqual(offloader.metrics()["udf"]["offloaded"], 1)
+
+    def test_invalid_options(self):
+        def local(memory):
+            pass
+
+        with self.assertRaises(ValueError):
+            udf(executor="process")(local)
+        with self.assertRaises(ValueError):
+            udf(executor="gpu")(local)
+
+
+class UDFSynthTest(SynthMachineTest):
+    async def test_udf_timing_event(self):
+        @udf(reads=["test_string"])
+        async def duplicate_string(memory):
+            return memory["test_string"] * 2
+
+        udf_transitions = self.helper.get_transistions("udf_transitions")
+        synth = self.helper.create_synth_machine(
+            initial_state=self.states[0]["name"],
+            states=self.states,
+            transitions=udf_transitions,
+            memory=self.FAKE_MEMORY,
+        )
+        synth.user_defined_functions = {"duplicate_string": duplicate_string}
+        timings = [
+            event
+            async for event in synth.streaming_trigger(
+                "1", params={"test_string": "hello"}
+            )
+            if event[0] == "UDF_TIMING"
+        ]
+        self.assertEqual(synth.memory["duplicate"], "hellohello")
+        self.assertEqual(timings[0][1], "duplicate")
+        self.assertEqual(timings[0][2]["udf"], "duplicate_string")
+        self.assertFalse(timings[0][2]["cached"])
+        self.assertGreaterEqual(timings[0][2]["seconds"], 0)
+
+    async def test_in_place_changes_keep_sent_events(self):
+        @udf(executor="thread")
+        def add_to_history(memory):
+            memory["hist"].append("udf-added")
+            return len(memory["hist"])
+
+        synth = self.helper.create_synth_machine(
+            initial_state="theme",
+            states=self.states,
+            transitions=[
+                {
+                    "trigger": "1",
+                    "source": "theme",
+                    "dest": "select",
+                    "outputs": [
+                        {"key": "hist", "append": ["a"]},
+                        {"key": "length", "udf": "add_to_history"},
+                    ],
+                }
+            ],
+            memory={"a": "hello"},
+        )
+        synth.user_defined_functions = {"add_to_history": add_to_history}
+        set_memory = [
+            event
+            async for event in synth.streaming_trigger("1")
+            if event[0] == "SET_MEMORY" and event[1] == "hist"
+        ]
+        self.assertEqual(set_memory[-1][2], ["hello"])
+        self.assertEqual(synth.memory["hist"], ["hello", "udf-added"])
+        self.assertEqual(synth.memory["length"], 2)
@@ -0,0 +1,49 @@
+from importlib.util import find_spec
+from unittest import TestCase, skipUnless
+from jsonschema.exceptions import SchemaError, ValidationError  # type: ignore
+
+from synth_machine.validation import SchemaValidator, schema_validator
+
+SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"name": {"type": "string"}},
+        "required": ["name"],
+    },
+}
+
+
+class SchemaValidatorTest(TestCase):
+    def test_validators_are_shared(self):
+        validator = schema_validator(SCHEMA)
+        self.assertIs(validator, schema_validator(dict(reversed(SCHEMA.items()))))
+        self.assertIsNot(validator, schema_validator(SCHEMA, "fastjsonschema"))
+
+    def test_jsonschema_backend(self):
+        self.assert_validates(SchemaValidator(SCHEMA, "jsonschema"))
+
+    @skipUnless(find_spec("fastjsonschema"), "fastjsonschema not installed")
+    def test_fastjsonschema_backend(self):
+        self.assert_validates(SchemaValidator(SCHEMA, "fastjsonschema"))
+
+    def assert_validates(self, validator: SchemaValidator):
+        validator.validate([{"name": "a"}] * 500)
+        with self.assertRaises(ValidationError):
+            validator.validate([{"name": "a"}, {"name": 1}])
+        with self.assertRaises(ValidationError):
+            validator.validate([{}])
+
+    @skipUnless(find_spec("fastjsonschema"), "fastjsonschema not installed")
+    def test_fastjsonschema_leaves_instance_unchanged(self):
+        validator = SchemaValidator(
+            {"type": "object", "properties": {"a": {"default": 1}}}, "fastjsonschema"
+        )
+        instance: dict = {}
+        validator.validate(instance)
+        self.assertEqual(instance, {})
+
+    def test_invalid_schema_raises_on_use(self):
+        validator = SchemaValidator({"type": "not a type"})
+        with self.assertRaises(SchemaError):
+            validator.validate({})